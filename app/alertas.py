@@ -0,0 +1,39 @@
+# alertas.py
+# Lectura de las alertas de stock bajo. Las filas de alertas_stock las
+# mantienen los triggers definidos en conexion.migrar_esquema, así que leer
+# el contador o una página de alertas no recorre la tabla de productos.
+import repositorio
+
+POR_PAGINA = 20
+
+# Recalcular todas las alertas: resolver, actualizar las activas y abrir las nuevas
+RECALCULAR = ("alertas_recalcular_resueltas", "alertas_recalcular_activas", "alertas_recalcular_nuevas")
+
+
+def contar(conn, vendedor_id=None):
+    """Cantidad de alertas activas (para el badge del menú)."""
+    if vendedor_id is None:
+        return repositorio.valor(conn, "alertas_contar")
+    return repositorio.valor(conn, "alertas_contar_de_vendedor", (vendedor_id,))
+
+
+def listar(conn, vendedor_id=None, pagina=1, por_pagina=POR_PAGINA):
+    """Página de alertas activas, las más recientes primero."""
+    pagina = max(int(pagina), 1)
+    por_pagina = min(max(int(por_pagina), 1), 100)
+    pagina_sql = (por_pagina, (pagina - 1) * por_pagina)
+    if vendedor_id is None:
+        return repositorio.todos(conn, "alertas_pagina", pagina_sql)
+    return repositorio.todos(conn, "alertas_pagina_de_vendedor", (vendedor_id,) + pagina_sql)
+
+
+def umbral_global(conn):
+    limite = repositorio.valor(conn, "umbral_global")
+    return limite if limite is not None else 10
+
+
+def cambiar_umbral_global(conn, limite):
+    """Actualiza config_empresa.limite_stock_alerta y recalcula todas las alertas (no hace commit)."""
+    repositorio.ejecutar(conn, "cambiar_umbral_global", (int(limite),))
+    for nombre in RECALCULAR:
+        repositorio.ejecutar(conn, nombre)
@@ -0,0 +1,83 @@
+# analitica.py
+# Copia de solo lectura de inventario.db para reportes del dueño.
+# Una tarea periódica la rehace con la API de backup online de SQLite y la
+# reemplaza de forma atómica; el panel, los reportes y las exportaciones
+# leen de la copia, así sus agregaciones largas no compiten con los
+# commits de procesar_pago. Con la base en WAL (ver conexion.migrar_esquema)
+# el backup tampoco bloquea a los escritores. Cada tienda (tiendas.py) tiene
+# su copia; sin `destino` se usa la de la tienda en curso.
+import os
+import sqlite3
+import time
+
+import tiendas
+
+INTERVALO = 300
+
+
+def _copia(destino):
+    return destino or tiendas.ruta("analitica.db")
+
+
+def actualizar(db_path, destino=None, si_mas_vieja_que=0):
+    """Rehace la copia. Con `si_mas_vieja_que` (segundos) no hace nada si la actual es más nueva
+    (así varios workers con la misma tarea no copian la base una vez cada uno).
+    Devuelve la duración en ms, o None si no hizo falta."""
+    destino = _copia(destino)
+    if si_mas_vieja_que and (antiguedad(destino) or float("inf")) < si_mas_vieja_que: return None
+    inicio = time.perf_counter()
+    tmp = f"{destino}.{os.getpid()}.tmp"
+    origen = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    copia = sqlite3.connect(tmp)
+    try:
+        origen.backup(copia)
+        copia.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        copia.close()
+        origen.close()
+    # Las conexiones ya abiertas siguen leyendo la copia anterior hasta cerrarse
+    os.replace(tmp, destino)
+    return (time.perf_counter() - inicio) * 1000
+
+
+def antiguedad(destino=None):
+    """Segundos desde la última copia, o None si todavía no hay."""
+    destino = _copia(destino)
+    try: return time.time() - os.path.getmtime(destino)
+    except OSError: return None
+
+
+def version(destino=None):
+    """Identifica la copia actual (mtime en ns); cambia con cada copia nueva, la haga el worker que la haga.
+    None si todavía no hay copia."""
+    destino = _copia(destino)
+    try: return os.stat(destino).st_mtime_ns
+    except OSError: return None
+
+
+def frescura(destino=None):
+    """Para el panel: {"segundos": ..., "tomada_en": "HH:MM:SS", "version": ...} o None si se lee la base principal.
+    `version` es la de version() (clave de los fragmentos cacheados del panel)."""
+    destino = _copia(destino)
+    segundos = antiguedad(destino)
+    if segundos is None: return None
+    try: version = os.stat(destino).st_mtime_ns
+    except OSError: return None
+    return {"segundos": int(segundos), "tomada_en": time.strftime("%H:%M:%S", time.localtime(version / 1e9)), "version": version}
+
+
+def ruta_lectura(db_path, destino=None):
+    """La copia si existe; si no (primer arranque) la base principal."""
+    destino = _copia(destino)
+    return destino if os.path.exists(destino) else db_path
+
+
+def conectar_lectura(db_path, destino=None):
+    """Conexión de solo lectura para reportes."""
+    conn = sqlite3.connect(f"file:{ruta_lectura(db_path, destino)}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+if __name__ == "__main__":
+    print(f"📊 Copia de analítica generada en {actualizar(tiendas.ruta()):.1f} ms -> {_copia(None)}")
@@ -0,0 +1,322 @@
+# api_async.py
+# Capa ASGI para las APIs JSON cortas del carrito y el stock.
+# Bajo WSGI cada /api/carrito/* o /api/stock/<id> ocupa un hilo del worker
+# entero mientras espera a SQLite. Acá esos endpoints son corrutinas: la
+# espera no ocupa hilo, y el trabajo con la base corre en un pool chico de
+# hilos propio (BaseAsync, HILOS_DB hilos); las escrituras del carrito van
+# al escritor del proceso (escritor.py). Así un proceso sostiene miles de
+# requests de carrito en vuelo con unos pocos hilos.
+#
+# El resto de las rutas sigue en Flask: lo que no es de esta capa pasa a
+# la app WSGI (PuenteWSGI) en otro pool de hilos. La sesión y el CSRF
+# (header X-CSRFToken) pasan por las mismas piezas de Flask y Flask-WTF que
+# usa la app (Sesiones). La lógica del carrito es la de carritos.py, la
+# misma que usan las rutas WSGI.
+#
+# La tienda (tiendas.py) se resuelve igual que en Flask, por host o por el
+# prefijo /t/<clave>, y queda en curso durante todo el pedido: la base, el
+# escritor y la cookie de sesión son los de esa tienda.
+#
+# Producción:  uvicorn asgi:app --workers 4     (ver asgi.py)
+import asyncio
+import contextvars
+import io
+import json
+import logging
+import re
+import secrets
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from flask_wtf.csrf import CSRFError
+
+import carritos
+import escritor
+import repositorio
+import tiendas
+
+HILOS_DB = 8
+HILOS_WSGI = 32
+ENCABEZADOS_SEGURIDAD = [(b"x-content-type-options", b"nosniff"), (b"x-frame-options", b"SAMEORIGIN")]
+
+log = logging.getLogger("verduleria.api_async")
+
+
+class BaseAsync:
+    """SQLite para corrutinas: cada llamada corre en un hilo del pool con la conexión
+    de repositorio.conectar() de ese hilo, y hace commit al terminar. Sin `db_path`
+    usa la base de la tienda en curso."""
+
+    def __init__(self, db_path=None, hilos=HILOS_DB):
+        self.db_path = db_path
+        self._pool = ThreadPoolExecutor(hilos, thread_name_prefix="sqlite-async")
+
+    def _ruta(self):
+        return self.db_path or tiendas.ruta()
+
+    def _correr(self, db_path, funcion, args):
+        conn = repositorio.conectar(db_path)
+        try:
+            resultado = funcion(conn, *args)
+            conn.commit()
+            return resultado
+        finally:
+            conn.close()
+
+    async def ejecutar(self, funcion, *args):
+        """await funcion(conn, *args) en el pool."""
+        return await asyncio.get_running_loop().run_in_executor(self._pool, self._correr, self._ruta(), funcion, args)
+
+    async def escribir(self, funcion, *args):
+        """await funcion(conn, *args) en el escritor del proceso (ver escritor.py), sin ocupar un hilo del pool.
+        Con la cola llena no espera: lanza escritor.ColaLlena."""
+        return await asyncio.wrap_future(escritor.enviar(self._ruta(), funcion, *args, espera=0))
+
+    async def en_hilo(self, funcion, *args):
+        """Para llamadas bloqueantes que no usan la conexión (p. ej. el user_loader cacheado).
+        Corre con el contexto de la corrutina (la tienda en curso)."""
+        return await asyncio.get_running_loop().run_in_executor(self._pool, contextvars.copy_context().run, funcion, *args)
+
+
+class Sesiones:
+    """Sesión y CSRF con las mismas piezas que Flask: app.session_interface abre y guarda la
+    cookie, y CSRFProtect.protect() de Flask-WTF valida el token, dentro de un contexto de
+    request armado con el scope ASGI."""
+
+    def __init__(self, app):
+        self.app = app
+        self.csrf = app.extensions.get("csrf")
+
+    def abrir(self, environ):
+        """(sesión, motivo del rechazo CSRF o None). No hace IO: corre en el loop sin bloquearlo."""
+        ctx = self.app.request_context(environ)
+        ctx.push()  # abre la sesión con app.session_interface
+        try:
+            error = None
+            if self.csrf is not None and self.app.config.get("WTF_CSRF_ENABLED", True):
+                try: self.csrf.protect()
+                except CSRFError as e: error = e.description
+            return ctx.session, error
+        finally:
+            ctx.pop()
+
+    def encabezados(self, sesion):
+        """Set-Cookie y Vary que agrega app.session_interface.save_session para esta sesión."""
+        respuesta = self.app.response_class()
+        self.app.session_interface.save_session(self.app, sesion, respuesta)
+        return [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in respuesta.headers
+                if k in ("Set-Cookie", "Vary")]
+
+
+class Pedido:
+    def __init__(self, scope, cuerpo, sesion, params):
+        self.scope = scope
+        self.cuerpo = cuerpo
+        self.sesion = sesion
+        self.params = params
+
+    def json(self):
+        return json.loads(self.cuerpo or b"null") or {}
+
+
+async def _leer_cuerpo(receive):
+    partes = []
+    while True:
+        mensaje = await receive()
+        if mensaje["type"] == "http.disconnect": break
+        partes.append(mensaje.get("body", b""))
+        if not mensaje.get("more_body"): break
+    return b"".join(partes)
+
+
+def _encabezados(scope):
+    encabezados = {}
+    for nombre, valor in scope["headers"]:
+        nombre, valor = nombre.decode("latin-1").lower(), valor.decode("latin-1")
+        if nombre in encabezados: encabezados[nombre] += ("; " if nombre == "cookie" else ", ") + valor
+        else: encabezados[nombre] = valor
+    return encabezados
+
+
+def _environ(scope, cuerpo):
+    """environ WSGI equivalente al scope ASGI (para la app Flask y sus contextos de request)."""
+    servidor = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"], "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": servidor[0], "SERVER_PORT": str(servidor[1]),
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0), "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(cuerpo), "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True, "wsgi.multiprocess": True, "wsgi.run_once": False,
+    }
+    for nombre, valor in _encabezados(scope).items():
+        clave = nombre.upper().replace("-", "_")
+        if clave not in ("CONTENT_TYPE", "CONTENT_LENGTH"): clave = "HTTP_" + clave
+        environ[clave] = valor
+    return environ
+
+
+class PuenteWSGI:
+    """Atiende con la app Flask (WSGI) lo que no es de la capa async, en un pool de hilos.
+    El cuerpo de la respuesta se pasa por una cola acotada, así las descargas grandes
+    (exportaciones en streaming) no se juntan enteras en memoria."""
+
+    def __init__(self, wsgi, hilos=HILOS_WSGI):
+        self.wsgi = wsgi
+        self._pool = ThreadPoolExecutor(hilos, thread_name_prefix="wsgi")
+
+    def _correr(self, environ, poner):
+        def start_response(status, headers, exc_info=None):
+            poner(("inicio", int(status.split(" ", 1)[0]),
+                   [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]))
+            return lambda dato: poner(("cuerpo", dato))
+        try:
+            resultado = self.wsgi(environ, start_response)
+            try:
+                for trozo in resultado:
+                    if trozo: poner(("cuerpo", trozo))
+            finally:
+                if hasattr(resultado, "close"): resultado.close()
+        except Exception as e:
+            log.exception("Error atendiendo %s con la app WSGI", environ.get("PATH_INFO"))
+            poner(("error", e))
+        finally:
+            poner(("fin", None))
+
+    async def __call__(self, scope, receive, send):
+        environ = _environ(scope, await _leer_cuerpo(receive))
+        loop = asyncio.get_running_loop()
+        cola = asyncio.Queue(maxsize=8)
+        poner = lambda item: asyncio.run_coroutine_threadsafe(cola.put(item), loop).result()
+        tarea = loop.run_in_executor(self._pool, self._correr, environ, poner)
+        iniciado = False
+        try:
+            while True:
+                tipo, dato, *resto = await cola.get()
+                if tipo == "inicio":
+                    await send({"type": "http.response.start", "status": dato, "headers": resto[0]})
+                    iniciado = True
+                elif tipo == "cuerpo":
+                    await send({"type": "http.response.body", "body": dato, "more_body": True})
+                elif tipo == "error" and not iniciado:
+                    await send({"type": "http.response.start", "status": 500, "headers": [(b"content-type", b"text/plain")]})
+                    iniciado = True
+                elif tipo == "fin":
+                    break
+        except BaseException:
+            # El cliente se fue: seguir vaciando la cola para que el hilo no quede trabado en put()
+            loop.create_task(self._descartar(cola))
+            raise
+        await tarea
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _descartar(self, cola):
+        while (await cola.get())[0] != "fin": pass
+
+
+class CapaAsync:
+    """App ASGI: los endpoints de RUTAS se atienden acá, todo lo demás va a Flask."""
+
+    RUTAS = [
+        ("GET", re.compile(r"^/api/carrito$"), "obtener_carrito"),
+        ("POST", re.compile(r"^/api/carrito/agregar$"), "agregar"),
+        ("POST", re.compile(r"^/api/carrito/actualizar$"), "actualizar"),
+        ("DELETE", re.compile(r"^/api/carrito/eliminar/(\d+)$"), "eliminar"),
+        ("POST", re.compile(r"^/api/carrito/limpiar$"), "limpiar"),
+        ("GET", re.compile(r"^/api/stock/(\d+)$"), "stock"),
+    ]
+
+    def __init__(self, app, db_path=None, cargar_usuario=None):
+        self.app = app
+        self.db = BaseAsync(db_path)
+        self.sesiones = Sesiones(app)
+        self.cargar_usuario = cargar_usuario
+        self.puente = PuenteWSGI(app.wsgi_app if hasattr(app, "wsgi_app") else app)
+
+    def _buscar(self, metodo, ruta):
+        for m, patron, nombre in self.RUTAS:
+            encontrada = patron.match(ruta)
+            if encontrada and m == metodo: return getattr(self, nombre), encontrada.groups()
+        return None, None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan": return await self._lifespan(receive, send)
+        if scope["type"] != "http": return
+        encabezados = _encabezados(scope)
+        tienda, prefijo = tiendas.resolver(encabezados.get("host", ""), scope["path"])
+        manejador, params = self._buscar(scope["method"], scope["path"][len(prefijo):]) if tienda else (None, None)
+        # Lo demás (y una tienda inexistente, que responde 404) lo atiende Flask con su Enrutador
+        if manejador is None: return await self.puente(scope, receive, send)
+        with tiendas.usar(tienda):
+            await self._atender(scope, receive, send, encabezados, manejador, params)
+
+    async def _atender(self, scope, receive, send, encabezados, manejador, params):
+        cuerpo = await _leer_cuerpo(receive)
+        sesion, error_csrf = self.sesiones.abrir(_environ(scope, cuerpo))
+        if error_csrf:
+            respuesta, status = {"success": False, "error": error_csrf}, 400
+        else:
+            try: respuesta, status = await manejador(Pedido(scope, cuerpo, sesion, params))
+            except escritor.ColaLlena: respuesta, status = {"success": False, "error": "Servidor ocupado, intenta de nuevo en unos segundos"}, 503
+            except Exception as e: respuesta, status = {"success": False, "error": str(e)}, 500
+        await self._responder(send, respuesta, status, self.sesiones.encabezados(sesion))
+
+    async def _responder(self, send, cuerpo, status, extra):
+        datos = json.dumps(cuerpo, sort_keys=True, separators=(",", ":")).encode()
+        encabezados = [(b"content-type", b"application/json"), (b"content-length", str(len(datos)).encode()),
+                       *ENCABEZADOS_SEGURIDAD, *extra]
+        await send({"type": "http.response.start", "status": status, "headers": encabezados})
+        await send({"type": "http.response.body", "body": datos})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] == "lifespan.startup": await send({"type": "lifespan.startup.complete"})
+            elif mensaje["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # --- Endpoints (mismas respuestas que las rutas WSGI de app.py) ---
+
+    async def _operar(self, pedido, operacion, *args, crear_reserva=False):
+        sesion = pedido.sesion
+        if crear_reserva and "reserva" not in sesion: sesion["reserva"] = secrets.token_urlsafe(16)
+        carrito = sesion.get("carrito", {})
+        cuerpo, status = await self.db.escribir(operacion, carrito, sesion.get("reserva"), *args)
+        if status == 200: sesion["carrito"] = carrito
+        return cuerpo, status
+
+    async def obtener_carrito(self, pedido):
+        usuario = None
+        user_id = pedido.sesion.get("_user_id")
+        if user_id and self.cargar_usuario:
+            encontrado = await self.db.en_hilo(self.cargar_usuario, user_id)
+            usuario = encontrado.username if encontrado else None
+        return carritos.resumen(pedido.sesion.get("carrito", {}), usuario), 200
+
+    async def agregar(self, pedido):
+        datos = pedido.json()
+        return await self._operar(pedido, carritos.agregar, datos.get("producto_id"), int(datos.get("cantidad", 1)),
+                                  crear_reserva=True)
+
+    async def actualizar(self, pedido):
+        datos = pedido.json()
+        return await self._operar(pedido, carritos.actualizar, datos.get("producto_id"), int(datos.get("cantidad", 1)),
+                                  crear_reserva=True)
+
+    async def eliminar(self, pedido):
+        return await self._operar(pedido, carritos.eliminar, int(pedido.params[0]))
+
+    async def limpiar(self, pedido):
+        return await self._operar(pedido, carritos.limpiar)
+
+    async def stock(self, pedido):
+        return {"stock": await self.db.ejecutar(carritos.stock, pedido.sesion.get("reserva"), int(pedido.params[0]))}, 200
+
+
+def montar(app, db_path=None, cargar_usuario=None):
+    """App ASGI con la capa async delante de `app` (Flask). Sin `db_path`, cada pedido usa la base de su tienda."""
+    return CapaAsync(app, db_path, cargar_usuario)
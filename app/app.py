@@ -1,36 +1,69 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory, send_file, Response, stream_with_context
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_wtf.csrf import CSRFProtect
-from werkzeug.security import generate_password_hash, check_password_hash
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 from dotenv import load_dotenv
 import os
 import sqlite3
-import random
 import time
-import json
 from datetime import datetime, timedelta
 from functools import wraps 
 from flask import abort 
 from io import BytesIO
-from xhtml2pdf import pisa
+import archivo
+import cache
+import escritor
+import precalentar
+import exportar
+import fragmentos
+import reportes
+import tablero
+import alertas
+import analitica
+import auditoria
+import imagenes
+import movimientos
+import perfilador
+import pronostico
+import subsistemas
+import limitador
+import cancelaciones
+import carritos
+import reservas
+import repositorio
+import tareas
+import tiendas
+import contrasenas
+import secrets
+import re
+
+_INICIO_ARRANQUE = time.perf_counter()
 
 # ========================================================
 # CONFIGURACIÓN INICIAL
 # ========================================================
 load_dotenv()
 app = Flask(__name__)
+precalentar.configurar_bytecode(app)
 app.secret_key = os.getenv("SECRET_KEY", "CLAVE_MAESTRA_HIPER_SECRETA_UTN_2025_FINAL")
 app.config['WTF_CSRF_ENABLED'] = True
 app.config['SECRET_KEY'] = "CSRF_KEY_SEGURA_Y_FUERTE"
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=60)
+# Varias tiendas, cada una con su base: se elige por host o por prefijo /t/<clave> (ver tiendas.py)
+app.wsgi_app = tiendas.Enrutador(app.wsgi_app)
+app.session_interface = tiendas.SesionPorTienda()
 
 csrf = CSRFProtect(app)
+app.jinja_env.add_extension(fragmentos.FragmentoCache)
 login_manager = LoginManager(app)
 login_manager.login_view = "login"
 login_manager.login_message = "⚠️ Debes iniciar sesión para ver esta página."
 login_manager.login_message_category = "warning"
 
-DB_PATH = "inventario.db"
+# Intentos de login: 20 por IP (1 cada 3 s) y 5 por usuario (1 cada 30 s)
+limitador_login = limitador.Limitador(limitador.crear_store(), {"ip": (20, 1 / 3), "usuario": (5, 1 / 30)})
+
+DB_PATH = "inventario.db"  # la de la tienda principal; las rutas usan tiendas.ruta()
 
 # ========================================================
 #  UTILIDADES Y HELPERS
@@ -45,6 +78,14 @@ def is_development():
         return True
     except: return False
 
+@app.errorhandler(escritor.ColaLlena)
+def escritura_saturada(e):
+    # Contrapresión: la cola del escritor está llena, mejor un 503 ya que un request colgado
+    if request.path.startswith("/api/"):
+        return jsonify({'success': False, 'error': 'Servidor ocupado, intenta de nuevo en unos segundos'}), 503, {"Retry-After": "2"}
+    flash("⏳ Servidor ocupado, intenta de nuevo en unos segundos.", "warning")
+    return redirect(request.referrer or url_for("index"))
+
 @app.after_request
 def set_security_headers(response):
     response.headers['X-Content-Type-Options'] = 'nosniff'
@@ -52,17 +93,40 @@ def set_security_headers(response):
     return response
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Conexión reutilizada del hilo (ver repositorio.py) a la base de la tienda; close() la devuelve al pool
+    return repositorio.conectar(tiendas.ruta())
+
+def escribir(trabajo, *args):
+    """Corre trabajo(conn, *args) en el escritor de la base (ver escritor.py) y devuelve su resultado.
+    Las excepciones de la unidad se relanzan acá; con la cola llena lanza escritor.ColaLlena."""
+    return escritor.ejecutar(tiendas.ruta(), trabajo, *args)
 
 def obtener_stock_actual(producto_id):
-    conn = get_db_connection()
+    """Stock que puede llevar el carrito actual: el físico menos lo reservado por otros carritos."""
     try: pid = int(producto_id)
     except: return 0
-    prod = conn.execute("SELECT stock FROM productos WHERE id=? AND activo=1", (pid,)).fetchone()
-    conn.close()
-    return prod["stock"] if prod else 0
+    conn = get_db_connection()
+    try: return reservas.disponible(conn, pid, session.get("reserva", ""))
+    finally: conn.close()
+
+def sesion_reserva():
+    """Clave del carrito actual en la tabla reservas (se crea al primer uso)."""
+    if "reserva" not in session: session["reserva"] = secrets.token_urlsafe(16)
+    return session["reserva"]
+
+def reservar_en_carrito(producto_id, cantidad):
+    """Aparta `cantidad` unidades (total, no incremento) para el carrito actual. False si no alcanza."""
+    return escribir(reservas.reservar, sesion_reserva(), int(producto_id), cantidad)
+
+def liberar_carrito(producto_id=None):
+    if "reserva" not in session: return
+    escribir(reservas.liberar, session["reserva"], producto_id)
+
+CONSULTA_LENTA_MS = 200
+
+@repositorio.al_medir
+def _avisar_consulta_lenta(nombre, ms, filas):
+    if ms > CONSULTA_LENTA_MS: app.logger.warning("🐢 Consulta lenta %s: %.1f ms (%d filas)", nombre, ms, filas)
 
 # ========================================================
 #  MODELO DE USUARIO
@@ -74,13 +138,24 @@ class Usuario(UserMixin):
         self.username = username
         self.rol = rol
 
+def _cargar_usuario(user_id):
+    conn = get_db_connection()
+    u = repositorio.uno(conn, "usuario_por_id", (user_id,))
+    conn.close()
+    if u: return Usuario(u.id, u.username, u.rol_nombre)
+    return None
+
 @login_manager.user_loader
 def load_user(user_id):
+    # Se consulta en cada request con sesión: lo cacheamos unos minutos
+    return cache.obtener_o_calcular("usuarios", str(user_id), lambda: _cargar_usuario(user_id), ttl=300)
+
+def primar_usuarios():
+    """Carga en cache a dueños y vendedores (los usuarios con más requests)."""
     conn = get_db_connection()
-    u = conn.execute("SELECT u.*, r.nombre as rol_nombre FROM usuarios u JOIN roles r ON u.rol_id = r.id WHERE u.id=?", (user_id,)).fetchone()
+    ids = [f.id for f in repositorio.todos(conn, "ids_personal")]
     conn.close()
-    if u: return Usuario(u["id"], u["username"], u["rol_nombre"])
-    return None
+    for user_id in ids: load_user(user_id)
 
 def rol_requerido(roles_permitidos):
     if not isinstance(roles_permitidos, list): roles_permitidos = [roles_permitidos]
@@ -95,9 +170,12 @@ def rol_requerido(roles_permitidos):
         return decorated_function
     return decorator
 
+def imagen_srcset(hash_img, ext="webp"):
+    return ", ".join(f"{url_for('imagen_producto', hash_img=hash_img, ancho=a, ext=ext)} {a}w" for a in imagenes.ANCHOS)
+
 @app.context_processor
 def inject_helpers():
-    return dict(obtener_stock_actual=obtener_stock_actual, is_development=is_development)
+    return dict(obtener_stock_actual=obtener_stock_actual, is_development=is_development, imagen_srcset=imagen_srcset)
 
 # ========================================================
 #  RUTAS DE AUTENTICACIÓN
@@ -109,12 +187,26 @@ def login():
     if request.method == "POST":
         username = request.form["username"]
         password = request.form["password"]
+        espera = limitador_login.permitir(ip=request.remote_addr or "?", usuario=tiendas.con_prefijo(username.strip().lower()))
+        if espera:
+            flash(f"⏳ Demasiados intentos. Prueba de nuevo en {int(espera) + 1} segundos.", "danger")
+            return render_template("login.html"), 429
         conn = get_db_connection()
-        user_data = conn.execute("SELECT u.*, r.nombre as rol_nombre FROM usuarios u JOIN roles r ON u.rol_id = r.id WHERE u.username=?", (username,)).fetchone()
+        user_data = repositorio.uno(conn, "usuario_para_login", (username,))
         conn.close()
-        
-        if user_data and check_password_hash(user_data["password"], password):
-            user_obj = Usuario(user_data["id"], user_data["username"], user_data["rol_nombre"])
+
+        try:
+            valida = contrasenas.verificar(user_data.password if user_data else None, password)
+        except contrasenas.Saturado:
+            flash("⏳ Servidor ocupado, intenta de nuevo en unos segundos.", "warning")
+            return render_template("login.html"), 503
+
+        if valida:
+            if contrasenas.necesita_rehash(user_data.password):
+                # Los parámetros del hash cambiaron: aprovechamos que tenemos la contraseña en claro
+                try: escribir(repositorio.ejecutar, "actualizar_password", (contrasenas.generar(password), user_data.id))
+                except (contrasenas.Saturado, escritor.ColaLlena): pass
+            user_obj = Usuario(user_data.id, user_data.username, user_data.rol_nombre)
             login_user(user_obj)
             flash(f"👋 Bienvenido de nuevo, {user_obj.username}", "success")
             if user_obj.rol == "dueno": return redirect(url_for("panel_dueno"))
@@ -135,13 +227,32 @@ def logout():
 #  RUTAS PÚBLICAS Y API STOCK
 # ========================================================
 
+def cargar_catalogo():
+    def cargar():
+        conn = get_db_connection()
+        productos = repositorio.todos(conn, "catalogo")
+        conn.close()
+        return productos
+    return cache.obtener_o_calcular("catalogo", "index", cargar, ttl=30)
+
 @app.route("/")
 def index():
+    # El catálogo va cacheado; las reservas cambian con cada carrito y se restan aparte
     conn = get_db_connection()
-    # AGREGAMOS: AND stock > 0
-    productos = conn.execute("SELECT * FROM productos WHERE activo=1 AND stock > 0 ORDER BY nombre ASC").fetchall()
-    conn.close()
-    return render_template("index.html", productos=productos)
+    try: reservado = reservas.reservado_por_producto(conn)
+    finally: conn.close()
+    return render_template("index.html", productos=cargar_catalogo(), reservado=reservado)
+
+@app.route("/img/<hash_img>/<int:ancho>.<ext>")
+def imagen_producto(hash_img, ancho, ext):
+    if not re.fullmatch(r"[0-9a-f]{32}", hash_img) or ancho not in imagenes.ANCHOS or ext not in imagenes.FORMATOS:
+        return abort(404)
+    path, mimetype = imagenes.archivo(hash_img, ancho, ext)
+    if not path: return abort(404)
+    # El contenido de una URL nunca cambia (va por hash), se puede cachear para siempre
+    resp = send_file(path, mimetype=mimetype, max_age=31536000, conditional=True, etag=f"{hash_img}-{ancho}-{ext}")
+    resp.headers["Cache-Control"] = imagenes.CACHE_HTTP
+    return resp
 
 @app.route("/api/stock/<int:producto_id>")
 def api_stock(producto_id):
@@ -152,13 +263,38 @@ def api_stock(producto_id):
 @rol_requerido("vendedor")
 def sugerir_producto():
     try:
-        from api_helper import buscar_producto_openfoodfacts
         query = request.args.get('q', '').strip()
         if len(query) < 3: return jsonify([])
-        resultados = buscar_producto_openfoodfacts(query)
+        resultados = subsistemas.api_productos().buscar_producto_openfoodfacts(query)
         return jsonify(resultados)
     except: return jsonify([])
 
+@app.route('/api/debug/arranque')
+def api_debug_arranque():
+    if not is_development(): return abort(403)
+    return jsonify(METRICAS_ARRANQUE)
+
+@app.route('/api/debug/consultas')
+def api_debug_consultas():
+    if not is_development(): return abort(403)
+    return jsonify(repositorio.estadisticas())
+
+@app.route('/api/debug/escritor')
+def api_debug_escritor():
+    if not is_development(): return abort(403)
+    return jsonify(escritor.metricas())
+
+@app.route('/api/debug/fragmentos')
+def api_debug_fragmentos():
+    if not is_development(): return abort(403)
+    return jsonify(fragmentos.metricas())
+
+@app.route('/api/auditoria/metricas')
+@login_required
+@rol_requerido("dueno")
+def api_auditoria_metricas():
+    return jsonify({'success': True, **auditoria.metricas()})
+
 @app.route('/api/debug/rutas')
 def api_debug_rutas():
     if not is_development(): return abort(403)
@@ -168,86 +304,44 @@ def api_debug_rutas():
 #  API CARRITO (GUEST CHECKOUT HABILITADO)
 # ========================================================
 
+def _carrito_api(operacion, *args, reserva=None):
+    """Corre una operación de carritos.py sobre el carrito de la sesión y guarda el resultado."""
+    carrito = session.get('carrito', {})
+    cuerpo, status = escribir(operacion, carrito, reserva or session.get("reserva"), *args)
+    if status == 200:
+        session['carrito'] = carrito
+        session.modified = True
+    return jsonify(cuerpo), status
+
 @app.route('/api/carrito', methods=['GET'])
 def api_obtener_carrito():
     try:
-        carrito = session.get('carrito', {})
-        total_items = sum(i['cantidad'] for i in carrito.values())
-        total_precio = sum(i['cantidad'] * i['precio'] for i in carrito.values())
-        user_status = current_user.username if current_user.is_authenticated else "Invitado"
-        return jsonify({'success': True, 'carrito': carrito, 'total_items': total_items, 'total_precio': total_precio, 'user': user_status})
+        return jsonify(carritos.resumen(session.get('carrito', {}), current_user.username if current_user.is_authenticated else None))
     except Exception as e: return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/carrito/agregar', methods=['POST'])
 def api_agregar_carrito():
     try:
         data = request.get_json()
-        pid = data.get('producto_id')
-        cant = int(data.get('cantidad', 1))
-        
-        conn = get_db_connection()
-        prod = conn.execute("SELECT * FROM productos WHERE id=? AND activo=1", (pid,)).fetchone()
-        conn.close()
-        
-        if not prod: return jsonify({'success': False, 'error': 'Producto no existe'}), 404
-        if prod['stock'] < cant: return jsonify({'success': False, 'error': 'Stock insuficiente'}), 400
-        
-        carrito = session.get('carrito', {})
-        key = str(pid)
-        
-        if key in carrito:
-            nueva = carrito[key]['cantidad'] + cant
-            if nueva > prod['stock']: return jsonify({'success': False, 'error': 'Stock máximo alcanzado'}), 400
-            carrito[key]['cantidad'] = nueva
-        else:
-            carrito[key] = {'nombre': prod['nombre'], 'precio': float(prod['precio']), 'cantidad': cant}
-            
-        session['carrito'] = carrito
-        session.modified = True
-        
-        return jsonify({
-            'success': True, 
-            'total_items': sum(i['cantidad'] for i in carrito.values()),
-            'stock_actual': prod['stock'] - cant,
-            'mensaje': f"Agregaste {prod['nombre']}"
-        })
+        return _carrito_api(carritos.agregar, data.get('producto_id'), int(data.get('cantidad', 1)), reserva=sesion_reserva())
+    except escritor.ColaLlena: raise
     except Exception as e: return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/carrito/actualizar', methods=['POST'])
 def api_actualizar_carrito():
     try:
         data = request.get_json()
-        pid = str(data.get('producto_id'))
-        cant = int(data.get('cantidad', 1))
-        carrito = session.get('carrito', {})
-        
-        if pid in carrito:
-            if cant <= 0: del carrito[pid]
-            else:
-                stock = obtener_stock_actual(int(pid))
-                if cant > stock: return jsonify({'success': False, 'error': 'Stock insuficiente'}), 400
-                carrito[pid]['cantidad'] = cant
-            session['carrito'] = carrito
-            session.modified = True
-            return jsonify({'success': True, 'total_items': sum(i['cantidad'] for i in carrito.values())})
-        return jsonify({'success': False, 'error': 'No encontrado'}), 404
+        return _carrito_api(carritos.actualizar, data.get('producto_id'), int(data.get('cantidad', 1)), reserva=sesion_reserva())
+    except escritor.ColaLlena: raise
     except Exception as e: return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/carrito/eliminar/<int:producto_id>', methods=['DELETE'])
 def api_eliminar_item(producto_id):
-    carrito = session.get('carrito', {})
-    if str(producto_id) in carrito:
-        del carrito[str(producto_id)]
-        session['carrito'] = carrito
-        session.modified = True
-        return jsonify({'success': True, 'total_items': sum(i['cantidad'] for i in carrito.values())})
-    return jsonify({'success': False, 'error': 'No encontrado'}), 404
+    return _carrito_api(carritos.eliminar, producto_id)
 
 @app.route('/api/carrito/limpiar', methods=['POST'])
 def api_limpiar_carrito():
-    session['carrito'] = {}
-    session.modified = True
-    return jsonify({'success': True, 'total_items': 0})
+    return _carrito_api(carritos.limpiar)
 
 @app.route('/api/carrito/debug', methods=['GET'])
 def api_carrito_debug():
@@ -270,10 +364,12 @@ def ver_carrito():
     carrito_validado = {}
     for pid, item in carrito.items():
         try:
-            stock = obtener_stock_actual(int(pid))
-            if stock > 0:
-                if item['cantidad'] > stock: item['cantidad'] = stock
-                carrito_validado[pid] = item
+            # Renueva la reserva; si venció y otro carrito tomó el stock, se ajusta a lo que queda
+            if not reservar_en_carrito(pid, item['cantidad']):
+                stock = obtener_stock_actual(int(pid))
+                if stock <= 0 or not reservar_en_carrito(pid, stock): continue
+                item['cantidad'] = stock
+            carrito_validado[pid] = item
         except: pass
     session["carrito"] = carrito_validado
     return render_template("ver_carrito.html", carrito=carrito_validado)
@@ -285,9 +381,10 @@ def actualizar_cantidad_carrito():
     carrito = session.get("carrito", {})
     if pid in carrito:
         if accion == "incrementar":
-            if carrito[pid]["cantidad"] < obtener_stock_actual(int(pid)): carrito[pid]["cantidad"] += 1
+            if reservar_en_carrito(pid, carrito[pid]["cantidad"] + 1): carrito[pid]["cantidad"] += 1
             else: flash("Stock máximo.", "warning")
         elif accion == "decrementar":
+            reservar_en_carrito(pid, carrito[pid]["cantidad"] - 1)
             if carrito[pid]["cantidad"] > 1: carrito[pid]["cantidad"] -= 1
             else: del carrito[pid]
         session["carrito"] = carrito
@@ -298,6 +395,7 @@ def actualizar_cantidad_carrito():
 def eliminar_del_carrito(producto_id):
     carrito = session.get("carrito", {})
     if str(producto_id) in carrito:
+        liberar_carrito(producto_id)
         del carrito[str(producto_id)]
         session["carrito"] = carrito
         session.modified = True
@@ -306,6 +404,7 @@ def eliminar_del_carrito(producto_id):
 
 @app.route("/vaciar_carrito", methods=["POST"])
 def vaciar_carrito():
+    liberar_carrito()
     session["carrito"] = {}
     session.modified = True
     flash("Carrito vaciado", "info")
@@ -315,20 +414,19 @@ def vaciar_carrito():
 def agregar_al_carrito_html(producto_id):
     try: cantidad = int(request.form.get("cantidad", 1))
     except: cantidad = 1
-    stock = obtener_stock_actual(producto_id)
-    if cantidad > stock:
+    carrito = session.get("carrito", {})
+    key = str(producto_id)
+    if cantidad < 1 or not reservar_en_carrito(producto_id, carrito.get(key, {}).get("cantidad", 0) + cantidad):
         flash("Stock insuficiente", "warning")
         return redirect(url_for("index"))
     conn = get_db_connection()
-    prod = conn.execute("SELECT * FROM productos WHERE id=?", (producto_id,)).fetchone()
+    prod = repositorio.uno(conn, "producto_para_carrito", (producto_id,))
     conn.close()
-    carrito = session.get("carrito", {})
-    key = str(producto_id)
     if key in carrito: carrito[key]["cantidad"] += cantidad
-    else: carrito[key] = {"nombre": prod["nombre"], "precio": float(prod["precio"]), "cantidad": cantidad}
+    else: carrito[key] = {"nombre": prod.nombre, "precio": float(prod.precio), "cantidad": cantidad}
     session["carrito"] = carrito
     session.modified = True
-    flash(f"Agregado: {prod['nombre']}", "success")
+    flash(f"Agregado: {prod.nombre}", "success")
     return redirect(url_for("index"))
 
 # ========================================================
@@ -341,18 +439,22 @@ def agregar_al_carrito_html(producto_id):
 def finalizar_compra():
     carrito = session.get("carrito", {})
     if not carrito: return redirect(url_for("index"))
+    # Las reservas duran TTL_SEGUNDOS más desde que se entra al checkout
+    escribir(reservas.renovar, sesion_reserva())
     conn = get_db_connection()
     items_checkout = []
     subtotal = 0
     for pid, item in carrito.items():
-        p = conn.execute("SELECT * FROM productos WHERE id=?", (pid,)).fetchone()
-        if p and p['stock'] >= item['cantidad']:
-            st = item['cantidad'] * float(p['precio'])
-            items_checkout.append({'id': pid, 'nombre': p['nombre'], 'precio': p['precio'], 'cantidad': item['cantidad'], 'subtotal': st})
+        p = repositorio.uno(conn, "producto_para_carrito", (pid,))
+        if p and reservas.disponible(conn, int(pid), sesion_reserva()) >= item['cantidad']:
+            st = item['cantidad'] * float(p.precio)
+            items_checkout.append({'id': pid, 'nombre': p.nombre, 'precio': p.precio, 'cantidad': item['cantidad'], 'subtotal': st})
             subtotal += st
-    metodo = conn.execute("SELECT * FROM metodos_pago WHERE usuario_id=? AND predeterminado=1", (current_user.id,)).fetchone()
+    metodo = repositorio.uno(conn, "metodo_pago_predeterminado", (current_user.id,))
     conn.close()
-    return render_template("checkout.html", carrito=items_checkout, total=subtotal, metodo_guardado=metodo)
+    # Clave de idempotencia: si el formulario se envía dos veces, se devuelve el mismo pedido
+    clave_pedido = secrets.token_urlsafe(16)
+    return render_template("checkout.html", carrito=items_checkout, total=subtotal, metodo_guardado=metodo, clave_pedido=clave_pedido)
 
 @app.route("/confirmar_compra", methods=["POST"])
 @login_required
@@ -368,33 +470,58 @@ def confirmar_compra():
 @login_required
 @rol_requerido("cliente")
 def procesar_pago():
+    clave = (request.form.get("clave_pedido") or "").strip()[:64] or None
+    previo = pedido_por_clave(clave)
+    if previo: return redirect(url_for("comprobante_pago", numero_pedido=previo))
+
     time.sleep(3) # Espera 3 seg
     carrito = session.get("carrito", {})
     if not carrito: return redirect(url_for("index"))
     
     total = sum(i['cantidad'] * i['precio'] for i in carrito.values())
-    nro_pedido = f"VDL-{datetime.now().strftime('%Y%m%d')}-{random.randint(10000, 99999)}"
+    ahora = datetime.now()
     
-    conn = get_db_connection()
     try:
-        cur = conn.cursor()
-        cur.execute("INSERT INTO ventas (usuario_id, total, fecha, estado, numero_pedido) VALUES (?, ?, ?, ?, ?)",
-                    (current_user.id, total, datetime.now(), "completada", nro_pedido))
-        venta_id = cur.lastrowid
-        for pid, item in carrito.items():
-            cur.execute("INSERT INTO venta_items (venta_id, producto_id, cantidad, precio_unitario) VALUES (?, ?, ?, ?)",
-                        (venta_id, pid, item['cantidad'], item['precio']))
-            cur.execute("UPDATE productos SET stock = stock - ? WHERE id=?", (item['cantidad'], pid))
-        conn.commit()
+        nro_pedido = escribir(registrar_venta, current_user.id, total, ahora, clave, carrito, sesion_reserva())
+        cache.invalidar("catalogo", "ventas")
         session['carrito'] = {}
         session.modified = True
         flash("¡Pago exitoso!", "success")
         return redirect(url_for("comprobante_pago", numero_pedido=nro_pedido))
+    except reservas.SinStock as e:
+        nombre = carrito.get(str(e.producto_id), {}).get("nombre", "un producto")
+        flash(f"⚠️ Tu reserva de {nombre} venció y ya no hay stock suficiente (quedan {e.disponible}).", "warning")
+        return redirect(url_for("ver_carrito"))
+    except sqlite3.IntegrityError:
+        # Otro request con la misma clave ganó la carrera: devolvemos ese pedido
+        previo = pedido_por_clave(clave)
+        if previo: return redirect(url_for("comprobante_pago", numero_pedido=previo))
+        flash("Error procesando el pago", "danger")
+        return redirect(url_for("finalizar_compra"))
+    except escritor.ColaLlena: raise
     except Exception as e:
-        conn.rollback()
         flash(f"Error: {str(e)}", "danger")
         return redirect(url_for("finalizar_compra"))
-    finally: conn.close()
+
+def registrar_venta(conn, usuario_id, total, ahora, clave, carrito, sesion):
+    """Unidad de escritura del pago: venta, ítems y conversión de reservas en una transacción. Devuelve el número de pedido."""
+    venta_id = repositorio.ejecutar(conn, "insertar_venta", (usuario_id, total, ahora.strftime("%Y-%m-%d %H:%M:%S"),
+                                                             int(ahora.timestamp()), clave)).lastrowid
+    # El id autoincremental es una secuencia sin colisiones
+    nro_pedido = f"VDL-{ahora.strftime('%Y%m%d')}-{venta_id:06d}"
+    repositorio.ejecutar(conn, "asignar_numero_pedido", (nro_pedido, venta_id))
+    repositorio.ejecutar_muchos(conn, "insertar_venta_item",
+                                [(venta_id, pid, item['cantidad'], item['precio']) for pid, item in carrito.items()])
+    reservas.convertir(conn, sesion, carrito)
+    return nro_pedido
+
+def pedido_por_clave(clave):
+    """numero_pedido ya creado con esa clave de idempotencia por el usuario actual, o None."""
+    if not clave: return None
+    conn = get_db_connection()
+    numero = repositorio.valor(conn, "pedido_por_clave", (clave, current_user.id))
+    conn.close()
+    return numero
 
 # ========================================================
 #  PDF Y COMPROBANTES
@@ -405,24 +532,31 @@ def procesar_pago():
 @rol_requerido("cliente")
 def comprobante_pago(numero_pedido):
     conn = get_db_connection()
-    venta = conn.execute("SELECT * FROM ventas WHERE numero_pedido=? AND usuario_id=?", (numero_pedido, current_user.id)).fetchone()
-    if not venta: return redirect(url_for("mis_compras"))
-    items = conn.execute("SELECT p.nombre, vi.cantidad, vi.precio_unitario FROM venta_items vi JOIN productos p ON vi.producto_id=p.id WHERE vi.venta_id=?", (venta['id'],)).fetchall()
+    with archivo.con_archivo(conn, usuario_id=current_user.id):
+        venta = repositorio.uno(conn, "venta_de_cliente", (numero_pedido, current_user.id))
+        items = repositorio.todos(conn, "items_de_venta", (venta.id,)) if venta else []
+    if not venta:
+        conn.close()
+        return redirect(url_for("mis_compras"))
+    ventana = cancelaciones.ventana_minutos(conn)
     conn.close()
-    return render_template("comprobante_pago.html", venta=venta, items=items, fecha=datetime.now())
+    return render_template("comprobante_pago.html", venta=venta, items=items, fecha=datetime.now(), ventana_minutos=ventana)
 
 @app.route("/descargar_comprobante/<numero_pedido>")
 @login_required
 @rol_requerido("cliente")
 def descargar_comprobante(numero_pedido):
     conn = get_db_connection()
-    venta = conn.execute("SELECT * FROM ventas WHERE numero_pedido=? AND usuario_id=?", (numero_pedido, current_user.id)).fetchone()
-    if not venta: return redirect(url_for("mis_compras"))
-    items = conn.execute("SELECT p.nombre, vi.cantidad, vi.precio_unitario FROM venta_items vi JOIN productos p ON vi.producto_id=p.id WHERE vi.venta_id=?", (venta['id'],)).fetchall()
+    with archivo.con_archivo(conn, usuario_id=current_user.id):
+        venta = repositorio.uno(conn, "venta_de_cliente", (numero_pedido, current_user.id))
+        items = repositorio.todos(conn, "items_de_venta", (venta.id,)) if venta else []
+    if not venta:
+        conn.close()
+        return redirect(url_for("mis_compras"))
     conn.close()
     html = render_template("comprobante_pago.html", venta=venta, items=items, fecha=datetime.now(), es_pdf=True)
     pdf = BytesIO()
-    pisa.CreatePDF(html, dest=pdf)
+    subsistemas.pdf().CreatePDF(html, dest=pdf)
     pdf.seek(0)
     return send_file(pdf, as_attachment=True, download_name=f"Comprobante_{numero_pedido}.pdf", mimetype='application/pdf')
 
@@ -431,12 +565,14 @@ def descargar_comprobante(numero_pedido):
 @rol_requerido("cliente")
 def mis_compras():
     conn = get_db_connection()
-    ventas = conn.execute("SELECT * FROM ventas WHERE usuario_id=? ORDER BY fecha DESC", (current_user.id,)).fetchall()
-    data = []
-    for v in ventas:
-        items = conn.execute("SELECT p.nombre, vi.cantidad, vi.precio_unitario FROM venta_items vi JOIN productos p ON vi.producto_id=p.id WHERE vi.venta_id=?", (v['id'],)).fetchall()
-        data.append({"venta": v, "items": items})
+    items_por_venta = {}
+    # Si el cliente tiene compras en meses archivados, también se listan
+    with archivo.con_archivo(conn, usuario_id=current_user.id):
+        ventas = repositorio.todos(conn, "ventas_de_cliente", (current_user.id,))
+        for item in repositorio.todos(conn, "items_de_cliente", (current_user.id,)):
+            items_por_venta.setdefault(item.venta_id, []).append(item)
     conn.close()
+    data = [{"venta": v, "items": items_por_venta.get(v.id, [])} for v in ventas]
     return render_template("mis_compras.html", compras=data)
 
 @app.route("/cancelar_compra_rapida/<numero_pedido>", methods=["POST"])
@@ -444,22 +580,36 @@ def mis_compras():
 @rol_requerido("cliente")
 def cancelar_compra_rapida(numero_pedido):
     conn = get_db_connection()
-    venta = conn.execute("SELECT * FROM ventas WHERE numero_pedido=? AND usuario_id=?", (numero_pedido, current_user.id)).fetchone()
+    venta = repositorio.uno(conn, "venta_de_cliente", (numero_pedido, current_user.id))
+    limite = cancelaciones.limite_cancelacion(conn)
+    conn.close()
     if not venta: return redirect(url_for("mis_compras"))
-    try: f = datetime.strptime(venta['fecha'], '%Y-%m-%d %H:%M:%S.%f')
-    except: f = datetime.strptime(venta['fecha'], '%Y-%m-%d %H:%M:%S')
-    if (datetime.now() - f).total_seconds() > 600:
+    canceladas = escribir(cancelaciones.cancelar_ventas, [venta.id], current_user.id, limite)
+    if not canceladas:
         flash("Tiempo expirado.", "warning")
         return redirect(url_for("mis_compras"))
-    items = conn.execute("SELECT producto_id, cantidad FROM venta_items WHERE venta_id=?", (venta['id'],)).fetchall()
-    for i in items:
-        conn.execute("UPDATE productos SET stock = stock + ? WHERE id=?", (i['cantidad'], i['producto_id']))
-    conn.execute("UPDATE ventas SET estado='cancelada' WHERE id=?", (venta['id'],))
-    conn.commit()
-    conn.close()
+    cache.invalidar("catalogo", "ventas")
+    auditoria.registrar(current_user.id, "cancelar_venta", venta_ids=canceladas, numero_pedido=numero_pedido)
     flash("Cancelado con éxito.", "success")
     return redirect(url_for("mis_compras"))
 
+@app.route("/cancelar_ventas_lote", methods=["POST"])
+@login_required
+@rol_requerido("dueno")
+def cancelar_ventas_lote():
+    try: ids = [int(i) for i in request.form.getlist("venta_ids")]
+    except ValueError: ids = []
+    if not ids:
+        flash("Selecciona al menos una venta.", "warning")
+        return redirect(url_for("panel_dueno"))
+    # El dueño puede cancelar fuera de la ventana del cliente
+    canceladas = escribir(cancelaciones.cancelar_ventas, ids)
+    if canceladas:
+        cache.invalidar("catalogo", "ventas")
+        auditoria.registrar(current_user.id, "cancelar_ventas_lote", venta_ids=canceladas)
+    flash(f"{len(canceladas)} ventas canceladas y stock repuesto.", "success")
+    return redirect(url_for("panel_dueno"))
+
 # ========================================================
 #  DUEÑO Y VENDEDOR
 # ========================================================
@@ -468,12 +618,38 @@ def cancelar_compra_rapida(numero_pedido):
 @login_required
 @rol_requerido("vendedor")
 def vendedor_view():
+    pagina = request.args.get("pagina", 1, type=int)
+    conn = get_db_connection()
+    datos = tablero.pagina(conn, current_user.id, pagina)
+    pron = pronostico.pronosticar(conn, current_user.id)
+    conn.close()
+    bajo = datos["productos_bajo"]
+    return render_template("vendedor.html", productos=datos["productos"], productos_bajo=bajo[:tablero.MAX_BAJO],
+                           ids_alerta={a["producto_id"] for a in bajo}, cambios_pendientes=datos["cambios_pendientes"],
+                           pronostico=pron, dias_objetivo=pronostico.DIAS_OBJETIVO, pagina=datos["pagina"],
+                           paginas=datos["paginas"], total_productos=datos["total_productos"])
+
+@app.route("/api/vendedor/tablero")
+@login_required
+@rol_requerido("vendedor")
+def api_tablero_vendedor():
+    try:
+        pagina = int(request.args.get("pagina", 1))
+        por_pagina = int(request.args.get("por_pagina", tablero.POR_PAGINA))
+    except ValueError: return jsonify({'success': False, 'error': 'Parámetros inválidos'}), 400
+    conn = get_db_connection()
+    datos = tablero.pagina(conn, current_user.id, pagina, por_pagina)
+    conn.close()
+    return jsonify({'success': True, **datos})
+
+@app.route("/api/pronostico")
+@login_required
+@rol_requerido("vendedor")
+def api_pronostico():
     conn = get_db_connection()
-    prods = conn.execute("SELECT * FROM productos WHERE vendedor_id=? AND activo=1", (current_user.id,)).fetchall()
-    bajo = conn.execute("SELECT * FROM productos WHERE vendedor_id=? AND stock < 10 AND activo=1", (current_user.id,)).fetchall()
-    pend = conn.execute("SELECT cs.*, p.nombre FROM cambios_stock cs JOIN productos p ON cs.producto_id = p.id WHERE cs.estado='pendiente' AND cs.vendedor_id=?", (current_user.id,)).fetchall()
+    pron = pronostico.pronosticar(conn, current_user.id)
     conn.close()
-    return render_template("vendedor.html", productos=prods, productos_bajo=bajo, cambios_pendientes=pend)
+    return jsonify({'success': True, 'dias_objetivo': pronostico.DIAS_OBJETIVO, 'productos': pron})
 
 @app.route("/agregar_producto", methods=["GET", "POST"])
 @login_required
@@ -489,18 +665,24 @@ def agregar_producto():
             flash("Precio o stock inválidos", "danger")
             return redirect(url_for("agregar_producto"))
         categoria = request.form.get("categoria", "")
-        imagen_url = request.form.get("imagen_url", "")
+        imagen_url = request.form.get("imagen_url", "").strip()
+        foto = request.files.get("imagen")
+        datos_foto = foto.read(imagenes.MAX_BYTES + 1) if foto and foto.filename else None
+        if datos_foto and len(datos_foto) > imagenes.MAX_BYTES:
+            flash("La imagen es demasiado grande (máx. 10 MB)", "danger")
+            return redirect(url_for("agregar_producto"))
         
-        # Imagen por defecto si está vacía
-        if not imagen_url:
+        # Imagen por defecto si está vacía (se descarga una sola vez y queda en el cache local)
+        if not imagen_url and not datos_foto:
             if categoria == 'Frutas': imagen_url = "https://images.pexels.com/photos/1132047/pexels-photo-1132047.jpeg?auto=compress&cs=tinysrgb&w=400"
             elif categoria == 'Verduras': imagen_url = "https://images.pexels.com/photos/533360/pexels-photo-533360.jpeg?auto=compress&cs=tinysrgb&w=400"
 
-        conn = get_db_connection()
-        conn.execute("INSERT INTO productos (nombre, descripcion, precio, stock, categoria, vendedor_id, imagen_url, activo) VALUES (?,?,?,?,?,?,?,1)",
-                     (nombre, descripcion, precio, stock, categoria, current_user.id, imagen_url))
-        conn.commit()
-        conn.close()
+        producto_id = escribir(repositorio.ejecutar, "insertar_producto", (nombre, descripcion, precio, stock, categoria,
+                                                                            current_user.id, imagen_url)).lastrowid
+        cache.invalidar("catalogo")
+        auditoria.registrar(current_user.id, "agregar_producto", producto_id=producto_id, nombre=nombre, precio=precio, stock=stock)
+        if datos_foto or imagen_url:
+            imagenes.encolar_producto(tiendas.ruta(), producto_id, url=imagen_url or None, datos=datos_foto)
         flash("Producto agregado", "success")
         return redirect(url_for("vendedor_view"))
     return render_template("agregar_producto.html")
@@ -510,97 +692,287 @@ def agregar_producto():
 @rol_requerido("vendedor")
 def solicitar_cambio_producto(producto_id):
     conn = get_db_connection()
-    p = conn.execute("SELECT * FROM productos WHERE id=?", (producto_id,)).fetchone()
+    p = repositorio.uno(conn, "producto_para_cambio", (producto_id,))
     if request.method == "POST":
         n_st = int(request.form.get("stock"))
         n_pr = float(request.form.get("precio"))
-        pct = ((n_st - p["stock"]) / p["stock"] * 100) if p["stock"] > 0 else 100
-        conn.execute("INSERT INTO cambios_stock (producto_id, vendedor_id, stock_anterior, stock_nuevo, precio_anterior, precio_nuevo, porcentaje_cambio, motivo, estado, fecha_solicitud) VALUES (?,?,?,?,?,?,?,?,'pendiente', datetime('now'))",
-                     (producto_id, current_user.id, p["stock"], n_st, p["precio"], n_pr, pct, request.form.get("motivo","")))
-        conn.commit()
+        pct = ((n_st - p.stock) / p.stock * 100) if p.stock > 0 else 100
+        conn.close()
+        escribir(repositorio.ejecutar, "insertar_cambio_stock",
+                 (producto_id, current_user.id, p.stock, n_st, p.precio, n_pr, pct, request.form.get("motivo",""), p.version))
         flash("Solicitud enviada", "success")
         return redirect(url_for('vendedor_view'))
     conn.close()
-    return render_template("solicitar_cambio.html", producto=p)
+    # Desde la sugerencia de reposición del panel llegan ?stock=...&motivo=... para precargar el formulario
+    return render_template("solicitar_cambio.html", producto=p, stock_sugerido=request.args.get("stock", type=int),
+                           motivo_sugerido=request.args.get("motivo", ""))
 
 @app.route("/solicitar_baja_producto/<int:producto_id>", methods=["POST"])
 @login_required
 @rol_requerido("vendedor")
 def solicitar_baja_producto(producto_id):
     conn = get_db_connection()
-    p = conn.execute("SELECT * FROM productos WHERE id=?", (producto_id,)).fetchone()
-    conn.execute("INSERT INTO cambios_stock (producto_id, vendedor_id, stock_anterior, stock_nuevo, precio_anterior, precio_nuevo, porcentaje_cambio, motivo, estado, fecha_solicitud) VALUES (?,?,?,?,?,?,?,?,'pendiente', datetime('now'))",
-                 (producto_id, current_user.id, p["stock"], 0, p["precio"], p["precio"], -100, "Baja"))
-    conn.commit()
+    p = repositorio.uno(conn, "producto_para_cambio", (producto_id,))
+    conn.close()
+    escribir(repositorio.ejecutar, "insertar_cambio_stock", (producto_id, current_user.id, p.stock, 0, p.precio, p.precio, -100, "Baja", p.version))
     flash("Baja solicitada", "success")
     return redirect(url_for("vendedor_view"))
 
+# ========================================================
+#  ALERTAS DE STOCK BAJO
+# ========================================================
+
+def _vendedor_de_alertas():
+    """El dueño ve todas las alertas; el vendedor solo las de sus productos."""
+    return None if current_user.rol == "dueno" else current_user.id
+
+@app.route("/api/alertas/contador")
+@login_required
+@rol_requerido(["vendedor", "dueno"])
+def api_alertas_contador():
+    conn = get_db_connection()
+    total = alertas.contar(conn, _vendedor_de_alertas())
+    conn.close()
+    return jsonify({'success': True, 'total': total})
+
+@app.route("/api/alertas")
+@login_required
+@rol_requerido(["vendedor", "dueno"])
+def api_alertas():
+    try:
+        pagina = int(request.args.get("pagina", 1))
+        por_pagina = int(request.args.get("por_pagina", alertas.POR_PAGINA))
+    except ValueError: return jsonify({'success': False, 'error': 'Parámetros inválidos'}), 400
+    conn = get_db_connection()
+    filas = alertas.listar(conn, _vendedor_de_alertas(), pagina, por_pagina)
+    total = alertas.contar(conn, _vendedor_de_alertas())
+    conn.close()
+    return jsonify({'success': True, 'pagina': pagina, 'total': total, 'alertas': [dict(f) for f in filas]})
+
+@app.route("/umbral_alerta/<int:producto_id>", methods=["POST"])
+@login_required
+@rol_requerido("vendedor")
+def umbral_alerta_producto(producto_id):
+    valor = request.form.get("umbral", "").strip()
+    try: umbral = int(valor) if valor else None
+    except ValueError:
+        flash("Umbral inválido", "danger")
+        return redirect(url_for("solicitar_cambio_producto", producto_id=producto_id))
+    # Vacío = usar el umbral global de la empresa
+    escribir(repositorio.ejecutar, "actualizar_umbral_producto", (umbral, producto_id, current_user.id))
+    # El umbral no sube la versión del producto: el panel del vendedor se invalida a mano
+    tablero.invalidar(current_user.id)
+    flash("Umbral de alerta actualizado", "success")
+    return redirect(url_for("vendedor_view"))
+
+@app.route("/configurar_alertas", methods=["POST"])
+@login_required
+@rol_requerido("dueno")
+def configurar_alertas():
+    try: limite = int(request.form.get("limite_stock_alerta", ""))
+    except ValueError:
+        flash("Límite inválido", "danger")
+        return redirect(url_for("panel_dueno"))
+    escribir(alertas.cambiar_umbral_global, limite)
+    tablero.invalidar()
+    auditoria.registrar(current_user.id, "configurar_alertas", limite_stock_alerta=limite)
+    flash(f"Límite global de stock bajo: {limite} unidades", "success")
+    return redirect(url_for("panel_dueno"))
+
 @app.route("/panel_dueno")
 @login_required
 @rol_requerido("dueno")
 def panel_dueno():
+    # Agregados e historial desde la copia de analítica (ver analitica.py)
+    lectura = analitica.conectar_lectura(tiendas.ruta())
+    stats = repositorio.uno(lectura, "estadisticas_ventas")
+    top = repositorio.todos(lectura, "top_productos")
+    aut = repositorio.todos(lectura, "cambios_autorizados")
+    lectura.close()
+    # Lo que el dueño puede accionar (aprobar, cancelar) se lee de la base principal
     conn = get_db_connection()
-    stats = conn.execute("SELECT COUNT(*) as total_ventas, COALESCE(SUM(total), 0) as total_ingresos FROM ventas WHERE estado='completada'").fetchone()
-    pend = conn.execute("SELECT cs.*, p.nombre, u.username as vendedor FROM cambios_stock cs JOIN productos p ON cs.producto_id=p.id JOIN usuarios u ON cs.vendedor_id=u.id WHERE cs.estado='pendiente' ORDER BY cs.fecha_solicitud DESC").fetchall()
-    top = conn.execute("SELECT p.nombre, SUM(vi.cantidad) as total FROM venta_items vi JOIN productos p ON vi.producto_id=p.id JOIN ventas v ON vi.venta_id=v.id WHERE v.estado='completada' GROUP BY p.id ORDER BY total DESC LIMIT 5").fetchall()
-    aut = conn.execute("SELECT cs.*, p.nombre, u1.username as vendedor FROM cambios_stock cs JOIN productos p ON cs.producto_id=p.id JOIN usuarios u1 ON cs.vendedor_id=u1.id WHERE cs.estado='autorizado' ORDER BY cs.fecha_autorizacion DESC LIMIT 10").fetchall()
+    pend = repositorio.todos(conn, "cambios_pendientes")
+    recientes = repositorio.todos(conn, "ventas_recientes")
+    limite_alerta = alertas.umbral_global(conn)
+    total_alertas = alertas.contar(conn)
     conn.close()
-    return render_template("panel_dueno.html", stats=stats, cambios_pendientes=pend, top_productos=top, cambios_autorizados=aut)
+    return render_template("panel_dueno.html", stats=stats, cambios_pendientes=pend, top_productos=top, cambios_autorizados=aut,
+                           limite_alerta=limite_alerta, total_alertas=total_alertas, ventas_recientes=recientes,
+                           frescura=analitica.frescura())
+
+def aplicar_cambios_lote(conn, cambio_ids, accion, usuario_id):
+    """Autoriza o rechaza varias solicitudes de cambios_stock en una sola transacción.
+
+    Usa sentencias por conjunto sobre una tabla temporal con los ids del lote,
+    así el costo no crece con una consulta por solicitud. Solo se procesan
+    solicitudes 'pendiente'. Control optimista: cada solicitud guarda la versión
+    del producto al pedirse; si cambió (ventas, otra aprobación) se reajusta sobre
+    los valores actuales o queda pendiente con el conflicto anotado, sin bloquear
+    el producto mientras el dueño decide. Devuelve un dict con los conteos aplicados.
+    """
+    ids = sorted({int(i) for i in cambio_ids})
+    resultado = {"autorizados": 0, "bajas": 0, "rechazados": 0, "reajustados": 0, "conflictos": 0}
+    if not ids: return resultado
+
+    repositorio.ejecutar(conn, "lote_crear")
+    repositorio.ejecutar(conn, "lote_vaciar")
+    repositorio.ejecutar_muchos(conn, "lote_agregar", [(i,) for i in ids])
+    # Nos quedamos solo con las pendientes (una solicitud ya resuelta no se reaplica)
+    repositorio.ejecutar(conn, "lote_solo_pendientes")
+
+    if accion == "rechazar":
+        resultado["rechazados"] = repositorio.ejecutar(conn, "lote_rechazar").rowcount
+        return resultado
+
+    # BAJAS: desactivamos el producto
+    resultado["bajas"] = repositorio.ejecutar(conn, "lote_aplicar_bajas").rowcount
+    # CAMBIOS NORMALES: si hay varias solicitudes del mismo producto gana la más reciente
+    repositorio.ejecutar(conn, "lote_plan_crear")
+    repositorio.ejecutar(conn, "lote_plan_vaciar")
+    repositorio.ejecutar(conn, "lote_planificar")
+    resultado["conflictos"] = repositorio.ejecutar(conn, "lote_marcar_conflictos").rowcount
+    repositorio.ejecutar(conn, "lote_quitar_conflictos")
+    resultado["reajustados"] = repositorio.valor(conn, "lote_contar_reajustados", defecto=0)
+    resultado["autorizados"] = repositorio.ejecutar(conn, "lote_aplicar_cambios").rowcount
+    # Autorizadas solo las aplicadas; las más viejas del mismo producto quedan reemplazadas
+    repositorio.ejecutar(conn, "lote_marcar_autorizados", (usuario_id,))
+    repositorio.ejecutar(conn, "lote_marcar_reemplazados", (usuario_id,))
+    return resultado
+
+def _procesar_cambios(cambio_ids, accion):
+    res = escribir(aplicar_cambios_lote, cambio_ids, accion, current_user.id)
+    if res["bajas"] or res["autorizados"]:
+        cache.invalidar("catalogo")
+    auditoria.registrar(current_user.id, f"{accion}_cambios", cambio_ids=sorted(set(cambio_ids)), **res)
+    return res
 
 @app.route("/autorizar_cambio_stock/<int:cambio_id>", methods=["POST"])
 @login_required
 @rol_requerido("dueno")
 def autorizar_cambio_stock(cambio_id):
-    conn = get_db_connection()
-    c = conn.execute("SELECT * FROM cambios_stock WHERE id=?", (cambio_id,)).fetchone()
-    
-    if c:
-        # SI ES UNA BAJA (Stock nuevo es 0 y el motivo dice Baja), LO DESACTIVAMOS
-        if c['stock_nuevo'] == 0 and "Baja" in c['motivo']:
-            conn.execute("UPDATE productos SET stock=0, activo=0 WHERE id=?", (c['producto_id'],))
-            flash("Producto dado de baja y ocultado de la tienda.", "success")
-        else:
-            # SI ES UN CAMBIO DE PRECIO/STOCK NORMAL
-            conn.execute("UPDATE productos SET stock=?, precio=? WHERE id=?", 
-                         (c['stock_nuevo'], c['precio_nuevo'], c['producto_id']))
-            flash("Cambio de stock/precio autorizado.", "success")
-
-        # Marcar la solicitud como autorizada
-        conn.execute("UPDATE cambios_stock SET estado='autorizado', autorizado_por=?, fecha_autorizacion=datetime('now') WHERE id=?", 
-                     (current_user.id, cambio_id))
-        
-        conn.commit()
-    
-    conn.close()
+    res = _procesar_cambios([cambio_id], "autorizar")
+    if res["bajas"]: flash("Producto dado de baja y ocultado de la tienda.", "success")
+    elif res["conflictos"]: flash("⚠️ El producto cambió desde la solicitud y no se pudo reajustar: quedó pendiente con el conflicto.", "warning")
+    elif res["reajustados"]: flash("Cambio autorizado y reajustado al stock actual (hubo ventas desde la solicitud).", "success")
+    elif res["autorizados"]: flash("Cambio de stock/precio autorizado.", "success")
     return redirect(url_for("panel_dueno"))
 
 @app.route("/rechazar_cambio_stock/<int:cambio_id>", methods=["POST"])
 @login_required
 @rol_requerido("dueno")
 def rechazar_cambio_stock(cambio_id):
-    conn = get_db_connection()
-    conn.execute("UPDATE cambios_stock SET estado='rechazado', fecha_autorizacion=datetime('now') WHERE id=?", (cambio_id,))
-    conn.commit()
-    conn.close()
+    _procesar_cambios([cambio_id], "rechazar")
     return redirect(url_for("panel_dueno"))
 
+@app.route("/procesar_cambios_lote", methods=["POST"])
+@login_required
+@rol_requerido("dueno")
+def procesar_cambios_lote():
+    accion = request.form.get("accion")
+    volver = request.form.get("volver") or "panel_dueno"
+    if volver not in ("panel_dueno", "solicitudes_pendientes"): volver = "panel_dueno"
+    try: ids = [int(i) for i in request.form.getlist("cambio_ids")]
+    except ValueError: ids = []
+    if accion not in ("autorizar", "rechazar") or not ids:
+        flash("Selecciona al menos una solicitud.", "warning")
+        return redirect(url_for(volver))
+    res = _procesar_cambios(ids, accion)
+    if accion == "rechazar":
+        flash(f"{res['rechazados']} solicitudes rechazadas.", "info")
+    else:
+        flash(f"{res['autorizados']} cambios autorizados ({res['reajustados']} reajustados al stock actual) y {res['bajas']} bajas aplicadas.", "success")
+        if res["conflictos"]: flash(f"⚠️ {res['conflictos']} solicitudes quedaron pendientes por conflicto: revisalas.", "warning")
+    return redirect(url_for(volver))
+
 
 @app.route("/solicitudes_pendientes")
 @login_required
 @rol_requerido("dueno")
 def solicitudes_pendientes():
     conn = get_db_connection()
-    solicitudes = conn.execute("""
-        SELECT cs.*, p.nombre as producto_nombre, u.username as vendedor
-        FROM cambios_stock cs 
-        JOIN productos p ON cs.producto_id = p.id
-        JOIN usuarios u ON cs.vendedor_id = u.id
-        WHERE cs.estado = 'pendiente'
-        ORDER BY cs.fecha_solicitud DESC
-    """).fetchall()
+    solicitudes = repositorio.todos(conn, "cambios_pendientes")
     conn.close()
     return render_template("solicitudes_cambio.html", cambios=solicitudes)
 
+# ========================================================
+#  REPORTES (SOLO DUEÑO)
+# ========================================================
+
+@app.route("/api/reportes/ventas")
+@login_required
+@rol_requerido("dueno")
+def api_reporte_ventas():
+    # La versión se lee antes de abrir la copia: si cambia en el medio, el memo guarda datos más nuevos, nunca más viejos
+    version = analitica.version()
+    conn = analitica.conectar_lectura(tiendas.ruta())
+    try:
+        datos = reportes.serie_ventas(conn, request.args.get("desde") or None, request.args.get("hasta") or None,
+                                      request.args.get("agrupar", "dia"), version)
+    except ValueError as e: return jsonify({'success': False, 'error': str(e)}), 400
+    finally: conn.close()
+    return jsonify({'success': True, 'frescura': analitica.frescura(), **datos})
+
+@app.route("/api/reportes/desglose")
+@login_required
+@rol_requerido("dueno")
+def api_reporte_desglose():
+    version = analitica.version()
+    conn = analitica.conectar_lectura(tiendas.ruta())
+    try:
+        limite = min(int(request.args.get("limite", 50)), 500)
+        datos = reportes.desglose_ventas(conn, request.args.get("desde") or None, request.args.get("hasta") or None,
+                                         request.args.get("por", "categoria"), limite, version)
+    except ValueError as e: return jsonify({'success': False, 'error': str(e)}), 400
+    finally: conn.close()
+    return jsonify({'success': True, **datos})
+
+@app.route("/api/stock/historico")
+@login_required
+@rol_requerido("dueno")
+def api_stock_historico():
+    """Stock a una fecha (?fecha=YYYY-MM-DD HH:MM, por defecto ahora), de un producto (?producto_id=) o de todos."""
+    fecha = request.args.get("fecha") or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    pid = request.args.get("producto_id")
+    if pid:
+        try: pid = int(pid)
+        except ValueError: return jsonify({'success': False, 'error': 'producto_id inválido'}), 400
+    conn = get_db_connection()
+    try:
+        if pid:
+            return jsonify({'success': True, 'fecha': fecha, 'producto_id': pid, 'stock': movimientos.stock_en(conn, pid, fecha)})
+        filas = movimientos.stock_en_todos(conn, fecha)
+        return jsonify({'success': True, 'fecha': fecha,
+                        'productos': [{'producto_id': p, 'nombre': n, 'stock': st} for p, n, st in filas]})
+    except ValueError as e: return jsonify({'success': False, 'error': str(e)}), 400
+    finally: conn.close()
+
+@app.route("/api/stock/verificar")
+@login_required
+@rol_requerido("dueno")
+def api_stock_verificar():
+    conn = get_db_connection()
+    diferencias = movimientos.verificar(conn, completa=request.args.get("completa") == "1")
+    conn.close()
+    return jsonify({'success': True, 'consistente': not diferencias, 'diferencias': diferencias})
+
+# ========================================================
+#  EXPORTACIONES (SOLO DUEÑO)
+# ========================================================
+
+@app.route("/exportar/<tipo>.<formato>")
+@login_required
+@rol_requerido("dueno")
+def exportar_datos(tipo, formato):
+    if tipo not in exportar.CONSULTAS or formato not in exportar.FORMATOS: return abort(404)
+    desde = request.args.get("desde") or None
+    hasta = request.args.get("hasta") or None
+    try: exportar.rango_fechas(desde, hasta)
+    except ValueError: return jsonify({'success': False, 'error': 'Fechas inválidas (usar YYYY-MM-DD)'}), 400
+    nombre = f"{tipo}_{desde or 'inicio'}_{hasta or 'hoy'}.{formato}"
+    return Response(stream_with_context(exportar.generar(analitica.ruta_lectura(tiendas.ruta()), tipo, formato, desde, hasta)),
+                    mimetype=exportar.FORMATOS[formato],
+                    headers={"Content-Disposition": f"attachment; filename={nombre}", "X-Accel-Buffering": "no"})
+
 # ========================================================
 #  INICIO
 # ========================================================
@@ -608,5 +980,137 @@ def solicitudes_pendientes():
 @app.route('/debug')
 def debug_page(): return "Debug OK"
 
+# ========================================================
+#  PRECALENTADO Y MÉTRICAS DE ARRANQUE
+# ========================================================
+
+METRICAS_ARRANQUE = {"primer_request_ms": None}
+
+@app.before_request
+def _marcar_inicio_request():
+    if METRICAS_ARRANQUE["primer_request_ms"] is None:
+        request.environ["verduleria.t0"] = time.perf_counter()
+
+@app.after_request
+def _medir_primer_request(response):
+    t0 = request.environ.get("verduleria.t0")
+    if t0 is not None and METRICAS_ARRANQUE["primer_request_ms"] is None:
+        METRICAS_ARRANQUE["primer_request_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        METRICAS_ARRANQUE["primer_request_ruta"] = request.path
+        app.logger.info("⏱️ Primer request %s: %.1f ms", request.path, METRICAS_ARRANQUE["primer_request_ms"])
+    return response
+
+# ========================================================
+#  PERFILADO POR REQUEST
+# ========================================================
+# Dueño logueado: agregar ?perfilar=1 a cualquier URL. Para perfilar el request
+# de otro usuario (o desde curl), mandar el header X-Perfilar con el token
+# firmado que muestra /perfiles (vale TOKEN_PERFILAR_SEGUNDOS).
+# PERFILAR_MUESTREO=N perfila además 1 de cada N requests al azar (0 = apagado).
+
+TOKEN_PERFILAR_SEGUNDOS = 3600
+
+def _firmador_perfiles():
+    return URLSafeTimedSerializer(app.secret_key, salt=tiendas.con_prefijo("perfilar"))
+
+def _muestreo_perfiles():
+    return app.config.get("PERFILAR_MUESTREO", int(os.environ.get("PERFILAR_MUESTREO", "0")))
+
+def _perfil_pedido():
+    token = request.headers.get("X-Perfilar")
+    if token:
+        try:
+            _firmador_perfiles().loads(token, max_age=TOKEN_PERFILAR_SEGUNDOS)
+            return "header"
+        except BadSignature: return None
+    if request.args.get("perfilar") == "1" and current_user.is_authenticated and current_user.rol == "dueno":
+        return "dueno"
+    return None
+
+@app.before_request
+def _iniciar_perfil():
+    if request.endpoint in (None, "static", "perfiles", "descargar_perfil"): return
+    ruta = request.endpoint
+    origen = _perfil_pedido()
+    perfil = perfilador.Perfil(ruta, origen) if origen else \
+        perfilador.muestrear(ruta, _muestreo_perfiles())
+    if perfil: request.environ["verduleria.perfil"] = perfil.iniciar()
+
+@app.teardown_request
+def _terminar_perfil(exc=None):
+    perfil = request.environ.pop("verduleria.perfil", None)
+    if perfil is None: return
+    try: app.logger.info("🔬 Perfil guardado: %s", perfil.terminar())
+    except OSError as e: app.logger.warning("No se pudo guardar el perfil: %s", e)
+
+@app.route("/perfiles")
+@login_required
+@rol_requerido("dueno")
+def perfiles():
+    return render_template("perfiles.html", perfiles=perfilador.listar(),
+                           token=_firmador_perfiles().dumps(current_user.id), vigencia_min=TOKEN_PERFILAR_SEGUNDOS // 60,
+                           muestreo=_muestreo_perfiles())
+
+@app.route("/perfiles/<nombre>")
+@login_required
+@rol_requerido("dueno")
+def descargar_perfil(nombre):
+    if not perfilador.nombre_valido(nombre): return abort(404)
+    return send_from_directory(tiendas.ruta("perfiles"), nombre, mimetype="text/plain", as_attachment=True)
+
+# ========================================================
+#  FÁBRICA DE LA APP
+# ========================================================
+# Importar este módulo solo define rutas (barato, sin tocar la base).
+# crear_app() hace la inicialización: migraciones y precalentado.
+#   Producción:  gunicorn "app:crear_app()"    |    python run_production.py
+
+_inicializada = False
+
+# Las tareas de fondo escriben por el escritor como las rutas, un lote por unidad:
+# entre lote y lote entran las escrituras de los requests
+def barrer_cancelaciones():
+    conn = get_db_connection()
+    try: cancelaciones.barrer_vencidas(conn, escribir)
+    finally: conn.close()
+
+def actualizar_analitica():
+    analitica.actualizar(tiendas.ruta(), si_mas_vieja_que=analitica.INTERVALO / 2)
+
+def archivar_ventas():
+    archivo.archivar(tiendas.ruta())
+
+def snapshot_stock():
+    escribir(movimientos.tomar_snapshots)
+
+def barrer_reservas():
+    reservas.barrer_vencidas(escribir=escribir)
+
+def crear_app(config=None):
+    global _inicializada
+    if config: app.config.update(config)
+    if _inicializada: return app
+    _inicializada = True
+    # CACHE_BACKEND=compartido con varios workers (gunicorn -w N): invalidaciones visibles en todos
+    cache.configurar(app.config.get("CACHE_BACKEND"))
+    # Todas las tiendas en paralelo; las que no tienen base se crean con python tiendas.py sembrar
+    tiendas.migrar_todas()
+    auditoria.iniciar()
+    if app.config.get("TAREAS_EN_SEGUNDO_PLANO", True):
+        # Cada tarea recorre las tiendas con su base en curso
+        tareas.iniciar("cancelaciones", 60, tiendas.en_cada(barrer_cancelaciones))
+        tareas.iniciar("reservas", 30, tiendas.en_cada(barrer_reservas))
+        tareas.iniciar("snapshots_stock", 3600, tiendas.en_cada(snapshot_stock), inmediata=True)
+        tareas.iniciar("analitica", analitica.INTERVALO, tiendas.en_cada(actualizar_analitica), inmediata=True)
+        tareas.iniciar("archivo", archivo.INTERVALO, tiendas.en_cada(archivar_ventas))
+    if app.config.get("PRECALENTAR", os.environ.get("PRECALENTAR", "1") == "1"):
+        _res = precalentar.calentar(app, primar=[tiendas.en_cada(cargar_catalogo), tiendas.en_cada(primar_usuarios)])
+        METRICAS_ARRANQUE.update(templates=_res["templates"], compilar_ms=round(_res["ms_compilar"], 1),
+                                 errores_templates=[e[0] for e in _res["errores"]])
+    METRICAS_ARRANQUE["arranque_ms"] = round((time.perf_counter() - _INICIO_ARRANQUE) * 1000, 1)
+    METRICAS_ARRANQUE["subsistemas_cargados"] = subsistemas.cargados()
+    app.logger.info("🚀 App lista en %.1f ms", METRICAS_ARRANQUE["arranque_ms"])
+    return app
+
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    crear_app().run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,402 @@
+# archivo.py
+# Archivo mensual de ventas y cambios de stock viejos.
+# Las ventas ya cerradas (canceladas o fuera de la ventana de cancelación,
+# con sus venta_items) y los cambios_stock ya resueltos, más viejos que
+# config_empresa.dias_archivo, se mueven en lotes a una base por mes
+# (archivo/AAAA-MM.db) con las mismas tablas. inventario.db queda con los
+# meses vivos: los escaneos, los backups y la copia de analítica no crecen
+# con la historia.
+#
+# Cada lote se copia primero al archivo (INSERT OR IGNORE, commit) y recién
+# después se borra de la base principal: con WAL un commit sobre dos bases
+# adjuntas no es atómico, así que si algo se corta en el medio la fila queda
+# en los dos lados y el próximo pase la vuelve a copiar (sin duplicar) y la
+# borra. En la misma transacción del borrado se anotan el mes en
+# archivo_meses (con los totales que usa el panel), los clientes en
+# archivo_clientes y las unidades por producto en archivo_productos.
+#
+# Todo lo que escribe en inventario.db (el borrado de cada lote, los pasos
+# de incremental_vacuum, ANALYZE) va como unidad del escritor de la base
+# (escritor.py), igual que las rutas. Pasar una base vieja a auto_vacuum
+# incremental es un VACUUM completo y se hace aparte, con la app detenida
+# (--convertir).
+#
+# Para leer, con_archivo(conn, inicio, fin) crea en la conexión vistas TEMP
+# ventas / venta_items / cambios_stock: la tabla de la base más las filas de
+# los meses archivados que tocan el rango, ambas filtradas por el rango o el
+# cliente. SQLite busca los nombres sin esquema primero en temp, así que las
+# consultas de siempre (reportes, exportar, mis_compras) leen las dos partes
+# sin cambios. Si el rango no toca meses archivados no hace nada. Los rangos
+# son en segundos unix (ventas.fecha_ts, cambios_stock.solicitud_ts) y los
+# meses, en hora local.
+#
+# Los meses archivados se copian a tablas TEMP de la conexión (archivo_ventas,
+# ...) y se reusan mientras el archivador no les agregue filas. La caché tiene
+# tope: al salir de cada bloque se sacan los meses que no se usaron en
+# CACHE_TTL segundos y, si quedan más de MESES_EN_CACHE, los usados hace más
+# tiempo. Las conexiones del pool viven lo que el proceso, así que sin tope
+# una conexión terminaría con todo el archivo copiado en memoria.
+#
+# Las sentencias fijas están en repositorio.CONSULTAS; acá quedan las que se
+# arman por tabla (DDL copiado de la base, columnas comunes con un mes viejo)
+# y los ATTACH / PRAGMA.
+#
+# migrar() lleva los meses archivados antes de una migración a las columnas
+# de la base (y completa sus marcas de tiempo); tiendas.migrar_todas la
+# corre con cada migración.
+#
+# Cada tienda (tiendas.py) archiva en su propio directorio; sin `directorio`
+# se usa el de la tienda en curso.
+import json
+import os
+import re
+import sqlite3
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+import conexion
+import escritor
+import repositorio
+import tiendas
+
+DIAS_ARCHIVO = 365
+TAMANO_LOTE = 500
+INTERVALO = 24 * 3600
+PAGINAS_POR_PASO = 1000   # páginas que devuelve cada paso de incremental_vacuum
+PAUSA_PASOS = 0.05
+LIMITE_ANALISIS = 1000    # filas por índice que mira ANALYZE (PRAGMA analysis_limit)
+MESES_EN_CACHE = 24       # meses archivados copiados por conexión, como máximo
+CACHE_TTL = 15 * 60       # segundos sin usar tras los que un mes sale de la caché
+
+TABLAS = ("ventas", "venta_items", "cambios_stock")
+
+# Índices de las bases de archivo (las tablas se copian de la principal)
+INDICES = [
+    "DROP INDEX IF EXISTS arch.idx_ventas_fecha",
+    "DROP INDEX IF EXISTS arch.idx_cambios_fecha",
+    "CREATE INDEX IF NOT EXISTS arch.idx_ventas_fecha_ts ON ventas(fecha_ts)",
+    "CREATE INDEX IF NOT EXISTS arch.idx_ventas_usuario ON ventas(usuario_id)",
+    "CREATE INDEX IF NOT EXISTS arch.idx_venta_items_venta ON venta_items(venta_id)",
+    "CREATE INDEX IF NOT EXISTS arch.idx_cambios_solicitud_ts ON cambios_stock(solicitud_ts)",
+]
+
+# Índices de la caché de meses archivados de cada conexión (ver con_archivo)
+INDICES_CACHE = {"ventas": ("fecha_ts", "usuario_id"), "venta_items": ("venta_id",), "cambios_stock": ("solicitud_ts",)}
+
+
+def dias_archivo(conn):
+    try: dias = repositorio.valor(conn, "dias_archivo")
+    except sqlite3.OperationalError: dias = None
+    return DIAS_ARCHIVO if dias is None else dias
+
+
+def _directorio(directorio):
+    return directorio or tiendas.ruta("archivo")
+
+
+def ruta_mes(mes, directorio=None):
+    return os.path.join(_directorio(directorio), f"{mes}.db")
+
+
+def _columnas(conn, esquema, tabla):
+    return [fila[1] for fila in conn.execute(f"PRAGMA {esquema}.table_info({tabla})")]
+
+
+def _preparar(conn):
+    """Crea en `arch` las tablas que falten (con el DDL de la principal) y les agrega las columnas nuevas."""
+    for tabla in TABLAS:
+        existentes = _columnas(conn, "arch", tabla)
+        if not existentes:
+            ddl = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (tabla,)).fetchone()[0]
+            conn.execute(re.sub(r'^CREATE TABLE\s+(IF NOT EXISTS\s+)?"?\w+"?', f"CREATE TABLE arch.{tabla}", ddl))
+            continue
+        for _, columna, tipo, *_ in conn.execute(f"PRAGMA main.table_info({tabla})"):
+            if columna not in existentes:
+                conn.execute(f"ALTER TABLE arch.{tabla} ADD COLUMN {columna} {tipo}")
+    for sql in INDICES:
+        conn.execute(sql)
+
+
+def _copiar(conn, tabla, donde, ids):
+    columnas = ", ".join(_columnas(conn, "main", tabla))
+    conn.execute(f"INSERT OR IGNORE INTO arch.{tabla} ({columnas}) SELECT {columnas} FROM main.{tabla} "
+                 f"WHERE {donde} IN (SELECT value FROM json_each(?))", (ids,))
+
+
+def _borrar_ventas(conn, mes, ids):
+    """Unidad del escritor: saca de la base las ventas ya copiadas y anota los totales del mes."""
+    # Lo que el panel suma de todo el historial se acumula antes de borrar, en la misma transacción
+    repositorio.ejecutar(conn, "archivo_sumar_productos", (ids,))
+    totales = repositorio.uno(conn, "archivo_totales_lote", (ids,))
+    repositorio.ejecutar(conn, "archivo_anotar_clientes", (mes, ids))
+    repositorio.ejecutar(conn, "archivo_borrar_items", (ids,))
+    movidas = repositorio.ejecutar(conn, "archivo_borrar_ventas", (ids,)).rowcount
+    repositorio.ejecutar(conn, "archivo_sumar_mes_ventas", (mes, movidas, totales.completadas, totales.ingresos))
+    return movidas
+
+
+def _borrar_cambios(conn, mes, ids):
+    """Unidad del escritor: saca de la base los cambios ya copiados y los cuenta en el mes."""
+    movidos = repositorio.ejecutar(conn, "archivo_borrar_cambios", (ids,)).rowcount
+    repositorio.ejecutar(conn, "archivo_sumar_mes_cambios", (mes, movidos))
+    return movidos
+
+
+def _mover_ventas(conn, db_path, mes, ids):
+    _copiar(conn, "ventas", "id", ids)
+    _copiar(conn, "venta_items", "venta_id", ids)
+    conn.commit()
+    return escritor.ejecutar(db_path, _borrar_ventas, mes, ids)
+
+
+def _mover_cambios(conn, db_path, mes, ids):
+    _copiar(conn, "cambios_stock", "id", ids)
+    conn.commit()
+    return escritor.ejecutar(db_path, _borrar_cambios, mes, ids)
+
+
+def _mover(conn, db_path, mover, filas, directorio):
+    """Mueve un lote de (id, mes), un mes adjunto por vez. Devuelve (filas movidas, meses)."""
+    por_mes = defaultdict(list)
+    for id_, mes in filas: por_mes[mes].append(id_)
+    total = 0
+    for mes, ids in por_mes.items():
+        conn.execute("ATTACH DATABASE ? AS arch", (ruta_mes(mes, directorio),))
+        try:
+            _preparar(conn)
+            total += mover(conn, db_path, mes, json.dumps(ids))
+        finally:
+            conn.rollback()
+            conn.execute("DETACH DATABASE arch")
+    return total, set(por_mes)
+
+
+def _vaciar_paso(conn):
+    """Unidad del escritor: devuelve al sistema hasta PAGINAS_POR_PASO páginas libres. Devuelve las que quedan."""
+    libres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # sqlite3 da un solo paso por execute, y cada paso de incremental_vacuum libera una página
+    for _ in range(min(libres, PAGINAS_POR_PASO)): conn.execute("PRAGMA incremental_vacuum(1)")
+    return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def _analizar(conn):
+    conn.execute(f"PRAGMA analysis_limit = {LIMITE_ANALISIS}")
+    conn.execute("ANALYZE")
+
+
+def _compactar(conn, db_path, meses, directorio):
+    """Devuelve al sistema las páginas liberadas, de a PAGINAS_POR_PASO por unidad del escritor (entre
+    paso y paso entran las escrituras de la app), y actualiza las estadísticas del planificador. Una base
+    que no está en auto_vacuum incremental reusa sus páginas libres sin achicarse; convertirla reescribe
+    el archivo entero y se hace aparte, con la app detenida (python archivo.py --convertir)."""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        libres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        while libres:
+            antes, libres = libres, escritor.ejecutar(db_path, _vaciar_paso)
+            if libres >= antes: break
+            time.sleep(PAUSA_PASOS)
+    escritor.ejecutar(db_path, _analizar)
+    # Las bases de los meses no son de la app: se analizan con su propia conexión
+    for mes in meses:
+        archivo = sqlite3.connect(ruta_mes(mes, directorio))
+        try: archivo.execute("ANALYZE")
+        finally: archivo.close()
+
+
+def archivar(db_path, dias=None, lote=TAMANO_LOTE, directorio=None):
+    """Mueve al archivo las ventas cerradas y los cambios resueltos más viejos que `dias`
+    (por defecto config_empresa.dias_archivo). Devuelve {"ventas", "cambios", "meses"}."""
+    directorio = _directorio(directorio)
+    os.makedirs(directorio, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        if dias is None: dias = dias_archivo(conn)
+        limite = int(time.time()) - dias * 86400
+        # La tabla de pedidos de cancelación la crea conexion.crear_tablas: una base sin ella no tiene pendientes
+        cerradas = "archivo_ventas_cerradas_sin_pedidos" if repositorio.valor(conn, "tabla_existe", ("cancelaciones",)) \
+            else "archivo_ventas_cerradas"
+        resultado, meses = {"ventas": 0, "cambios": 0}, set()
+        for clave, consulta, mover in (("ventas", cerradas, _mover_ventas),
+                                       ("cambios", "archivo_cambios_resueltos", _mover_cambios)):
+            while True:
+                filas = repositorio.todos(conn, consulta, (limite, lote))
+                if not filas: break
+                movidas, tocados = _mover(conn, db_path, mover, filas, directorio)
+                resultado[clave] += movidas
+                meses |= tocados
+        if meses: _compactar(conn, db_path, meses, directorio)
+        return {**resultado, "meses": sorted(meses)}
+    finally:
+        conn.close()
+
+
+# --- Lectura ---
+
+def meses_archivados(conn, inicio=None, fin=None, usuario_id=None):
+    """Meses ('AAAA-MM') archivados que pueden tener filas de [inicio, fin) (segundos unix) o del cliente."""
+    try:
+        if usuario_id is not None:
+            filas = repositorio.todos(conn, "archivo_meses_de_cliente", (usuario_id,))
+        else:
+            filas = repositorio.todos(conn, "archivo_meses")
+        meses = [f.mes for f in filas]
+    except sqlite3.OperationalError:
+        return []  # base (o copia de analítica) anterior a la migración
+    desde = datetime.fromtimestamp(inicio).strftime("%Y-%m") if inicio else None
+    hasta = datetime.fromtimestamp(fin - 1).strftime("%Y-%m") if fin else None
+    return [m for m in meses if (not desde or m >= desde) and (not hasta or m <= hasta)]
+
+
+def _preparar_cache(conn, tabla):
+    """temp.archivo_<tabla>: caché de los meses archivados leídos por esta conexión, con las columnas
+    de la base más `mes`. Si la base cambió de columnas (migración) se rehace vacía. Devuelve las columnas."""
+    columnas = _columnas(conn, "main", tabla)
+    if _columnas(conn, "temp", f"archivo_{tabla}") != columnas + ["mes"]:
+        conn.execute(f"DROP TABLE IF EXISTS temp.archivo_{tabla}")
+        conn.execute(f"CREATE TEMP TABLE archivo_{tabla} AS SELECT *, '' AS mes FROM main.{tabla} WHERE 0")
+        conn.execute(f"CREATE UNIQUE INDEX temp.idx_archivo_{tabla}_id ON archivo_{tabla}(id)")
+        for columna in ("mes", *INDICES_CACHE[tabla]):
+            conn.execute(f"CREATE INDEX temp.idx_archivo_{tabla}_{columna} ON archivo_{tabla}({columna})")
+        repositorio.ejecutar(conn, "archivo_cache_olvidar_tabla", (tabla,))
+    return columnas
+
+
+def _cargar(conn, tablas, meses, directorio):
+    """Copia a la caché de la conexión los meses que todavía no tiene o que el archivador tocó desde
+    la última carga (cambiaron sus totales en archivo_meses). Devuelve {tabla: columnas}."""
+    repositorio.ejecutar(conn, "archivo_cache_crear")
+    columnas = {tabla: _preparar_cache(conn, tabla) for tabla in tablas}
+    estados = dict(repositorio.todos(conn, "archivo_estados"))
+    cargados = {(f.tabla, f.mes): f.estado for f in repositorio.todos(conn, "archivo_cache_cargados")}
+    ahora = time.time()
+    for mes in meses:
+        faltan = [t for t in tablas if cargados.get((t, mes)) != estados.get(mes)]
+        ruta = ruta_mes(mes, directorio)
+        if not faltan or not os.path.exists(ruta): continue
+        conn.execute("ATTACH DATABASE ? AS arch", (ruta,))
+        try:
+            for tabla in faltan:
+                # Un mes archivado antes de una migración puede no tener las columnas nuevas. Las filas que
+                # siguen también en la base (archivador cortado entre la copia y el borrado) se leen de ahí.
+                comunes = ", ".join(c for c in _columnas(conn, "arch", tabla) if c in columnas[tabla])
+                conn.execute(f"DELETE FROM temp.archivo_{tabla} WHERE mes = ?", (mes,))
+                conn.execute(f"""INSERT OR IGNORE INTO temp.archivo_{tabla} ({comunes}, mes) SELECT {comunes}, ? FROM arch.{tabla} a
+                                 WHERE NOT EXISTS (SELECT 1 FROM main.{tabla} m WHERE m.id = a.id)""", (mes,))
+                repositorio.ejecutar(conn, "archivo_cache_anotar", (tabla, mes, estados.get(mes), ahora))
+            conn.commit()
+        finally:
+            conn.rollback()
+            conn.execute("DETACH DATABASE arch")
+    repositorio.ejecutar(conn, "archivo_cache_usar", (ahora, json.dumps(meses)))
+    conn.commit()
+    return columnas
+
+
+def _podar(conn, tope=None, ttl=None):
+    """Saca de la caché de la conexión los meses vencidos y los que pasan el tope. Si queda vacía,
+    borra las tablas (así la memoria de temp vuelve a cero)."""
+    tope = MESES_EN_CACHE if tope is None else tope
+    vence = time.time() - (CACHE_TTL if ttl is None else ttl)
+    try:
+        for fila in repositorio.todos(conn, "archivo_cache_sobrantes", {"vence": vence, "tope": tope}):
+            for tabla in TABLAS:
+                if _columnas(conn, "temp", f"archivo_{tabla}"):
+                    conn.execute(f"DELETE FROM temp.archivo_{tabla} WHERE mes = ?", (fila.mes,))
+            repositorio.ejecutar(conn, "archivo_cache_olvidar_mes", (fila.mes,))
+        if not repositorio.todos(conn, "archivo_cache_cargados"):
+            for tabla in TABLAS:
+                conn.execute(f"DROP TABLE IF EXISTS temp.archivo_{tabla}")
+            repositorio.ejecutar(conn, "archivo_cache_borrar")
+        conn.commit()
+    finally:
+        conn.rollback()
+
+
+def _vista(conn, tabla, columnas, donde_base, donde_archivo):
+    """temp.<tabla>: la tabla de la base y la caché de archivo, cada una filtrada con su índice."""
+    lista = ", ".join(columnas)
+    conn.execute(f"""CREATE TEMP VIEW {tabla} AS
+        SELECT {lista} FROM main.{tabla} WHERE {donde_base}
+        UNION ALL SELECT {lista} FROM temp.archivo_{tabla} WHERE {donde_archivo}""")
+
+
+@contextmanager
+def con_archivo(conn, inicio=None, fin=None, usuario_id=None, tablas=("ventas",), directorio=None):
+    """Dentro del bloque, ventas/venta_items (y cambios_stock si está en `tablas`) de `conn` incluyen
+    las filas archivadas de [inicio, fin) o del cliente. Las vistas solo tienen esas filas: las
+    consultas del bloque deben filtrar por el mismo rango o cliente. Usar fuera de una transacción."""
+    meses = meses_archivados(conn, inicio, fin, usuario_id)
+    if not meses:
+        yield conn
+        return
+    tablas = (["ventas", "venta_items"] if "ventas" in tablas else []) \
+        + (["cambios_stock"] if "cambios_stock" in tablas and usuario_id is None else [])
+    creadas = []
+    try:
+        columnas = _cargar(conn, tablas, meses, directorio)
+        # Los límites van en el texto de la vista (no admite parámetros): así cada parte del UNION ALL usa su índice
+        if "ventas" in columnas:
+            condiciones = ([f"fecha_ts >= {int(inicio)}"] if inicio else []) + ([f"fecha_ts < {int(fin)}"] if fin else []) \
+                + ([f"usuario_id = {int(usuario_id)}"] if usuario_id is not None else [])
+            donde = " AND ".join(condiciones) or "1"
+            creadas.append("ventas")
+            _vista(conn, "ventas", columnas["ventas"], donde, donde)
+            creadas.append("venta_items")
+            _vista(conn, "venta_items", columnas["venta_items"], f"venta_id IN (SELECT id FROM main.ventas WHERE {donde})",
+                   f"venta_id IN (SELECT id FROM temp.archivo_ventas WHERE {donde})")
+        if "cambios_stock" in columnas:
+            condiciones = ([f"solicitud_ts >= {int(inicio)}"] if inicio else []) \
+                + ([f"solicitud_ts < {int(fin)}"] if fin else [])
+            creadas.append("cambios_stock")
+            _vista(conn, "cambios_stock", columnas["cambios_stock"], " AND ".join(condiciones) or "1",
+                   " AND ".join(condiciones) or "1")
+        yield conn
+    finally:
+        for tabla in creadas:
+            conn.execute(f"DROP VIEW IF EXISTS temp.{tabla}")
+        _podar(conn)
+
+
+def migrar(db_path, directorio=None):
+    """Agrega a cada mes archivado las columnas nuevas de la base y completa sus marcas de tiempo
+    (conexion.rellenar_marcas, en lotes). Devuelve cuántas marcas completó."""
+    directorio = _directorio(directorio)
+    if not os.path.isdir(directorio): return 0
+    conn = sqlite3.connect(db_path, timeout=30)
+    total = 0
+    try:
+        for nombre in sorted(os.listdir(directorio)):
+            if not re.fullmatch(r"\d{4}-\d{2}\.db", nombre): continue
+            conn.execute("ATTACH DATABASE ? AS arch", (os.path.join(directorio, nombre),))
+            try:
+                _preparar(conn)
+                total += conexion.rellenar_marcas(conn, "arch")
+                conn.commit()
+            finally:
+                conn.rollback()
+                conn.execute("DETACH DATABASE arch")
+        return total
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Archiva ventas y cambios de stock viejos en bases mensuales")
+    parser.add_argument("--dias", type=int, help="antigüedad mínima (por defecto config_empresa.dias_archivo)")
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE, help="filas por transacción")
+    parser.add_argument("--convertir", action="store_true",
+                        help="solo pasar la base a auto_vacuum incremental (VACUUM completo: con la app detenida)")
+    args = parser.parse_args()
+    DB_PATH = tiendas.ruta()
+    if args.convertir:
+        print("🧹 Base convertida a auto_vacuum incremental" if conexion.convertir_auto_vacuum(DB_PATH)
+              else "✅ La base ya estaba en auto_vacuum incremental")
+        raise SystemExit
+    conexion.migrar_esquema(DB_PATH)
+    migrar(DB_PATH)
+    r = archivar(DB_PATH, args.dias, args.lote)
+    print(f"🗄️ {r['ventas']} ventas y {r['cambios']} cambios de stock archivados"
+          + (f" en {', '.join(r['meses'])}" if r["meses"] else ""))
@@ -0,0 +1,9 @@
+# asgi.py
+# Entrada ASGI: la capa async de api_async.py (carrito y stock) delante de
+# la app Flask, que sigue atendiendo todas las demás rutas. Cada pedido usa
+# la base de su tienda (ver tiendas.py).
+#   Producción:  uvicorn asgi:app --workers 4
+from app import crear_app, load_user
+import api_async
+
+app = api_async.montar(crear_app(), cargar_usuario=load_user)
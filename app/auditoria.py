@@ -0,0 +1,121 @@
+# auditoria.py
+# Registro de auditoría (tabla acciones_admin) sin escrituras en el request.
+# Las rutas llaman a registrar(), que solo encola el evento en memoria; un
+# hilo escritor lo vuelca a SQLite en lotes (una transacción por lote) cada
+# INTERVALO segundos, o antes si se juntan TAMANO_LOTE eventos. Al cerrar el
+# proceso se vacía lo pendiente. Si la cola se llena (base caída o muy
+# lenta) los eventos nuevos se descartan y se cuentan en metricas().
+# Cada lote es una unidad del escritor de la base (escritor.py), como las
+# escrituras de las rutas: nunca compite con ellas por el lock.
+# Cada evento va a la base de la tienda en curso (tiendas.py); un lote con
+# eventos de varias tiendas se escribe con una transacción por base.
+import atexit
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import escritor
+import repositorio
+import tiendas
+
+INTERVALO = 1.0
+TAMANO_LOTE = 500
+MAX_EN_COLA = 10000
+
+log = logging.getLogger("verduleria.auditoria")
+
+_cola = queue.Queue(maxsize=MAX_EN_COLA)
+_lock_metricas = threading.Lock()  # las suben los requests (descartados) y el hilo escritor
+_metricas = {"escritos": 0, "descartados": 0, "lotes": 0, "ultimo_lote_ms": None, "ultimo_error": None}
+_escritor = None
+
+
+def registrar(admin_id, accion, **detalle):
+    """Encola un evento. No bloquea ni toca la base."""
+    evento = (tiendas.ruta(), admin_id, accion, json.dumps(detalle, ensure_ascii=False, default=str),
+              datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    try:
+        _cola.put_nowait(evento)
+    except queue.Full:
+        with _lock_metricas: _metricas["descartados"] += 1
+        return
+    if _escritor is not None and _cola.qsize() >= TAMANO_LOTE:
+        _escritor.despertar.set()
+
+
+def _tomar_lote():
+    lote = []
+    while len(lote) < TAMANO_LOTE:
+        try: lote.append(_cola.get_nowait())
+        except queue.Empty: break
+    return lote
+
+
+def _escribir(db_path, eventos):
+    inicio = time.perf_counter()
+    escritor.ejecutar(db_path, repositorio.ejecutar_muchos, "registrar_acciones", eventos)
+    with _lock_metricas:
+        _metricas["escritos"] += len(eventos)
+        _metricas["lotes"] += 1
+        _metricas["ultimo_lote_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+
+
+def vaciar():
+    """Escribe todo lo pendiente. Devuelve cuántos eventos escribió."""
+    total = 0
+    while True:
+        lote = _tomar_lote()
+        if not lote: return total
+        por_base = defaultdict(list)
+        for db_path, *evento in lote: por_base[db_path].append(evento)
+        fallo = False
+        for db_path, eventos in por_base.items():
+            try:
+                _escribir(db_path, eventos)
+                total += len(eventos)
+            except (sqlite3.Error, escritor.ColaLlena) as e:
+                # Se pierden estos eventos, pero no se traba la cola ni el request
+                with _lock_metricas:
+                    _metricas["descartados"] += len(eventos)
+                    _metricas["ultimo_error"] = str(e)
+                log.error("No se pudo escribir un lote de auditoría en %s (%d eventos): %s", db_path, len(eventos), e)
+                fallo = True
+        if fallo: return total
+
+
+class Escritor(threading.Thread):
+    def __init__(self):
+        super().__init__(name="auditoria", daemon=True)
+        self.despertar = threading.Event()
+        self._detener = threading.Event()
+
+    def run(self):
+        while not self._detener.is_set():
+            self.despertar.wait(INTERVALO)
+            self.despertar.clear()
+            vaciar()
+
+    def detener(self):
+        self._detener.set()
+        self.despertar.set()
+        self.join(timeout=5)
+        vaciar()
+
+
+def iniciar():
+    global _escritor
+    if _escritor is None:
+        _escritor = Escritor()
+        _escritor.start()
+        atexit.register(_escritor.detener)
+    return _escritor
+
+
+def metricas():
+    with _lock_metricas: copia = dict(_metricas)
+    return {"en_cola": _cola.qsize(), "max_en_cola": MAX_EN_COLA, **copia}
@@ -0,0 +1,123 @@
+# bench_api_async.py
+# Benchmark de las APIs de carrito y stock: camino WSGI (Flask con un pool
+# de hilos, como gunicorn --threads) contra la capa ASGI de api_async.py.
+# Corre en el proceso, sin servidor HTTP: los dos caminos reciben los
+# mismos requests (GET /api/stock/<id> y GET /api/carrito con sesión) y se
+# mide throughput, latencia y hilos usados con N clientes concurrentes.
+#
+# Uso:
+#     python bench_api_async.py                  # 2000 clientes, 5 requests cada uno
+#     python bench_api_async.py -c 5000 -k 2 --hilos 16 --json
+import argparse
+import asyncio
+import json
+import sqlite3
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.test import EnvironBuilder
+
+import api_async
+from app import DB_PATH, crear_app, load_user
+
+
+def _rutas(producto_id):
+    return [f"/api/stock/{producto_id}", "/api/carrito"]
+
+
+def _resumen(latencias, total_s, hilos):
+    latencias.sort()
+    return {"requests": len(latencias), "total_s": round(total_s, 2), "req_s": round(len(latencias) / total_s),
+            "p50_ms": round(statistics.median(latencias) * 1000, 1),
+            "p99_ms": round(latencias[int(len(latencias) * 0.99) - 1] * 1000, 1), "hilos_pico": hilos}
+
+
+# En los dos caminos todos los clientes llegan a la vez y cada uno hace sus requests
+# de a uno; la latencia de cada request se cuenta desde que el cliente lo pide
+# (para el primero, el arranque), así incluye la espera por un hilo libre.
+
+def medir_wsgi(app, cookie, clientes, por_cliente, hilos, producto_id):
+    """Cada cliente ocupa un hilo del pool mientras lo atienden; el resto espera en la cola."""
+    rutas = _rutas(producto_id)
+    pico = [threading.active_count()]
+
+    def cliente(i, inicio):
+        latencias, pedido = [], inicio
+        for j in range(por_cliente):
+            environ = EnvironBuilder(path=rutas[(i + j) % len(rutas)], headers={"Cookie": cookie}).get_environ()
+            b"".join(app.wsgi_app(environ, lambda status, headers, exc_info=None: None))
+            pico[0] = max(pico[0], threading.active_count())
+            ahora = time.perf_counter()
+            latencias.append(ahora - pedido)
+            pedido = ahora
+        return latencias
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(hilos) as pool:
+        futuros = [pool.submit(cliente, i, inicio) for i in range(clientes)]
+        latencias = [l for f in futuros for l in f.result()]
+    return _resumen(latencias, time.perf_counter() - inicio, pico[0])
+
+
+def medir_asgi(app, cookie, clientes, por_cliente, producto_id):
+    """Los clientes son corrutinas: todos quedan en vuelo a la vez sin un hilo cada uno."""
+    capa = api_async.montar(app, DB_PATH, cargar_usuario=load_user)
+    rutas = _rutas(producto_id)
+    pico = [threading.active_count()]
+
+    async def receive(): return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(mensaje): pass
+
+    async def cliente(i, inicio):
+        latencias, pedido = [], inicio
+        for j in range(por_cliente):
+            scope = {"type": "http", "method": "GET", "path": rutas[(i + j) % len(rutas)], "query_string": b"",
+                     "scheme": "http", "headers": [(b"host", b"localhost"), (b"cookie", cookie.encode())]}
+            await capa(scope, receive, send)
+            pico[0] = max(pico[0], threading.active_count())
+            ahora = time.perf_counter()
+            latencias.append(ahora - pedido)
+            pedido = ahora
+        return latencias
+
+    async def todos(inicio):
+        return await asyncio.gather(*(cliente(i, inicio) for i in range(clientes)))
+
+    inicio = time.perf_counter()
+    latencias = [l for lote in asyncio.run(todos(inicio)) for l in lote]
+    return _resumen(latencias, time.perf_counter() - inicio, pico[0])
+
+
+def medir(clientes=2000, por_cliente=5, hilos=16):
+    app = crear_app({"TAREAS_EN_SEGUNDO_PLANO": False, "PRECALENTAR": False})
+    nombre = app.config["SESSION_COOKIE_NAME"]
+    with app.test_client() as c:
+        c.get("/carrito")  # crea la sesión
+        guardada = c.get_cookie(nombre)
+    cookie = f"{nombre}={guardada.value}" if guardada else ""
+    conn = sqlite3.connect(DB_PATH)
+    producto_id = conn.execute("SELECT id FROM productos WHERE activo = 1 LIMIT 1").fetchone()[0]
+    conn.close()
+    return {"clientes": clientes, "por_cliente": por_cliente, "hilos_wsgi": hilos,
+            "wsgi": medir_wsgi(app, cookie, clientes, por_cliente, hilos, producto_id),
+            "asgi": medir_asgi(app, cookie, clientes, por_cliente, producto_id)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark WSGI vs ASGI de las APIs de carrito y stock")
+    parser.add_argument("-c", type=int, default=2000, help="clientes concurrentes")
+    parser.add_argument("-k", type=int, default=5, help="requests por cliente")
+    parser.add_argument("--hilos", type=int, default=16, help="hilos del pool WSGI")
+    parser.add_argument("--json", action="store_true", help="imprime una línea JSON")
+    args = parser.parse_args()
+    r = medir(args.c, args.k, args.hilos)
+    if args.json:
+        print(json.dumps(r))
+    else:
+        print(f"👥 {r['clientes']} clientes x {r['por_cliente']} requests (pool WSGI de {r['hilos_wsgi']} hilos)")
+        for camino in ("wsgi", "asgi"):
+            m = r[camino]
+            print(f"   {camino.upper()}: {m['req_s']:6d} req/s  p50 {m['p50_ms']:7.1f} ms  p99 {m['p99_ms']:7.1f} ms"
+                  f"  hilos {m['hilos_pico']}")
@@ -0,0 +1,80 @@
+# bench_arranque.py
+# Benchmark de arranque de un worker: tiempo de import (python -X importtime),
+# tiempo de crear_app() y memoria residente, medido en procesos nuevos.
+#
+# Uso:
+#     python bench_arranque.py              # 5 corridas, resumen legible
+#     python bench_arranque.py -n 10 --json # una línea JSON para guardar el histórico
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+
+# Se ejecuta en un proceso nuevo: importa la app, la inicializa y reporta
+_SONDA = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+import app as modulo
+t1 = time.perf_counter()
+modulo.crear_app({"PRECALENTAR": True})
+t2 = time.perf_counter()
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+pesados = [m for m in ("xhtml2pdf", "reportlab", "html5lib", "requests", "PIL") if m in sys.modules]
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "crear_app_ms": (t2 - t1) * 1000,
+                  "rss_mb": rss_kb / 1024, "pesados_cargados": pesados}))
+"""
+
+
+def _importtime():
+    """Corre `import app` con -X importtime y devuelve {modulo: microsegundos acumulados}."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                          cwd=AQUI, capture_output=True, text=True, env={**os.environ, "PRECALENTAR": "0"})
+    acumulado = {}
+    for linea in proc.stderr.splitlines():
+        if not linea.startswith("import time:") or "cumulative" in linea: continue
+        _, _, resto = linea.partition(":")
+        _propio, total, modulo = (p.strip() for p in resto.split("|"))
+        acumulado[modulo.strip()] = int(total)
+    return acumulado
+
+
+def _sonda():
+    proc = subprocess.run([sys.executable, "-c", _SONDA], cwd=AQUI, capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def medir(corridas=5):
+    muestras = [_sonda() for _ in range(corridas)]
+    tiempos = _importtime()
+    top = sorted(((m, us) for m, us in tiempos.items() if m != "app"), key=lambda x: -x[1])[:10]
+    return {
+        "corridas": corridas,
+        "import_ms": round(statistics.median(m["import_ms"] for m in muestras), 1),
+        "crear_app_ms": round(statistics.median(m["crear_app_ms"] for m in muestras), 1),
+        "rss_mb": round(statistics.median(m["rss_mb"] for m in muestras), 1),
+        "importtime_app_ms": round(tiempos.get("app", 0) / 1000, 1),
+        "pesados_cargados": muestras[-1]["pesados_cargados"],
+        "top_imports_ms": [(m, round(us / 1000, 1)) for m, us in top],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de arranque de la app")
+    parser.add_argument("-n", type=int, default=5, help="cantidad de procesos a medir")
+    parser.add_argument("--json", action="store_true", help="imprime una línea JSON")
+    args = parser.parse_args()
+    r = medir(args.n)
+    if args.json:
+        print(json.dumps(r))
+    else:
+        print(f"⏱️ import app: {r['import_ms']} ms (importtime: {r['importtime_app_ms']} ms)")
+        print(f"🔥 crear_app(): {r['crear_app_ms']} ms")
+        print(f"💾 RSS por worker: {r['rss_mb']} MB")
+        print(f"📦 Dependencias pesadas cargadas al arrancar: {', '.join(r['pesados_cargados']) or 'ninguna'}")
+        print("🐢 Imports más lentos:")
+        for modulo, ms in r["top_imports_ms"]:
+            print(f"   {ms:8.1f} ms  {modulo}")
@@ -0,0 +1,195 @@
+# cache.py
+# Cache con versiones por espacio de nombres.
+# Cada escritura que cambia datos llama a invalidar("catalogo", ...) y las
+# entradas cacheadas con una version anterior dejan de ser validas.
+#
+# Hay dos modos (configurar(), o la variable CACHE_BACKEND):
+# - "memoria" (por defecto): todo en el proceso, para desarrollo con un worker.
+# - "compartido[:directorio]": para varios workers en el mismo servidor.
+#   Las versiones viven en un archivo mapeado en memoria (un contador de
+#   8 bytes por espacio), así una invalidación en un worker la ven todos en
+#   la próxima lectura; los valores se comparten en un SQLite con TTL y
+#   desalojo LRU. Cada worker conserva además su copia local (LRU) para no
+#   ir a disco en cada hit.
+#
+# Con varias tiendas (tiendas.py) cada espacio es propio de la tienda en
+# curso: invalidar("catalogo") en una no toca el catálogo de las otras.
+import os
+import pickle
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import tiendas
+
+MAX_ENTRADAS_LOCAL = 512
+MAX_ENTRADAS_COMPARTIDAS = 5000
+RANURAS = 64
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+_lock = threading.Lock()
+_entradas = OrderedDict()
+_FALTA = object()
+
+
+class VersionesLocales:
+    def __init__(self):
+        self._versiones = {}
+
+    def leer(self, espacio):
+        return self._versiones.get(espacio, 0)
+
+    def subir(self, espacios):
+        with _lock:
+            for espacio in espacios:
+                self._versiones[espacio] = self._versiones.get(espacio, 0) + 1
+
+
+class VersionesCompartidas:
+    """Contadores en un archivo mapeado en memoria. Cada espacio va a una ranura por hash;
+    si dos comparten ranura, invalidar uno invalida también el otro (solo cuesta un recálculo)."""
+
+    def __init__(self, path):
+        import fcntl, mmap  # solo POSIX; el modo compartido es para los servidores Linux
+        self._fcntl = fcntl
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < RANURAS * 8:
+            os.ftruncate(self._fd, RANURAS * 8)
+        self._mm = mmap.mmap(self._fd, RANURAS * 8)
+
+    def _ranura(self, espacio):
+        return (zlib.crc32(espacio.encode()) % RANURAS) * 8
+
+    def leer(self, espacio):
+        return struct.unpack_from("<Q", self._mm, self._ranura(espacio))[0]
+
+    def subir(self, espacios):
+        # El lock del archivo serializa los incrementos entre procesos; las lecturas no lo necesitan
+        self._fcntl.flock(self._fd, self._fcntl.LOCK_EX)
+        try:
+            for espacio in espacios:
+                ranura = self._ranura(espacio)
+                struct.pack_into("<Q", self._mm, ranura, struct.unpack_from("<Q", self._mm, ranura)[0] + 1)
+        finally:
+            self._fcntl.flock(self._fd, self._fcntl.LOCK_UN)
+
+
+class AlmacenSQLite:
+    """Valores (pickle) compartidos entre procesos, con vencimiento y desalojo por último uso."""
+
+    def __init__(self, path, max_entradas=MAX_ENTRADAS_COMPARTIDAS):
+        self.path = path
+        self.max_entradas = max_entradas
+        self._local = threading.local()
+        self._escrituras = 0
+        conn = self._conn()
+        conn.execute("""CREATE TABLE IF NOT EXISTS entradas (
+            clave TEXT PRIMARY KEY, version INTEGER NOT NULL, expira REAL NOT NULL, usado REAL NOT NULL, valor BLOB NOT NULL)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entradas_usado ON entradas(usado)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # es un cache: perderlo ante un corte no importa
+            self._local.conn = conn
+        return conn
+
+    def leer(self, clave, version, ahora):
+        """(expira, valor) si hay una entrada vigente de esa versión; si no _FALTA."""
+        conn = self._conn()
+        fila = conn.execute("SELECT expira, valor FROM entradas WHERE clave = ? AND version = ? AND expira > ?",
+                            (clave, version, ahora)).fetchone()
+        if fila is None: return _FALTA
+        conn.execute("UPDATE entradas SET usado = ? WHERE clave = ?", (ahora, clave))
+        return fila[0], pickle.loads(fila[1])
+
+    def escribir(self, clave, version, expira, valor):
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO entradas (clave, version, expira, usado, valor) VALUES (?, ?, ?, ?, ?)",
+                     (clave, version, expira, time.time(), pickle.dumps(valor, pickle.HIGHEST_PROTOCOL)))
+        self._escrituras += 1
+        if self._escrituras % 100 == 0: self.desalojar()
+
+    def desalojar(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM entradas WHERE expira <= ?", (time.time(),))
+        conn.execute("""DELETE FROM entradas WHERE clave IN (
+            SELECT clave FROM entradas ORDER BY usado LIMIT max(0, (SELECT COUNT(*) FROM entradas) - ?))""",
+                     (self.max_entradas,))
+
+    def vaciar(self):
+        self._conn().execute("DELETE FROM entradas")
+
+
+_versiones = VersionesLocales()
+_almacen = None
+
+
+def configurar(tipo=None):
+    """'memoria' o 'compartido[:directorio]'; por defecto lee CACHE_BACKEND. Vacía la copia local."""
+    global _versiones, _almacen
+    tipo = tipo or os.getenv("CACHE_BACKEND", "memoria")
+    if tipo.startswith("compartido"):
+        _, _, directorio = tipo.partition(":")
+        directorio = directorio or DIRECTORIO
+        _versiones = VersionesCompartidas(os.path.join(directorio, "cache_versiones.bin"))
+        _almacen = AlmacenSQLite(os.path.join(directorio, "cache_compartido.db"))
+    else:
+        _versiones, _almacen = VersionesLocales(), None
+    with _lock:
+        _entradas.clear()
+
+
+def version(espacio):
+    """Version actual de un espacio de nombres (catalogo, ventas, ...)."""
+    return _versiones.leer(tiendas.con_prefijo(espacio))
+
+
+def invalidar(*espacios):
+    """Sube la version de cada espacio; se llama una vez por transaccion."""
+    _versiones.subir([tiendas.con_prefijo(e) for e in espacios])
+
+
+def _guardar_local(clave, ver, expira, valor):
+    with _lock:
+        _entradas[clave] = (ver, expira, valor)
+        _entradas.move_to_end(clave)
+        while len(_entradas) > MAX_ENTRADAS_LOCAL:
+            _entradas.popitem(last=False)
+
+
+def obtener_o_calcular(espacio, clave, calcular, ttl=60):
+    """Devuelve el valor cacheado para (espacio, clave) o lo calcula."""
+    ver = version(espacio)
+    espacio = tiendas.con_prefijo(espacio)
+    ahora = time.time()
+    k = (espacio, clave)
+    with _lock:
+        entrada = _entradas.get(k)
+        if entrada and entrada[0] == ver and entrada[1] > ahora:
+            _entradas.move_to_end(k)
+            return entrada[2]
+    if _almacen is not None:
+        try: encontrado = _almacen.leer(f"{espacio}:{clave!r}", ver, ahora)
+        except sqlite3.Error: encontrado = _FALTA
+        if encontrado is not _FALTA:
+            _guardar_local(k, ver, *encontrado)
+            return encontrado[1]
+    valor = calcular()
+    _guardar_local(k, ver, ahora + ttl, valor)
+    if _almacen is not None:
+        # Lo que no se puede serializar (o si la base está ocupada) queda solo en la copia local
+        try: _almacen.escribir(f"{espacio}:{clave!r}", ver, ahora + ttl, valor)
+        except (sqlite3.Error, pickle.PicklingError, TypeError, AttributeError): pass
+    return valor
+
+
+def limpiar():
+    with _lock:
+        _entradas.clear()
+    if _almacen is not None: _almacen.vaciar()
@@ -0,0 +1,63 @@
+# cancelaciones.py
+# Cancelación de ventas con reposición de stock por conjuntos.
+# La ventana de cancelación sale de config_empresa.minutos_cancelacion
+# (10 minutos por defecto, como antes) y un barrido periódico marca
+# ventas.cancelable = 0 cuando vence, así mis_compras solo lee la columna en
+# vez de recalcular fechas. La ventana se compara con ventas.fecha_ts
+# (segundos unix, índice idx_ventas_cancelables_ts). Las sentencias están en
+# repositorio.CONSULTAS.
+import json
+import time
+
+import repositorio
+
+TAMANO_LOTE = 1000
+
+
+VENTANA_MINUTOS = 10
+
+
+def ventana_minutos(conn):
+    minutos = repositorio.valor(conn, "minutos_cancelacion")
+    return VENTANA_MINUTOS if minutos is None else minutos
+
+
+def limite_cancelacion(conn):
+    """Marca (segundos unix, comparable con ventas.fecha_ts) antes de la cual ya no se puede cancelar."""
+    return int(time.time()) - ventana_minutos(conn) * 60
+
+
+def cancelar_ventas(conn, venta_ids, usuario_id=None, limite=None):
+    """Cancela las ventas 'completada' indicadas y repone su stock en una sola transacción.
+
+    Con `usuario_id` solo cancela ventas de ese cliente; con `limite` solo las
+    posteriores a esa marca (ventana de cancelación). No hace commit.
+    Devuelve la lista de ids cancelados. La reposición es una diferencia sobre el
+    stock actual y sube la versión del producto (las aprobaciones pendientes se reajustan).
+    """
+    ids = sorted({int(i) for i in venta_ids})
+    if not ids: return []
+    canceladas = [f[0] for f in repositorio.todos(conn, "cancelar_ventas", {
+        "ids": json.dumps(ids), "usuario_id": usuario_id, "limite": limite})]
+    if not canceladas: return []
+    repositorio.ejecutar(conn, "reponer_stock_de_ventas", {"ids": json.dumps(canceladas)})
+    return canceladas
+
+
+def marcar_vencidas(conn, limite):
+    """Un lote del barrido: marca hasta TAMANO_LOTE ventas anteriores a `limite`. Devuelve cuántas. No hace commit."""
+    return repositorio.ejecutar(conn, "marcar_no_cancelables", (limite, TAMANO_LOTE)).rowcount
+
+
+def barrer_vencidas(conn, escribir=None):
+    """Marca como no cancelables las ventas fuera de la ventana, en lotes. Devuelve cuántas marcó.
+    Con `escribir` (app.escribir) cada lote es una unidad del escritor; si no, se confirma en `conn`."""
+    limite = limite_cancelacion(conn)
+    total = 0
+    while True:
+        if escribir: marcadas = escribir(marcar_vencidas, limite)
+        else:
+            marcadas = marcar_vencidas(conn, limite)
+            conn.commit()
+        total += marcadas
+        if marcadas < TAMANO_LOTE: return total
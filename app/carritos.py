@@ -0,0 +1,64 @@
+# carritos.py
+# Lógica de la API JSON del carrito, sin Flask.
+# El carrito es el dict que vive en la sesión ({"<producto_id>": {nombre,
+# precio, cantidad}}) y `reserva` la clave del carrito en la tabla
+# reservas. Las rutas de app.py (WSGI) y las de api_async.py (ASGI) llaman
+# a estas mismas funciones, así los dos caminos responden igual.
+# Cada función devuelve (cuerpo, status) y modifica `carrito` en el lugar;
+# el que llama guarda la sesión y hace el commit de `conn`.
+import repositorio
+import reservas
+
+
+def total_items(carrito):
+    return sum(i['cantidad'] for i in carrito.values())
+
+
+def resumen(carrito, usuario):
+    return {'success': True, 'carrito': carrito, 'total_items': total_items(carrito),
+            'total_precio': sum(i['cantidad'] * i['precio'] for i in carrito.values()), 'user': usuario or "Invitado"}
+
+
+def stock(conn, reserva, producto_id):
+    """Stock que puede llevar este carrito: el físico menos lo reservado por otros."""
+    return reservas.disponible(conn, int(producto_id), reserva or "")
+
+
+def agregar(conn, carrito, reserva, producto_id, cantidad):
+    prod = repositorio.uno(conn, "producto_para_carrito", (producto_id,))
+    if not prod: return {'success': False, 'error': 'Producto no existe'}, 404
+    key = str(producto_id)
+    nueva = carrito[key]['cantidad'] + cantidad if key in carrito else cantidad
+    if not reservas.reservar(conn, reserva, int(producto_id), nueva):
+        return {'success': False, 'error': 'Stock máximo alcanzado' if key in carrito else 'Stock insuficiente'}, 400
+    if key in carrito: carrito[key]['cantidad'] = nueva
+    else: carrito[key] = {'nombre': prod.nombre, 'precio': float(prod.precio), 'cantidad': cantidad}
+    return {'success': True, 'total_items': total_items(carrito),
+            'stock_actual': stock(conn, reserva, producto_id) - nueva, 'mensaje': f"Agregaste {prod.nombre}"}, 200
+
+
+def actualizar(conn, carrito, reserva, producto_id, cantidad):
+    key = str(producto_id)
+    if key not in carrito: return {'success': False, 'error': 'No encontrado'}, 404
+    if cantidad <= 0:
+        reservas.liberar(conn, reserva, int(producto_id))
+        del carrito[key]
+    else:
+        if not reservas.reservar(conn, reserva, int(producto_id), cantidad):
+            return {'success': False, 'error': 'Stock insuficiente'}, 400
+        carrito[key]['cantidad'] = cantidad
+    return {'success': True, 'total_items': total_items(carrito)}, 200
+
+
+def eliminar(conn, carrito, reserva, producto_id):
+    key = str(producto_id)
+    if key not in carrito: return {'success': False, 'error': 'No encontrado'}, 404
+    if reserva: reservas.liberar(conn, reserva, int(producto_id))
+    del carrito[key]
+    return {'success': True, 'total_items': total_items(carrito)}, 200
+
+
+def limpiar(conn, carrito, reserva):
+    if reserva: reservas.liberar(conn, reserva)
+    carrito.clear()
+    return {'success': True, 'total_items': 0}, 200
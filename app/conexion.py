@@ -4,13 +4,13 @@ from pathlib import Path
 
 DB_PATH = "inventario.db"
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH)
+def get_connection(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
     return conn
 
-def crear_tablas():
-    conn = get_connection()
+def crear_tablas(db_path=DB_PATH):
+    conn = get_connection(db_path)
     c = conn.cursor()
 
     # Roles con permisos como columnas (fácil de consultar)
@@ -190,21 +190,302 @@ def crear_tablas():
     conn.close()
 
 
-# --- Helpers utiles ---
-def obtener_usuario_por_username(username):
-    conn = get_connection()
-    u = conn.execute("SELECT u.*, r.nombre AS rol_nombre, r.puede_gestionar_stock, r.puede_vender, r.puede_aprobar_cancelaciones FROM usuarios u JOIN roles r ON u.rol_id = r.id WHERE username = ?", (username,)).fetchone()
-    conn.close()
-    return u
+# Las consultas de la app están en repositorio.py
 
-def obtener_rol_por_id(rol_id):
-    conn = get_connection()
-    r = conn.execute("SELECT * FROM roles WHERE id = ?", (rol_id,)).fetchone()
-    conn.close()
-    return r
+# --- Migraciones idempotentes ---
+# Las bases existentes se crearon con distintos scripts (init_db_mejorado,
+# init_completo, ...), así que acá solo se agregan índices, tablas y columnas
+# que falten. Se llama al arrancar la app.
 
-def listar_productos_activos():
-    conn = get_connection()
-    p = conn.execute("SELECT * FROM productos WHERE activo=1").fetchall()
-    conn.close()
-    return p
\ No newline at end of file
+# Umbral efectivo de alerta: el del producto o, si no tiene, el global de config_empresa
+UMBRAL_EFECTIVO = "COALESCE(NEW.umbral_alerta, (SELECT limite_stock_alerta FROM config_empresa WHERE id = 1), 10)"
+
+ESQUEMA = [
+    # Rangos y orden por fecha: sobre las marcas enteras (ver MARCAS); los índices viejos sobre el texto sobran
+    "DROP INDEX IF EXISTS idx_ventas_fecha",
+    "DROP INDEX IF EXISTS idx_ventas_cancelables",
+    "CREATE INDEX IF NOT EXISTS idx_ventas_fecha_ts ON ventas(fecha_ts)",
+    "CREATE INDEX IF NOT EXISTS idx_cambios_solicitud_ts ON cambios_stock(solicitud_ts)",
+    "CREATE INDEX IF NOT EXISTS idx_cambios_autorizacion_ts ON cambios_stock(autorizacion_ts)",
+    "CREATE INDEX IF NOT EXISTS idx_venta_items_venta ON venta_items(venta_id)",
+    "CREATE INDEX IF NOT EXISTS idx_venta_items_producto ON venta_items(producto_id)",
+    "CREATE INDEX IF NOT EXISTS idx_ventas_numero_pedido ON ventas(numero_pedido)",
+    # Solo las ventas todavía cancelables: el barrido de cancelaciones.py recorre este índice
+    "CREATE INDEX IF NOT EXISTS idx_ventas_cancelables_ts ON ventas(fecha_ts) WHERE cancelable = 1",
+    # Un reintento del mismo checkout (doble submit, proxy) no puede crear otra venta
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_ventas_clave_idempotencia ON ventas(clave_idempotencia) WHERE clave_idempotencia IS NOT NULL",
+    # Panel del vendedor (repositorio "tablero_vendedor" y "tablero_huella", que lee solo el índice):
+    # sus productos y las solicitudes pendientes de cada uno
+    "CREATE INDEX IF NOT EXISTS idx_productos_vendedor ON productos(vendedor_id, version)",
+    "CREATE INDEX IF NOT EXISTS idx_cambios_pendientes ON cambios_stock(producto_id) WHERE estado = 'pendiente'",
+    """CREATE TABLE IF NOT EXISTS config_empresa (
+        id INTEGER PRIMARY KEY CHECK(id = 1),
+        nombre TEXT,
+        email_contacto TEXT,
+        max_horas_cancelacion INTEGER DEFAULT 24,
+        limite_stock_alerta INTEGER DEFAULT 10,
+        minutos_cancelacion INTEGER DEFAULT 10,
+        dias_archivo INTEGER DEFAULT 365
+    )""",
+    "INSERT OR IGNORE INTO config_empresa (id, nombre) VALUES (1, 'Verdulería Fres')",
+    # Libro de movimientos de stock (ver movimientos.py); fecha en segundos unix
+    """CREATE TABLE IF NOT EXISTS movimientos_stock (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        producto_id INTEGER NOT NULL,
+        delta INTEGER NOT NULL,
+        tipo TEXT NOT NULL,
+        fecha INTEGER NOT NULL,
+        FOREIGN KEY(producto_id) REFERENCES productos(id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_movimientos_producto ON movimientos_stock(producto_id, id)",
+    """CREATE TABLE IF NOT EXISTS stock_snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        producto_id INTEGER NOT NULL,
+        stock INTEGER NOT NULL,
+        movimiento_id INTEGER NOT NULL,
+        fecha INTEGER NOT NULL,
+        FOREIGN KEY(producto_id) REFERENCES productos(id)
+    )""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_snapshots_producto ON stock_snapshots(producto_id, movimiento_id)",
+    "CREATE INDEX IF NOT EXISTS idx_snapshots_fecha ON stock_snapshots(producto_id, fecha)",
+    # Meses archivados (ver archivo.py): qué meses tienen base de archivo, de qué clientes, y los
+    # totales que el panel suma al historial vivo
+    """CREATE TABLE IF NOT EXISTS archivo_meses (
+        mes TEXT PRIMARY KEY,
+        ventas INTEGER NOT NULL DEFAULT 0,
+        completadas INTEGER NOT NULL DEFAULT 0,
+        ingresos REAL NOT NULL DEFAULT 0,
+        cambios INTEGER NOT NULL DEFAULT 0,
+        actualizado TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS archivo_clientes (
+        usuario_id INTEGER NOT NULL,
+        mes TEXT NOT NULL,
+        PRIMARY KEY(usuario_id, mes)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS archivo_productos (
+        producto_id INTEGER PRIMARY KEY,
+        unidades INTEGER NOT NULL DEFAULT 0
+    )""",
+    # Cualquier escritura de productos.stock (rutas, scripts, lotes) queda en el libro en su misma transacción
+    """CREATE TRIGGER IF NOT EXISTS trg_movimiento_stock_update
+        AFTER UPDATE OF stock ON productos
+        WHEN NEW.stock IS NOT OLD.stock
+        BEGIN
+            INSERT INTO movimientos_stock (producto_id, delta, tipo, fecha)
+            VALUES (NEW.id, COALESCE(NEW.stock, 0) - COALESCE(OLD.stock, 0), 'cambio', CAST(strftime('%s', 'now') AS INTEGER));
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_movimiento_stock_insert
+        AFTER INSERT ON productos
+        WHEN COALESCE(NEW.stock, 0) <> 0
+        BEGIN
+            INSERT INTO movimientos_stock (producto_id, delta, tipo, fecha)
+            VALUES (NEW.id, NEW.stock, 'alta', CAST(strftime('%s', 'now') AS INTEGER));
+        END""",
+    # Solo agregado: corregir un error es otro movimiento, no editar el libro
+    """CREATE TRIGGER IF NOT EXISTS trg_movimientos_solo_agregado
+        BEFORE UPDATE ON movimientos_stock
+        BEGIN
+            SELECT RAISE(ABORT, 'movimientos_stock es solo de agregado');
+        END""",
+    # Versión de la fila: sube con cualquier cambio visible del producto (la usan los
+    # fragmentos cacheados de las tarjetas). Si la escritura ya la sube, no se toca.
+    """CREATE TRIGGER IF NOT EXISTS trg_producto_version
+        AFTER UPDATE OF nombre, descripcion, precio, stock, categoria, imagen_url, imagen_hash, activo ON productos
+        WHEN NEW.version IS OLD.version
+        BEGIN
+            UPDATE productos SET version = version + 1 WHERE id = NEW.id;
+        END""",
+    # Auditoría de acciones (la escribe auditoria.py en lotes)
+    """CREATE TABLE IF NOT EXISTS acciones_admin (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        admin_id INTEGER,
+        accion TEXT,
+        detalle TEXT,
+        fecha TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(admin_id) REFERENCES usuarios(id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_acciones_admin_fecha ON acciones_admin(fecha)",
+    # Reservas de stock del carrito (ver reservas.py); expira_en en segundos unix
+    """CREATE TABLE IF NOT EXISTS reservas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sesion TEXT NOT NULL,
+        producto_id INTEGER NOT NULL,
+        cantidad INTEGER NOT NULL,
+        expira_en INTEGER NOT NULL,
+        UNIQUE(sesion, producto_id),
+        FOREIGN KEY(producto_id) REFERENCES productos(id)
+    )""",
+    # Suma de reservas activas por producto (stock disponible) y barrido de vencidas
+    "CREATE INDEX IF NOT EXISTS idx_reservas_producto ON reservas(producto_id, expira_en)",
+    "CREATE INDEX IF NOT EXISTS idx_reservas_expira ON reservas(expira_en)",
+    # Fotos cacheadas por contenido (ver imagenes.py); origen_url evita bajar dos veces la misma
+    """CREATE TABLE IF NOT EXISTS imagenes (
+        hash TEXT PRIMARY KEY,
+        origen_url TEXT,
+        creado_en TEXT DEFAULT CURRENT_TIMESTAMP
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_imagenes_origen ON imagenes(origen_url)",
+    # Alertas de stock bajo: una fila activa por producto, las resueltas quedan como historial
+    """CREATE TABLE IF NOT EXISTS alertas_stock (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        producto_id INTEGER NOT NULL,
+        vendedor_id INTEGER,
+        stock INTEGER NOT NULL,
+        umbral INTEGER NOT NULL,
+        activa INTEGER NOT NULL DEFAULT 1,
+        creada_en TEXT DEFAULT CURRENT_TIMESTAMP,
+        resuelta_en TEXT,
+        FOREIGN KEY(producto_id) REFERENCES productos(id)
+    )""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_alertas_activas ON alertas_stock(producto_id) WHERE activa = 1",
+    "CREATE INDEX IF NOT EXISTS idx_alertas_vendedor ON alertas_stock(vendedor_id, id) WHERE activa = 1",
+    # Un script que inserta solo la fecha en texto (init_*, cargas a mano) igual deja la marca entera
+    """CREATE TRIGGER IF NOT EXISTS trg_ventas_fecha_ts
+        AFTER INSERT ON ventas
+        WHEN NEW.fecha_ts IS NULL
+        BEGIN
+            UPDATE ventas SET fecha_ts = COALESCE(CAST(strftime('%s', NEW.fecha, 'utc') AS INTEGER),
+                                                  CAST(strftime('%s', 'now') AS INTEGER))
+            WHERE id = NEW.id;
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_cambios_solicitud_ts
+        AFTER INSERT ON cambios_stock
+        WHEN NEW.solicitud_ts IS NULL
+        BEGIN
+            UPDATE cambios_stock SET solicitud_ts = COALESCE(CAST(strftime('%s', NEW.fecha_solicitud) AS INTEGER),
+                                                             CAST(strftime('%s', 'now') AS INTEGER))
+            WHERE id = NEW.id;
+        END""",
+    # Los triggers mantienen las alertas en cada cambio de stock (compra, cancelación,
+    # aprobación de cambios_stock, alta de producto) sin tocar esas rutas.
+    f"""CREATE TRIGGER IF NOT EXISTS trg_alerta_stock_update
+        AFTER UPDATE OF stock, activo, umbral_alerta ON productos
+        BEGIN
+            UPDATE alertas_stock SET activa = 0, resuelta_en = datetime('now')
+            WHERE producto_id = NEW.id AND activa = 1 AND (NEW.activo = 0 OR NEW.stock >= {UMBRAL_EFECTIVO});
+            UPDATE alertas_stock SET stock = NEW.stock, umbral = {UMBRAL_EFECTIVO}
+            WHERE producto_id = NEW.id AND activa = 1;
+            INSERT INTO alertas_stock (producto_id, vendedor_id, stock, umbral)
+            SELECT NEW.id, NEW.vendedor_id, NEW.stock, {UMBRAL_EFECTIVO}
+            WHERE NEW.activo = 1 AND NEW.stock < {UMBRAL_EFECTIVO}
+              AND NOT EXISTS (SELECT 1 FROM alertas_stock WHERE producto_id = NEW.id AND activa = 1);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_alerta_stock_insert
+        AFTER INSERT ON productos
+        WHEN NEW.activo = 1 AND NEW.stock < {UMBRAL_EFECTIVO}
+        BEGIN
+            INSERT INTO alertas_stock (producto_id, vendedor_id, stock, umbral)
+            VALUES (NEW.id, NEW.vendedor_id, NEW.stock, {UMBRAL_EFECTIVO});
+        END""",
+]
+
+# Recalcula todas las alertas de una vez (al crear la tabla o al cambiar el umbral global)
+SQL_RECALCULAR_ALERTAS = [
+    """UPDATE alertas_stock SET activa = 0, resuelta_en = datetime('now')
+       WHERE activa = 1 AND producto_id IN (
+           SELECT p.id FROM productos p
+           WHERE p.activo = 0 OR p.stock >= COALESCE(p.umbral_alerta, (SELECT limite_stock_alerta FROM config_empresa WHERE id = 1), 10))""",
+    """UPDATE alertas_stock SET
+           stock = (SELECT p.stock FROM productos p WHERE p.id = alertas_stock.producto_id),
+           umbral = (SELECT COALESCE(p.umbral_alerta, (SELECT limite_stock_alerta FROM config_empresa WHERE id = 1), 10)
+                     FROM productos p WHERE p.id = alertas_stock.producto_id)
+       WHERE activa = 1""",
+    """INSERT INTO alertas_stock (producto_id, vendedor_id, stock, umbral)
+       SELECT p.id, p.vendedor_id, p.stock, COALESCE(p.umbral_alerta, (SELECT limite_stock_alerta FROM config_empresa WHERE id = 1), 10)
+       FROM productos p
+       WHERE p.activo = 1 AND p.stock < COALESCE(p.umbral_alerta, (SELECT limite_stock_alerta FROM config_empresa WHERE id = 1), 10)
+         AND NOT EXISTS (SELECT 1 FROM alertas_stock a WHERE a.producto_id = p.id AND a.activa = 1)""",
+]
+
+# Al crear el libro en una base existente: el stock actual entra como movimiento de apertura
+SQL_APERTURA_MOVIMIENTOS = """
+    INSERT INTO movimientos_stock (producto_id, delta, tipo, fecha)
+    SELECT id, stock, 'apertura', CAST(strftime('%s', 'now') AS INTEGER) FROM productos WHERE COALESCE(stock, 0) <> 0
+"""
+
+# (tabla, columna, definición) que se agregan con ALTER TABLE si no existen
+COLUMNAS = [
+    ("productos", "umbral_alerta", "INTEGER"),
+    ("productos", "imagen_url", "TEXT"),
+    ("productos", "imagen_hash", "TEXT"),
+    ("ventas", "clave_idempotencia", "TEXT"),
+    ("ventas", "cancelable", "INTEGER DEFAULT 1"),
+    # Ventana de cancelación del cliente (max_horas_cancelacion quedó sin uso)
+    ("config_empresa", "minutos_cancelacion", "INTEGER DEFAULT 10"),
+    ("productos", "version", "INTEGER NOT NULL DEFAULT 0"),
+    ("config_empresa", "dias_archivo", "INTEGER DEFAULT 365"),
+    ("cambios_stock", "version_producto", "INTEGER"),
+    ("cambios_stock", "conflicto", "TEXT"),
+    ("ventas", "fecha_ts", "INTEGER"),
+    ("cambios_stock", "solicitud_ts", "INTEGER"),
+    ("cambios_stock", "autorizacion_ts", "INTEGER"),
+]
+
+# Marcas de tiempo en segundos unix (como movimientos_stock) al lado de las fechas en texto: los
+# filtros, rangos y órdenes usan estas; el texto queda para los scripts viejos.
+# (tabla, columna, fecha en texto de origen, expresión que la convierte). ventas.fecha se guardaba
+# en hora local (datetime.now() del pago); las de cambios_stock, con datetime('now'), en UTC.
+MARCAS = [
+    ("ventas", "fecha_ts", "fecha", "CAST(strftime('%s', fecha, 'utc') AS INTEGER)"),
+    ("cambios_stock", "solicitud_ts", "fecha_solicitud", "CAST(strftime('%s', fecha_solicitud) AS INTEGER)"),
+    ("cambios_stock", "autorizacion_ts", "fecha_autorizacion", "CAST(strftime('%s', fecha_autorizacion) AS INTEGER)"),
+]
+TAMANO_LOTE_MARCAS = 5000
+
+def _columnas(conn, tabla, esquema="main"):
+    return {fila[1] for fila in conn.execute(f"PRAGMA {esquema}.table_info({tabla})")}
+
+def rellenar_marcas(conn, esquema="main", lote=TAMANO_LOTE_MARCAS):
+    """Completa las marcas vacías desde la fecha en texto, de a `lote` filas por transacción
+    (una tabla grande no bloquea las escrituras mientras tanto). Devuelve cuántas completó."""
+    total = 0
+    for tabla, columna, origen, expresion in MARCAS:
+        if columna not in _columnas(conn, tabla, esquema): continue
+        ultimo = 0
+        while True:
+            ids = conn.execute(f"""SELECT id FROM {esquema}.{tabla} WHERE {columna} IS NULL AND {origen} IS NOT NULL AND id > ?
+                                   ORDER BY id LIMIT ?""", (ultimo, lote)).fetchall()
+            if not ids: break
+            ultimo = ids[-1][0]
+            total += conn.execute(f"UPDATE {esquema}.{tabla} SET {columna} = {expresion} WHERE id BETWEEN ? AND ? AND {columna} IS NULL AND {expresion} IS NOT NULL",
+                                  (ids[0][0], ultimo)).rowcount
+            conn.commit()
+    return total
+
+def convertir_auto_vacuum(db_path=DB_PATH):
+    """Pasa la base a auto_vacuum incremental (el archivador devuelve así el espacio de a poco).
+    Es un VACUUM completo: reescribe el archivo con la base bloqueada, correrlo con la app detenida.
+    Devuelve False si ya estaba convertida."""
+    conn = sqlite3.connect(db_path)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2: return False
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return True
+    finally:
+        conn.close()
+
+def migrar_esquema(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    try:
+        # WAL: los lectores (reportes, copia de analítica) no bloquean los commits del checkout
+        conn.execute("PRAGMA journal_mode=WAL")
+        habia_alertas = bool(_columnas(conn, "alertas_stock"))
+        habia_movimientos = bool(_columnas(conn, "movimientos_stock"))
+        for tabla, columna, definicion in COLUMNAS:
+            existentes = _columnas(conn, tabla)
+            # Una tabla que todavía no existe la crea ESQUEMA ya con la columna
+            if existentes and columna not in existentes:
+                conn.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}")
+        for sql in ESQUEMA:
+            conn.execute(sql)
+        if not habia_alertas:
+            for sql in SQL_RECALCULAR_ALERTAS:
+                conn.execute(sql)
+        if not habia_movimientos:
+            conn.execute(SQL_APERTURA_MOVIMIENTOS)
+        conn.commit()
+        rellenar_marcas(conn)
+    finally:
+        conn.close()
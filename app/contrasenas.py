@@ -0,0 +1,74 @@
+# contrasenas.py
+# Verificación de contraseñas fuera del hilo del request.
+# El hash (scrypt/PBKDF2) es lento a propósito: se ejecuta en un pool
+# acotado y, si el pool y su cola están llenos, se rechaza el intento
+# (Saturado) en vez de dejar que una ráfaga de logins ocupe todos los
+# workers de la tienda. Si el hash no termina en TIMEOUT segundos también
+# es Saturado: el pool está atrasado y la ruta responde 503.
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Parámetros actuales del hash; si cambian, las contraseñas se rehashean al loguearse
+METODO_HASH = "scrypt:32768:8:1"
+HILOS = 2
+MAX_EN_COLA = 8
+TIMEOUT = 10
+
+# Hash de relleno para usuarios inexistentes: el tiempo de respuesta no revela si existen.
+# Se genera en el primer uso (generarlo al importar sumaría medio segundo al arranque).
+_hash_ficticio = None
+
+_pool = ThreadPoolExecutor(max_workers=HILOS, thread_name_prefix="contrasenas")
+_lock = threading.Lock()
+_en_uso = 0  # verificaciones en curso o en cola
+
+
+class Saturado(Exception):
+    """No hay lugar en el pool de verificación."""
+
+
+def _liberar(_=None):
+    global _en_uso
+    with _lock: _en_uso -= 1
+
+
+def _ejecutar(funcion, *args):
+    global _en_uso
+    with _lock:
+        if _en_uso >= HILOS + MAX_EN_COLA: raise Saturado()
+        _en_uso += 1
+    try:
+        futuro = _pool.submit(funcion, *args)
+    except Exception:
+        _liberar()
+        raise
+    # El cupo se libera cuando el hash termina, aunque quien lo pidió ya no espere
+    futuro.add_done_callback(_liberar)
+    try: return futuro.result(timeout=TIMEOUT)
+    except TimeoutError: raise Saturado() from None
+
+
+def verificar(hash_guardado, password):
+    """True si la contraseña coincide. Con hash_guardado=None verifica contra el hash ficticio."""
+    global _hash_ficticio
+    if hash_guardado is None:
+        if _hash_ficticio is None:
+            _hash_ficticio = _ejecutar(generate_password_hash, "contraseña-ficticia", METODO_HASH)
+        _ejecutar(check_password_hash, _hash_ficticio, password)
+        return False
+    return _ejecutar(check_password_hash, hash_guardado, password)
+
+
+def necesita_rehash(hash_guardado):
+    return not hash_guardado.startswith(METODO_HASH + "$")
+
+
+def generar(password):
+    return _ejecutar(generate_password_hash, password, METODO_HASH)
+
+
+def en_uso():
+    """Verificaciones en curso o en cola (para métricas)."""
+    with _lock: return _en_uso
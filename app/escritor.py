@@ -0,0 +1,189 @@
+# escritor.py
+# Un solo escritor por proceso para inventario.db.
+# Las rutas no escriben con su propia conexión: mandan la escritura como
+# una unidad de trabajo, funcion(conn, *args), y reciben un Future con lo
+# que devuelve. Un hilo dedicado las corre de a una sobre su conexión, así
+# dentro del proceso nunca hay dos transacciones peleando por el lock de
+# escritura de SQLite ("database is locked").
+#
+# Group commit: el hilo toma una unidad y además todas las que llegaron
+# mientras tanto (hasta MAX_LOTE), las corre en una sola transacción
+# (BEGIN IMMEDIATE, un SAVEPOINT por unidad) y hace un único commit. Si una
+# unidad lanza una excepción solo se deshace su savepoint y el Future la
+# recibe; las demás del lote se confirman igual. Los Futures se resuelven
+# después del commit, así quien espera sabe que lo suyo ya es durable.
+#
+# Las unidades no hacen commit ni rollback (el escritor maneja la
+# transacción) y deben ser cortas: nada de red ni esperas adentro.
+#
+# La cola es acotada: si está llena, enviar() espera hasta ESPERA_COLA
+# segundos y después lanza ColaLlena (la app responde 503). Entre procesos
+# (varios workers de gunicorn) sigue habiendo un escritor por proceso; esos
+# pocos escritores esperan el lock con busy_timeout en vez de fallar.
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import repositorio
+
+MAX_COLA = 1000
+MAX_LOTE = 64
+ESPERA_COLA = 2.0
+BUSY_TIMEOUT_MS = 30000
+MUESTRAS_ESPERA = 2000  # últimas esperas en cola que se guardan para los percentiles
+
+log = logging.getLogger("verduleria.escritor")
+
+_FIN = object()
+
+
+class ColaLlena(Exception):
+    """La cola del escritor está llena: el llamador debe reintentar más tarde."""
+
+
+class Escritor(threading.Thread):
+    def __init__(self, db_path, max_cola=MAX_COLA, max_lote=MAX_LOTE):
+        super().__init__(name="escritor-sqlite", daemon=True)
+        self.db_path = db_path
+        self.max_lote = max_lote
+        self.cola = queue.Queue(max_cola)
+        self._lock = threading.Lock()
+        self._esperas = deque(maxlen=MUESTRAS_ESPERA)
+        self._metricas = {"trabajos": 0, "lotes": 0, "errores": 0, "rechazados": 0, "lote_max": 0, "commit_ms_total": 0.0}
+
+    def enviar(self, trabajo, *args, espera=None):
+        """Encola trabajo(conn, *args) y devuelve su Future. Lanza ColaLlena si no hay lugar en `espera`
+        segundos (por defecto ESPERA_COLA)."""
+        futuro = Future()
+        try: self.cola.put((trabajo, args, futuro, time.perf_counter()), timeout=ESPERA_COLA if espera is None else espera)
+        except queue.Full:
+            with self._lock: self._metricas["rechazados"] += 1
+            raise ColaLlena(f"cola de escritura llena ({self.cola.maxsize})") from None
+        return futuro
+
+    def ejecutar(self, trabajo, *args, timeout=None):
+        """enviar() y esperar el resultado (o la excepción de la unidad)."""
+        return self.enviar(trabajo, *args).result(timeout)
+
+    def detener(self):
+        """Termina lo encolado y cierra la conexión."""
+        self.cola.put(_FIN)
+        self.join(timeout=10)
+
+    def run(self):
+        conn = None
+        try:
+            while True:
+                lote = [self.cola.get()]
+                while lote[-1] is not _FIN and len(lote) < self.max_lote:
+                    try: lote.append(self.cola.get_nowait())
+                    except queue.Empty: break
+                fin = lote[-1] is _FIN
+                if fin: lote.pop()
+                if lote and conn is None:
+                    # Si la base no abre, el lote falla con ese error y se reintenta con el siguiente
+                    try: conn = self._conectar()
+                    except Exception as e:
+                        log.error("No se pudo abrir %s para escribir: %s", self.db_path, e)
+                        with self._lock: self._metricas["errores"] += len(lote)
+                        for _, _, futuro, _ in lote: futuro.set_exception(e)
+                        lote = []
+                if lote: self._correr(conn, lote)
+                if fin: return
+        finally:
+            if conn is not None: conn.cerrar()
+
+    def _conectar(self):
+        conn = repositorio.conectar(self.db_path)
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        return conn
+
+    def _correr(self, conn, lote):
+        inicio = time.perf_counter()
+        resultados = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for trabajo, args, futuro, encolado in lote:
+                self._medir_espera(inicio - encolado)
+                conn.execute("SAVEPOINT unidad")
+                try:
+                    resultados.append((futuro, trabajo(conn, *args), None))
+                    conn.execute("RELEASE unidad")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO unidad")
+                    conn.execute("RELEASE unidad")
+                    resultados.append((futuro, None, e))
+            conn.commit()
+        except Exception as e:
+            # Falló la transacción entera (disco, lock agotado): nada del lote quedó escrito
+            log.exception("Error en el lote de escritura (%d unidades)", len(lote))
+            if conn.in_transaction: conn.rollback()
+            resultados = [(futuro, None, e) for _, _, futuro, _ in lote]
+        ms = (time.perf_counter() - inicio) * 1000
+        with self._lock:
+            m = self._metricas
+            m["lotes"] += 1
+            m["trabajos"] += len(lote)
+            m["errores"] += sum(1 for r in resultados if r[2] is not None)
+            m["lote_max"] = max(m["lote_max"], len(lote))
+            m["commit_ms_total"] += ms
+        for futuro, resultado, error in resultados:
+            if error is not None: futuro.set_exception(error)
+            else: futuro.set_result(resultado)
+
+    def _medir_espera(self, segundos):
+        with self._lock: self._esperas.append(segundos * 1000)
+
+    def metricas(self):
+        with self._lock:
+            m = dict(self._metricas)
+            esperas = sorted(self._esperas)
+        percentil = lambda p: round(esperas[min(len(esperas) - 1, int(len(esperas) * p))], 2) if esperas else 0.0
+        return {"en_cola": self.cola.qsize(), "max_cola": self.cola.maxsize, "trabajos": m["trabajos"], "lotes": m["lotes"],
+                "errores": m["errores"], "rechazados": m["rechazados"], "lote_max": m["lote_max"],
+                "lote_promedio": round(m["trabajos"] / m["lotes"], 2) if m["lotes"] else 0.0,
+                "lote_ms_promedio": round(m["commit_ms_total"] / m["lotes"], 2) if m["lotes"] else 0.0,
+                "espera_ms": {"p50": percentil(0.5), "p95": percentil(0.95), "p99": percentil(0.99),
+                              "max": round(esperas[-1], 2) if esperas else 0.0}}
+
+
+_escritores = {}
+_lock_escritores = threading.Lock()
+
+
+def obtener(db_path):
+    """El escritor de `db_path` de este proceso (lo arranca la primera vez; después de un fork, uno nuevo)."""
+    clave = (db_path, os.getpid())
+    with _lock_escritores:
+        escritor = _escritores.get(clave)
+        if escritor is None or not escritor.is_alive():
+            escritor = _escritores[clave] = Escritor(db_path)
+            escritor.start()
+        return escritor
+
+
+def enviar(db_path, trabajo, *args, espera=None):
+    return obtener(db_path).enviar(trabajo, *args, espera=espera)
+
+
+def ejecutar(db_path, trabajo, *args, timeout=None):
+    return obtener(db_path).ejecutar(trabajo, *args, timeout=timeout)
+
+
+def metricas():
+    with _lock_escritores:
+        propios = [(db, e) for (db, pid), e in _escritores.items() if pid == os.getpid()]
+    return {db: e.metricas() for db, e in propios}
+
+
+@atexit.register
+def detener_todos():
+    with _lock_escritores:
+        propios = [e for (_, pid), e in _escritores.items() if pid == os.getpid() and e.is_alive()]
+    for escritor in propios:
+        escritor.detener()
@@ -0,0 +1,82 @@
+# exportar.py
+# Exportaciones CSV / JSONL para el dueño.
+# Las filas se leen en bloques (repositorio.bloques, sin fetchall) y se emiten
+# así, de modo que la memoria queda plana y los primeros bytes salen enseguida.
+# Los rangos que tocan meses archivados incluyen esas filas (archivo.con_archivo).
+import csv
+import io
+import json
+import sqlite3
+from contextlib import closing, nullcontext
+from datetime import datetime, timedelta
+
+import archivo
+import repositorio
+
+FILAS_POR_BLOQUE = 500
+
+# Por tipo: columnas del archivo, consulta de repositorio.CONSULTAS y si filtra por fechas
+CONSULTAS = {
+    "ventas": {
+        "columnas": ["venta_id", "numero_pedido", "fecha", "estado", "usuario_id", "total_venta",
+                     "producto_id", "producto", "cantidad", "precio_unitario"],
+        "consulta": "exportar_ventas",
+        "con_fechas": True,
+    },
+    "cambios_stock": {
+        "columnas": ["id", "producto_id", "producto", "vendedor_id", "stock_anterior", "stock_nuevo",
+                     "precio_anterior", "precio_nuevo", "porcentaje_cambio", "motivo", "estado",
+                     "fecha_solicitud", "fecha_autorizacion", "autorizado_por"],
+        "consulta": "exportar_cambios_stock",
+        "con_fechas": True,
+    },
+    "productos": {
+        "columnas": ["id", "nombre", "categoria", "precio", "stock", "activo", "vendedor_id"],
+        "consulta": "exportar_productos",
+        "con_fechas": False,
+    },
+}
+
+FORMATOS = {"csv": "text/csv; charset=utf-8", "jsonl": "application/x-ndjson"}
+
+
+def rango_fechas(desde, hasta):
+    """Convierte 'YYYY-MM-DD' (ambos inclusive, en hora local) en límites [inicio, fin) en segundos unix,
+    comparables con las marcas enteras (ventas.fecha_ts, cambios_stock.solicitud_ts).
+
+    Lanza ValueError si alguna fecha es inválida.
+    """
+    inicio = datetime.strptime(desde, "%Y-%m-%d").timestamp() if desde else 0
+    fin = (datetime.strptime(hasta, "%Y-%m-%d") + timedelta(days=1) if hasta else datetime(9999, 1, 1)).timestamp()
+    return int(inicio), int(fin)
+
+
+def generar(db_path, tipo, formato, desde=None, hasta=None):
+    """Generador que emite el contenido de la exportación en bloques de texto."""
+    consulta = CONSULTAS[tipo]
+    params = rango_fechas(desde, hasta) if consulta["con_fechas"] else ()
+    columnas = consulta["columnas"]
+
+    conn = sqlite3.connect(db_path)
+    try:
+        archivadas = archivo.con_archivo(conn, *params, tablas=(tipo,)) if consulta["con_fechas"] else nullcontext()
+        with archivadas:
+            buffer = io.StringIO()
+            if formato == "csv":
+                writer = csv.writer(buffer)
+                writer.writerow(columnas)
+                escribir = writer.writerow
+            else:
+                escribir = lambda fila: buffer.write(json.dumps(dict(zip(columnas, fila)), ensure_ascii=False) + "\n")
+            # Cabecera de inmediato, sin esperar el primer bloque
+            yield buffer.getvalue()
+            buffer.seek(0); buffer.truncate()
+
+            # Se cierra antes de salir de `archivadas` (no se puede borrar una vista temporal en uso)
+            with closing(repositorio.bloques(conn, consulta["consulta"], params, FILAS_POR_BLOQUE)) as lectura:
+                for filas in lectura:
+                    for fila in filas: escribir(fila)
+                    yield buffer.getvalue()
+                    buffer.seek(0); buffer.truncate()
+    finally:
+        conn.close()
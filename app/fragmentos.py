@@ -0,0 +1,80 @@
+# fragmentos.py
+# Cache de fragmentos de templates (extensión de Jinja).
+#
+#     {% cache "producto", producto.id, producto.version, vista %}
+#         ... HTML de la tarjeta ...
+#     {% endcache %}
+#
+# El HTML del bloque se guarda con la clave formada por las expresiones
+# del tag, más el template, la línea y una firma del código del template
+# (si se edita el template no se sirven fragmentos viejos). La clave debe
+# incluir todo lo que cambia el HTML: la versión de la entidad y, si el
+# bloque depende del usuario, la vista. Si alguna parte es None (o no está
+# definida) el bloque se renderiza sin cache.
+#
+# No hace falta invalidar: cuando cambia la versión la clave es otra y la
+# entrada vieja sale por LRU. Cada worker tiene su propio almacén, con
+# lugar para el catálogo entero (el cache general tiene pocas entradas
+# locales y con miles de tarjetas se desalojarían entre sí). La tienda en
+# curso (tiendas.py) también es parte de la clave.
+import threading
+import zlib
+from collections import OrderedDict
+
+from jinja2 import Undefined, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+import tiendas
+
+MAX_FRAGMENTOS = 10000
+
+_lock = threading.Lock()
+_fragmentos = OrderedDict()
+_metricas = {"hits": 0, "renders": 0}
+
+
+class FragmentoCache(Extension):
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        partes = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            partes.append(parser.parse_expression())
+        cuerpo = parser.parse_statements(("name:endcache",), drop_needle=True)
+        origen = f"{parser.name}:{lineno}:{self._firma(parser.name)}"
+        llamada = self.call_method("_renderizar", [nodes.Const(origen), nodes.List(partes)])
+        return nodes.CallBlock(llamada, [], [], cuerpo).set_lineno(lineno)
+
+    def _firma(self, nombre):
+        try: fuente = self.environment.loader.get_source(self.environment, nombre)[0]
+        except Exception: return "0"
+        return format(zlib.crc32(fuente.encode()), "08x")
+
+    def _renderizar(self, origen, partes, caller):
+        if any(p is None or isinstance(p, Undefined) for p in partes): return caller()
+        clave = (tiendas.actual(), origen, *partes)
+        with _lock:
+            html = _fragmentos.get(clave)
+            if html is not None:
+                _fragmentos.move_to_end(clave)
+                _metricas["hits"] += 1
+                return html
+        html = Markup(caller())
+        with _lock:
+            _metricas["renders"] += 1
+            _fragmentos[clave] = html
+            while len(_fragmentos) > MAX_FRAGMENTOS:
+                _fragmentos.popitem(last=False)
+        return html
+
+
+def limpiar():
+    with _lock:
+        _fragmentos.clear()
+
+
+def metricas():
+    with _lock:
+        return {"entradas": len(_fragmentos), "max_entradas": MAX_FRAGMENTOS, **_metricas}
@@ -0,0 +1,160 @@
+# imagenes.py
+# Cache local de fotos de productos.
+# Cada foto se descarga (o se sube) una sola vez, se guarda por contenido
+# (sha256) en disco y se generan miniaturas WebP/JPEG en un pool de hilos.
+# La app las sirve con cabeceras "immutable", así la tienda no depende de
+# la latencia de Pexels ni de otros sitios externos.
+#
+# Uso por línea de comandos (cachea las fotos de los productos existentes):
+#     python imagenes.py
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import cache
+import escritor
+import subsistemas
+import tiendas
+
+DIRECTORIO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_imagenes")
+ANCHOS = (160, 320, 640)
+FORMATOS = {"webp": ("WEBP", "image/webp"), "jpg": ("JPEG", "image/jpeg")}
+MAX_BYTES = 10 * 1024 * 1024
+CACHE_HTTP = "public, max-age=31536000, immutable"
+
+log = logging.getLogger("verduleria.imagenes")
+
+_pool = None
+
+
+def _descargar_http(url):
+    req = urllib.request.Request(url, headers={"User-Agent": "VerduleriaFres/1.0"})
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        return resp.read(MAX_BYTES + 1)
+
+# Se puede reemplazar con configurar_descargador() (por ejemplo para pruebas sin red)
+descargar = _descargar_http
+
+
+def configurar_descargador(funcion):
+    """Reemplaza la función que baja una URL y devuelve sus bytes."""
+    global descargar
+    descargar = funcion or _descargar_http
+
+
+def _pool_imagenes():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="imagenes")
+    return _pool
+
+
+def ruta(hash_img, nombre):
+    return os.path.join(DIRECTORIO, hash_img[:2], hash_img, nombre)
+
+
+def guardar(datos):
+    """Guarda los bytes por contenido y genera las miniaturas. Devuelve el hash."""
+    if len(datos) > MAX_BYTES: raise ValueError("Imagen demasiado grande")
+    hash_img = hashlib.sha256(datos).hexdigest()[:32]
+    carpeta = os.path.dirname(ruta(hash_img, "original"))
+    if os.path.exists(os.path.join(carpeta, "listo")):
+        return hash_img
+    os.makedirs(carpeta, exist_ok=True)
+    _escribir(ruta(hash_img, "original"), datos)
+    # Pillow es opcional (y pesado de importar): sin él se sirve solo el original
+    Image = subsistemas.pil_image()
+    if Image is not None:
+        with Image.open(BytesIO(datos)) as img:
+            img = img.convert("RGB")
+            for ancho in ANCHOS:
+                alto = max(1, round(img.height * ancho / img.width))
+                mini = img if img.width <= ancho else img.resize((ancho, alto), Image.LANCZOS)
+                for ext, (formato, _) in FORMATOS.items():
+                    salida = BytesIO()
+                    mini.save(salida, formato, quality=80)
+                    _escribir(ruta(hash_img, f"{ancho}.{ext}"), salida.getvalue())
+    _escribir(os.path.join(carpeta, "listo"), b"")
+    return hash_img
+
+
+def _escribir(destino, datos):
+    # Escritura atómica: nunca se sirve un archivo a medio escribir
+    tmp = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(datos)
+    os.replace(tmp, destino)
+
+
+def _anotar(conn, producto_id, hash_img, url):
+    """Unidad del escritor: registra la imagen y la asigna al producto."""
+    conn.execute("INSERT OR IGNORE INTO imagenes (hash, origen_url) VALUES (?, ?)", (hash_img, url))
+    conn.execute("UPDATE productos SET imagen_hash=? WHERE id=?", (hash_img, producto_id))
+
+
+def procesar_producto(db_path, producto_id, url=None, datos=None):
+    """Baja (si hace falta) y procesa la foto de un producto, y guarda su hash (por el escritor de la base)."""
+    hash_img = None
+    if datos is None and url:
+        conn = sqlite3.connect(db_path)
+        try: fila = conn.execute("SELECT hash FROM imagenes WHERE origen_url=?", (url,)).fetchone()
+        finally: conn.close()
+        hash_img = fila[0] if fila else None
+        if hash_img is None:
+            datos = descargar(url)
+    if hash_img is None:
+        if not datos: return None
+        hash_img = guardar(datos)
+    escritor.ejecutar(db_path, _anotar, producto_id, hash_img, url)
+    cache.invalidar("catalogo")
+    return hash_img
+
+
+def encolar_producto(db_path, producto_id, url=None, datos=None):
+    """Procesa la foto en segundo plano; la tienda usa la URL externa hasta que termine."""
+    tienda = tiendas.actual()  # el hilo del pool no ve el request: invalida el catálogo de esta tienda
+    def tarea():
+        try:
+            with tiendas.usar(tienda): return procesar_producto(db_path, producto_id, url, datos)
+        except Exception:
+            log.exception("Error procesando la imagen del producto %s", producto_id)
+    return _pool_imagenes().submit(tarea)
+
+
+def cachear_todos(db_path):
+    """Procesa las fotos de todos los productos que todavía apuntan a una URL externa."""
+    conn = sqlite3.connect(db_path)
+    pendientes = conn.execute("SELECT id, imagen_url FROM productos WHERE imagen_hash IS NULL AND imagen_url LIKE 'http%'").fetchall()
+    conn.close()
+    futuros = [encolar_producto(db_path, pid, url) for pid, url in pendientes]
+    return sum(1 for f in futuros if f.result())
+
+
+def _tipo_original(path):
+    with open(path, "rb") as f:
+        cabecera = f.read(12)
+    if cabecera.startswith(b"\xff\xd8"): return "image/jpeg"
+    if cabecera.startswith(b"\x89PNG"): return "image/png"
+    if cabecera[:4] == b"RIFF" and cabecera[8:12] == b"WEBP": return "image/webp"
+    if cabecera[:3] == b"GIF": return "image/gif"
+    return "application/octet-stream"
+
+
+def archivo(hash_img, ancho, ext):
+    """Ruta y mimetype del archivo a servir; sin miniaturas (sin Pillow) cae al original."""
+    candidato = ruta(hash_img, f"{ancho}.{ext}")
+    if os.path.exists(candidato): return candidato, FORMATOS[ext][1]
+    original = ruta(hash_img, "original")
+    if os.path.exists(original): return original, _tipo_original(original)
+    return None, None
+
+
+if __name__ == "__main__":
+    from conexion import DB_PATH, migrar_esquema
+    migrar_esquema(DB_PATH)
+    print(f"🖼️ Imágenes cacheadas: {cachear_todos(DB_PATH)}")
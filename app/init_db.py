@@ -5,12 +5,12 @@ from werkzeug.security import generate_password_hash
 
 DB_PATH = "inventario.db"
 
-def init_database():
+def init_database(db_path=DB_PATH):
     # Eliminar base de datos existente (para desarrollo)
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
+    if os.path.exists(db_path):
+        os.remove(db_path)
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(db_path)
     cur = conn.cursor()
     
     # Tabla de roles
@@ -4,17 +4,17 @@ from werkzeug.security import generate_password_hash
 
 DB_PATH = "inventario.db"
 
-def init_database():
+def init_database(db_path=DB_PATH):
     # Eliminar base de datos existente (para reiniciar de cero)
-    if os.path.exists(DB_PATH):
+    if os.path.exists(db_path):
         try:
-            os.remove(DB_PATH)
+            os.remove(db_path)
             print("🗑️ Base de datos anterior eliminada.")
         except PermissionError:
             print("⚠️ Error: Cierra la base de datos o el servidor antes de reiniciar.")
             return
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(db_path)
     cur = conn.cursor()
     
     # Tabla de roles
@@ -99,7 +99,7 @@ def init_database():
             precio_nuevo REAL,
             porcentaje_cambio REAL,
             motivo TEXT,
-            estado TEXT, -- 'pendiente', 'autorizado', 'rechazado'
+            estado TEXT, -- 'pendiente', 'autorizado', 'rechazado', 'reemplazado'
             fecha_solicitud DATETIME,
             fecha_autorizacion DATETIME,
             autorizado_por INTEGER
@@ -160,6 +160,7 @@ def init_database():
     print("  Dueño: admin / admin")
     print("  Vendedor: vendedor / vendedor") 
     print("  Cliente: cliente / cliente")
+    print("🖼️ Para dejar las fotos en el cache local ejecuta: python imagenes.py")
 
 if __name__ == "__main__":
     init_database()
\ No newline at end of file
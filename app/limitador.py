@@ -0,0 +1,104 @@
+# limitador.py
+# Limitador de intentos por token bucket (usado en el login).
+# Cada clave (ip, usuario) tiene un balde de `capacidad` fichas que se
+# rellena a `por_segundo` fichas por segundo; cada intento gasta una.
+# Hay dos almacenes: en memoria (por proceso) y SQLite (compartido entre
+# workers del mismo servidor).
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def _rellenar(fichas, actualizado, ahora, capacidad, por_segundo):
+    return min(capacidad, fichas + (ahora - actualizado) * por_segundo)
+
+
+class MemoriaStore:
+    """Baldes en un dict del proceso; descarta los más viejos al pasar `max_claves`."""
+
+    def __init__(self, max_claves=10000):
+        self.max_claves = max_claves
+        self._baldes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consumir(self, clave, capacidad, por_segundo, costo=1.0):
+        """Gasta `costo` fichas. Devuelve 0 si se permitió o los segundos a esperar."""
+        ahora = time.monotonic()
+        with self._lock:
+            fichas, actualizado = self._baldes.pop(clave, (capacidad, ahora))
+            fichas = _rellenar(fichas, actualizado, ahora, capacidad, por_segundo)
+            espera = 0.0
+            if fichas >= costo: fichas -= costo
+            else: espera = (costo - fichas) / por_segundo
+            self._baldes[clave] = (fichas, ahora)
+            while len(self._baldes) > self.max_claves:
+                self._baldes.popitem(last=False)
+        return espera
+
+
+class SQLiteStore:
+    """Baldes en un archivo SQLite propio (no en inventario.db, para no competir con las compras)."""
+
+    def __init__(self, path="limites.db"):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS baldes (clave TEXT PRIMARY KEY, fichas REAL NOT NULL, actualizado REAL NOT NULL)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def consumir(self, clave, capacidad, por_segundo, costo=1.0):
+        ahora = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            fila = conn.execute("SELECT fichas, actualizado FROM baldes WHERE clave=?", (clave,)).fetchone()
+            fichas = _rellenar(*(fila or (capacidad, ahora)), ahora, capacidad, por_segundo)
+            espera = 0.0
+            if fichas >= costo: fichas -= costo
+            else: espera = (costo - fichas) / por_segundo
+            conn.execute("INSERT OR REPLACE INTO baldes (clave, fichas, actualizado) VALUES (?, ?, ?)", (clave, fichas, ahora))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return espera
+
+    def purgar(self, antiguedad=3600):
+        """Borra baldes sin uso (ya llenos de nuevo) hace más de `antiguedad` segundos."""
+        conn = self._conn()
+        conn.execute("DELETE FROM baldes WHERE actualizado < ?", (time.time() - antiguedad,))
+
+
+def crear_store(tipo=None):
+    """'memoria' (por defecto) o 'sqlite[:ruta]', p. ej. LIMITADOR_BACKEND=sqlite:/var/run/limites.db"""
+    tipo = tipo or os.getenv("LIMITADOR_BACKEND", "memoria")
+    if tipo.startswith("sqlite"):
+        _, _, ruta = tipo.partition(":")
+        return SQLiteStore(ruta or "limites.db")
+    return MemoriaStore()
+
+
+class Limitador:
+    """Aplica varias reglas a la vez: reglas = {"ip": (capacidad, por_segundo), ...}."""
+
+    def __init__(self, store, reglas):
+        self.store = store
+        self.reglas = reglas
+
+    def permitir(self, **claves):
+        """Consume una ficha de cada regla. Devuelve los segundos a esperar (0 = permitido)."""
+        espera = 0.0
+        for regla, valor in claves.items():
+            capacidad, por_segundo = self.reglas[regla]
+            espera = max(espera, self.store.consumir(f"{regla}:{valor}", capacidad, por_segundo))
+        return espera
@@ -0,0 +1,74 @@
+# movimientos.py
+# Libro de movimientos de stock (solo agregado) con snapshots periódicos.
+# Los triggers de conexion.py anotan en movimientos_stock cada cambio de
+# productos.stock (venta, cancelación, aprobación de cambios, alta), en la
+# misma transacción que el cambio. Una tarea periódica guarda en
+# stock_snapshots el saldo de cada producto con movimientos nuevos, así el
+# stock a una fecha sale del último snapshot anterior más una cola acotada
+# del libro, sin recorrerlo entero.
+#
+# Uso por línea de comandos:
+#     python movimientos.py verificar [--completa]
+#     python movimientos.py stock "2025-01-31 14:00" [producto_id]
+#
+# Las consultas (movimientos_*) están en repositorio.CONSULTAS.
+import time
+from datetime import datetime
+
+import repositorio
+
+
+def a_epoch(momento):
+    """datetime, epoch o texto 'YYYY-MM-DD[ HH:MM[:SS]]' (hora local) -> segundos unix."""
+    if isinstance(momento, (int, float)): return int(momento)
+    if isinstance(momento, str):
+        for formato in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+            try:
+                momento = datetime.strptime(momento.strip(), formato)
+                break
+            except ValueError: continue
+        else: raise ValueError("Fecha inválida (usar YYYY-MM-DD o YYYY-MM-DD HH:MM)")
+    return int(time.mktime(momento.timetuple()))
+
+
+def tomar_snapshots(conn):
+    """Guarda un snapshot por producto con movimientos nuevos. Devuelve cuántos guardó. No hace commit."""
+    return repositorio.ejecutar(conn, "movimientos_tomar_snapshots").rowcount
+
+
+def stock_en(conn, producto_id, momento):
+    """Stock del producto en ese momento, o None si todavía no existía."""
+    stock, filas = repositorio.uno(conn, "movimientos_stock_en", {"producto_id": producto_id, "momento": a_epoch(momento)})
+    return stock if filas else None
+
+
+def stock_en_todos(conn, momento):
+    """[(producto_id, nombre, stock)] de los productos que existían en ese momento."""
+    return [tuple(f) for f in repositorio.todos(conn, "movimientos_stock_en_todos", {"momento": a_epoch(momento)})]
+
+
+def verificar(conn, completa=False):
+    """Diferencias entre el libro y productos.stock: [{"producto_id", "libro", "actual"}].
+    Con `completa` también revisa cada snapshot contra la suma de todo el libro."""
+    diferencias = [{"producto_id": p, "libro": l, "actual": a} for p, l, a in repositorio.todos(conn, "movimientos_verificar")]
+    if completa:
+        diferencias += [{"producto_id": p, "movimiento_id": m, "snapshot": s, "libro": l}
+                        for p, m, s, l in repositorio.todos(conn, "movimientos_verificar_snapshots")]
+    return diferencias
+
+
+if __name__ == "__main__":
+    import sqlite3
+    import sys
+    from conexion import DB_PATH, migrar_esquema
+    migrar_esquema(DB_PATH)
+    conn = sqlite3.connect(DB_PATH)
+    if len(sys.argv) > 2 and sys.argv[1] == "stock":
+        if len(sys.argv) > 3: print(stock_en(conn, int(sys.argv[3]), sys.argv[2]))
+        else:
+            for pid, nombre, stock in stock_en_todos(conn, sys.argv[2]): print(f"{pid:5d}  {stock:6d}  {nombre}")
+    else:
+        diferencias = verificar(conn, completa="--completa" in sys.argv)
+        for d in diferencias: print(f"❌ {d}")
+        print("✅ Libro de stock consistente" if not diferencias else f"⚠️ {len(diferencias)} diferencias")
+        sys.exit(1 if diferencias else 0)
@@ -0,0 +1,133 @@
+# perfilador.py
+# Perfilado por request a pedido, con salida en pilas colapsadas.
+# Un hilo muestreador mira cada INTERVALO segundos la pila del hilo que
+# atiende el request (sys._current_frames) y cuenta cuántas veces aparece
+# cada pila. No instrumenta llamadas como cProfile, así el costo no crece
+# con la cantidad de funciones y se puede dejar activo en producción.
+# Cada perfil se guarda como texto "a;b;c 12" (una pila por línea), que
+# abren speedscope (speedscope.app) y flamegraph.pl tal cual. Cada tienda
+# (tiendas.py) guarda sus perfiles aparte.
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+import tiendas
+
+INTERVALO = 0.005          # muestreo automático
+INTERVALO_PEDIDO = 0.001   # perfil pedido a mano: más detalle, es un solo request
+MAX_PERFILES = 200
+MAX_SIMULTANEOS = 2  # muestreos automáticos a la vez por proceso
+
+_cupos = threading.BoundedSemaphore(MAX_SIMULTANEOS)
+_secuencia = itertools.count()
+_NOMBRE_VALIDO = re.compile(r"^[\w.-]+\.txt$")
+
+
+def _marco(frame):
+    codigo = frame.f_code
+    return f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})"
+
+
+class Muestreador(threading.Thread):
+    """Cuenta las pilas de un hilo hasta que se lo detiene."""
+
+    def __init__(self, hilo_id, intervalo=INTERVALO):
+        super().__init__(name="perfilador", daemon=True)
+        self.hilo_id = hilo_id
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self._detener = threading.Event()
+
+    def run(self):
+        while not self._detener.wait(self.intervalo):
+            frame = sys._current_frames().get(self.hilo_id)
+            if frame is None: return
+            pila = []
+            while frame is not None:
+                pila.append(_marco(frame))
+                frame = frame.f_back
+            self.pilas[";".join(reversed(pila))] += 1
+
+    def detener(self):
+        self._detener.set()
+        self.join()
+        return self.pilas
+
+
+class Perfil:
+    """Un request perfilado: iniciar() en before_request y terminar() al cerrar el request."""
+
+    def __init__(self, ruta, origen, automatico=False):
+        self.ruta = ruta
+        self.origen = origen
+        self.automatico = automatico
+        self._muestreador = Muestreador(threading.get_ident(), INTERVALO if automatico else INTERVALO_PEDIDO)
+        self._inicio = None
+
+    def iniciar(self):
+        self._inicio = time.perf_counter()
+        self._muestreador.start()
+        return self
+
+    def terminar(self, directorio=None):
+        """Detiene el muestreo y guarda el perfil (en la carpeta de la tienda por defecto). Devuelve el nombre del archivo."""
+        try:
+            pilas = self._muestreador.detener()
+        finally:
+            if self.automatico: _cupos.release()
+        directorio = _directorio(directorio)
+        ms = int((time.perf_counter() - self._inicio) * 1000)
+        ruta = re.sub(r"[^\w-]+", "_", self.ruta).strip("_") or "raiz"
+        nombre = f"{time.strftime('%Y%m%d-%H%M%S')}_{ruta[:60]}_{ms}ms_{self.origen}_{os.getpid()}-{next(_secuencia)}.txt"
+        os.makedirs(directorio, exist_ok=True)
+        with open(os.path.join(directorio, nombre), "w", encoding="utf-8") as f:
+            for pila, n in pilas.most_common(): f.write(f"{pila} {n}\n")
+        _podar(directorio)
+        return nombre
+
+
+def muestrear(ruta, cada_n):
+    """Perfil automático para 1 de cada `cada_n` requests, o None (tampoco si ya hay MAX_SIMULTANEOS en curso)."""
+    if cada_n <= 0 or random.randrange(cada_n) != 0: return None
+    if not _cupos.acquire(blocking=False): return None
+    return Perfil(ruta, "muestreo", automatico=True)
+
+
+def _directorio(directorio):
+    return directorio or tiendas.ruta("perfiles")
+
+
+def _podar(directorio):
+    archivos = sorted(f for f in os.listdir(directorio) if f.endswith(".txt"))
+    for viejo in archivos[:-MAX_PERFILES]:
+        try: os.remove(os.path.join(directorio, viejo))
+        except OSError: pass
+
+
+def listar(directorio=None):
+    """Perfiles guardados, del más nuevo al más viejo: [{"nombre", "fecha", "ruta", "ms", "origen", "bytes"}]."""
+    directorio = _directorio(directorio)
+    try: archivos = [f for f in os.listdir(directorio) if _NOMBRE_VALIDO.match(f)]
+    except OSError: return []
+    archivos.sort(key=lambda f: os.path.getmtime(os.path.join(directorio, f)), reverse=True)
+    perfiles = []
+    for nombre in archivos:
+        partes = nombre[:-4].split("_")
+        if len(partes) < 5: continue
+        perfiles.append({"nombre": nombre, "fecha": _fecha(partes[0]), "ruta": "_".join(partes[1:-3]),
+                         "ms": int(partes[-3][:-2] or 0), "origen": partes[-2],
+                         "bytes": os.path.getsize(os.path.join(directorio, nombre))})
+    return perfiles
+
+
+def _fecha(marca):
+    return f"{marca[:4]}-{marca[4:6]}-{marca[6:8]} {marca[9:11]}:{marca[11:13]}:{marca[13:15]}"
+
+
+def nombre_valido(nombre):
+    return bool(_NOMBRE_VALIDO.match(nombre))
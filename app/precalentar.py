@@ -0,0 +1,111 @@
+# precalentar.py
+# Fase de arranque: compila todos los templates a un cache de bytecode en
+# disco (compartido entre workers y reinicios), carga los caches de catálogo
+# y usuarios, y renderiza cada template con datos de prueba para detectar
+# errores antes del primer cliente.
+#
+# Uso por línea de comandos (solo el chequeo de templates):
+#     python precalentar.py
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+DIRECTORIO_BYTECODE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".jinja_cache")
+
+_venta = {"id": 1, "numero_pedido": "VDL-20250101-000001", "fecha": "2025-01-01 10:00:00", "estado": "completada",
+          "total": 7.5, "tipo_tarjeta": "visa", "ultimos_4": "4242", "usuario_id": 1, "cancelable": 1, "cliente": "cliente"}
+_producto = {"id": 1, "nombre": "Manzanas", "descripcion": "Manzanas rojas", "precio": 2.5, "stock": 5,
+             "categoria": "Frutas", "imagen_url": "", "imagen_hash": None, "umbral_alerta": None, "activo": 1,
+             "version": None}  # sin versión: las tarjetas de prueba no quedan en el cache de fragmentos
+_cambio = {"id": 1, "producto_id": 1, "nombre": "Manzanas", "producto_nombre": "Manzanas", "vendedor": "vendedor",
+           "stock_anterior": 5, "stock_nuevo": 20, "precio_anterior": 2.5, "precio_nuevo": 2.8,
+           "porcentaje_cambio": 300.0, "motivo": "Reposición", "fecha_solicitud": "2025-01-01 10:00:00",
+           "fecha_autorizacion": "2025-01-01 11:00:00", "autorizado_por": 1, "stock_actual": 4,
+           "conflicto": "El precio cambió a $2.60 desde la solicitud"}
+_item = {"nombre": "Manzanas", "cantidad": 3, "precio_unitario": 2.5}
+_carrito = {"1": {"nombre": "Manzanas", "precio": 2.5, "cantidad": 3}}
+
+# Datos de prueba por template (los que no figuran se renderizan sin contexto)
+FIXTURES = {
+    "index.html": {"productos": [_producto], "reservado": {1: 2}},
+    "checkout.html": {"carrito": [{"id": "1", "nombre": "Manzanas", "precio": 2.5, "cantidad": 3, "subtotal": 7.5}],
+                      "total": 7.5, "metodo_guardado": None, "clave_pedido": "clave-de-prueba"},
+    "confirmar_compra.html": {"carrito": _carrito, "total": 7.5, "metodo_pago": "tarjeta"},
+    "ver_carrito.html": {"carrito": _carrito},
+    "comprobante_pago.html": {"venta": _venta, "items": [_item], "fecha": "2025-01-01 10:00:00", "ventana_minutos": 10},
+    "mis_compras.html": {"compras": [{"venta": _venta, "items": [_item]}]},
+    "editar_producto.html": {"producto": _producto},
+    "solicitar_cambio.html": {"producto": _producto, "stock_sugerido": 26, "motivo_sugerido": "Reposición sugerida"},
+    "vendedor.html": {"productos": [_producto], "productos_bajo": [_producto], "ids_alerta": {1},
+                      "cambios_pendientes": [_cambio], "dias_objetivo": 14,
+                      "pagina": 1, "paginas": 2, "total_productos": 101,
+                      "pronostico": {1: {"promedio_corto": 2.0, "promedio_largo": 1.5, "velocidad": 1.85,
+                                         "dias_cobertura": 2.7, "sugerido": 21}}},
+    "panel_dueno.html": {"stats": {"total_ventas": 1, "total_ingresos": 7.5, "ticket_promedio": 7.5}, "cambios_pendientes": [_cambio],
+                         "top_productos": [{"nombre": "Manzanas", "total_vendido": 3}], "cambios_autorizados": [_cambio],
+                         "limite_alerta": 10, "total_alertas": 1, "ventas_recientes": [_venta],
+                         "frescura": {"segundos": 120, "tomada_en": "10:00:00"}},
+    "solicitudes_cambio.html": {"cambios": [_cambio]},
+    "_acciones_lote.html": {"volver": "panel_dueno"},
+    "perfiles.html": {"perfiles": [{"nombre": "20250101-100000_index_12ms_dueno_1-0.txt", "fecha": "2025-01-01 10:00:00",
+                                    "ruta": "index", "ms": 12, "origen": "dueno", "bytes": 2048}],
+                      "token": "token-de-prueba", "vigencia_min": 60, "muestreo": 0},
+}
+
+
+def configurar_bytecode(app, directorio=DIRECTORIO_BYTECODE):
+    """Activa el cache de bytecode en disco. Debe llamarse antes del primer render."""
+    os.makedirs(directorio, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directorio)
+
+
+def compilar_templates(app):
+    """Carga (y compila) cada template; con el bytecode cache los siguientes arranques solo lo leen."""
+    inicio = time.perf_counter()
+    nombres = app.jinja_env.list_templates(extensions=["html"])
+    for nombre in nombres:
+        app.jinja_env.get_template(nombre)
+    return len(nombres), (time.perf_counter() - inicio) * 1000
+
+
+def autoverificar(app):
+    """Renderiza cada template con FIXTURES. Devuelve [(template, ok, ms, error)]."""
+    resultados = []
+    with app.test_request_context("/"):
+        for nombre in app.jinja_env.list_templates(extensions=["html"]):
+            inicio = time.perf_counter()
+            try:
+                app.jinja_env.get_template(nombre).render(**_contexto(app, nombre))
+                resultados.append((nombre, True, (time.perf_counter() - inicio) * 1000, None))
+            except Exception as e:
+                resultados.append((nombre, False, (time.perf_counter() - inicio) * 1000, f"{type(e).__name__}: {e}"))
+    return resultados
+
+
+def _contexto(app, nombre):
+    contexto = {}
+    app.update_template_context(contexto)
+    contexto.update(FIXTURES.get(nombre, {}))
+    return contexto
+
+
+def calentar(app, primar=()):
+    """Ejecuta toda la fase de arranque. `primar` son funciones sin argumentos que cargan caches."""
+    inicio = time.perf_counter()
+    cantidad, ms_compilar = compilar_templates(app)
+    for funcion in primar:
+        funcion()
+    errores = [r for r in autoverificar(app) if not r[1]]
+    total_ms = (time.perf_counter() - inicio) * 1000
+    app.logger.info("🔥 Precalentado: %d templates compilados en %.1f ms, total %.1f ms", cantidad, ms_compilar, total_ms)
+    for nombre, _, _, error in errores:
+        app.logger.error("❌ Template %s falló el autochequeo: %s", nombre, error)
+    return {"templates": cantidad, "ms_compilar": ms_compilar, "ms_total": total_ms, "errores": errores}
+
+
+if __name__ == "__main__":
+    from app import crear_app
+    app = crear_app({"PRECALENTAR": False})
+    for nombre, ok, ms, error in autoverificar(app):
+        print(f"{'✅' if ok else '❌'} {nombre} ({ms:.1f} ms){'' if ok else ' - ' + error}")
@@ -0,0 +1,107 @@
+# pronostico.py
+# Pronóstico de reposición para el panel del vendedor.
+# Con una sola consulta trae las ventas de los últimos DIAS días de todos
+# los productos del vendedor y arma una matriz productos x días; sobre esa
+# matriz calcula de una vez, para todo el catálogo, el promedio móvil
+# corto y largo, la velocidad de venta, los días de cobertura del stock y
+# la cantidad sugerida para cubrir DIAS_OBJETIVO días.
+#
+# La matriz queda en memoria por tienda y vendedor: en cada consulta solo se leen
+# los venta_items nuevos (id mayor al último visto) y se suman. Se rehace
+# entera al cambiar el día, al cambiar los productos del vendedor o cada
+# REHACER_CADA segundos (así entran también las cancelaciones). Se guardan
+# a lo sumo MAX_VENDEDORES matrices (LRU). Las consultas (pronostico_*) están
+# en repositorio.CONSULTAS.
+#
+# Usa NumPy (está en requirements.txt; se carga con subsistemas.numpy()). Si
+# falta, hace la misma cuenta en Python puro, que para un vendedor con
+# decenas de productos también alcanza.
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import repositorio
+import subsistemas
+import tiendas
+
+DIAS = 28
+DIAS_CORTO = 7
+PESO_RECIENTE = 0.7   # peso del promedio corto en la velocidad
+DIAS_OBJETIVO = 14    # cobertura a la que apunta la sugerencia
+REHACER_CADA = 600
+MAX_VENDEDORES = 256  # matrices en memoria; se descarta la del vendedor consultado hace más tiempo
+
+_lock = threading.Lock()
+_estados = OrderedDict()
+
+
+class Estado:
+    """Ventas por producto y día de un vendedor, y el último venta_item sumado."""
+
+    def __init__(self, inicio, ids):
+        self.inicio = inicio
+        self.ids = ids
+        self.fila = {pid: i for i, pid in enumerate(ids)}
+        self.ultimo_item = 0
+        self.creado = time.monotonic()
+        np = subsistemas.numpy()
+        self.matriz = np.zeros((len(ids), DIAS)) if np else [[0.0] * DIAS for _ in ids]
+
+    def sumar(self, filas):
+        if not filas: return
+        self.ultimo_item = max(self.ultimo_item, max(f[0] for f in filas))
+        filas = [f for f in filas if f[1] in self.fila and 0 <= f[2] < DIAS]
+        if not filas: return
+        np = subsistemas.numpy()
+        if np:
+            datos = np.array([(self.fila[f[1]], f[2], f[3]) for f in filas], dtype=np.int64)
+            np.add.at(self.matriz, (datos[:, 0], datos[:, 1]), datos[:, 2])
+        else:
+            for _, pid, dia, cantidad in filas: self.matriz[self.fila[pid]][dia] += cantidad
+
+
+def _calcular(matriz, stocks):
+    """Columnas (promedio_corto, promedio_largo, velocidad, dias_cobertura, sugerido) para todos los productos."""
+    np = subsistemas.numpy()
+    if np:
+        stock = np.asarray(stocks, dtype=float)
+        corto = matriz[:, -DIAS_CORTO:].sum(axis=1) / DIAS_CORTO
+        largo = matriz.sum(axis=1) / DIAS
+        velocidad = PESO_RECIENTE * corto + (1 - PESO_RECIENTE) * largo
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cobertura = np.where(velocidad > 0, stock / velocidad, np.inf)
+        sugerido = np.ceil(np.maximum(velocidad * DIAS_OBJETIVO - stock, 0)).astype(int)
+        return corto.tolist(), largo.tolist(), velocidad.tolist(), cobertura.tolist(), sugerido.tolist()
+    corto = [sum(f[-DIAS_CORTO:]) / DIAS_CORTO for f in matriz]
+    largo = [sum(f) / DIAS for f in matriz]
+    velocidad = [PESO_RECIENTE * c + (1 - PESO_RECIENTE) * l for c, l in zip(corto, largo)]
+    cobertura = [s / v if v > 0 else math.inf for s, v in zip(stocks, velocidad)]
+    sugerido = [math.ceil(max(v * DIAS_OBJETIVO - s, 0)) for s, v in zip(stocks, velocidad)]
+    return corto, largo, velocidad, cobertura, sugerido
+
+
+def pronosticar(conn, vendedor_id):
+    """{producto_id: {"promedio_corto", "promedio_largo", "velocidad", "dias_cobertura", "sugerido"}}
+    de los productos activos del vendedor. dias_cobertura es None si el producto no se vende."""
+    productos = repositorio.todos(conn, "pronostico_productos", (vendedor_id,))
+    ids = [p[0] for p in productos]
+    primer_dia = date.today() - timedelta(days=DIAS - 1)
+    inicio = primer_dia.isoformat()
+    clave = (tiendas.actual(), vendedor_id)
+    with _lock:
+        estado = _estados.get(clave)
+        if (estado is None or estado.inicio != inicio or estado.ids != ids
+                or time.monotonic() - estado.creado > REHACER_CADA):
+            estado = _estados[clave] = Estado(inicio, ids)
+            while len(_estados) > MAX_VENDEDORES: _estados.popitem(last=False)
+        _estados.move_to_end(clave)
+        estado.sumar(repositorio.todos(conn, "pronostico_ventas", {"vendedor": vendedor_id, "inicio": inicio,
+                                                                  "inicio_ts": int(time.mktime(primer_dia.timetuple())),
+                                                                  "desde": estado.ultimo_item}))
+        columnas = _calcular(estado.matriz, [p[1] or 0 for p in productos])
+    return {pid: {"promedio_corto": round(c, 2), "promedio_largo": round(l, 2), "velocidad": round(v, 2),
+                  "dias_cobertura": None if math.isinf(d) else round(d, 1), "sugerido": int(s)}
+            for pid, c, l, v, d, s in zip(ids, *columnas)}
+
@@ -0,0 +1,61 @@
+# reportes.py
+# Reportes de ventas por rango de fechas para el panel del dueño.
+# Toda la agregación se hace en SQLite (GROUP BY + funciones de ventana, en las
+# consultas reporte_* de repositorio.py) en una sola pasada por rango; Python
+# solo arma el JSON. Los resultados se memorizan con la versión de datos
+# "ventas", que sube en cada compra o cancelación, y con la versión de la copia
+# de analítica que se leyó (ver analitica.version). El rango se filtra por
+# ventas.fecha_ts (segundos unix, indexada); los períodos se arman en hora local.
+# Si el rango toca meses archivados, archivo.con_archivo los suma a la consulta.
+import archivo
+import cache
+import repositorio
+from exportar import rango_fechas
+
+FORMATO_PERIODO = {
+    "dia": "%Y-%m-%d",
+    "semana": "%Y-W%W",
+    "mes": "%Y-%m",
+}
+
+# Consulta de desglose (repositorio.CONSULTAS) por cada criterio
+DESGLOSES = {
+    "categoria": "reporte_desglose_categoria",
+    "producto": "reporte_desglose_producto",
+}
+
+
+def serie_ventas(conn, desde=None, hasta=None, agrupar="dia", version=None):
+    """Ingresos, unidades y ticket promedio por día/semana/mes. Lanza ValueError con parámetros inválidos.
+
+    `version` identifica los datos que lee `conn` (la copia de analítica) y va en la
+    clave del memo: una copia nueva de cualquier worker deja atrás los resultados viejos.
+    """
+    if agrupar not in FORMATO_PERIODO: raise ValueError("agrupar debe ser dia, semana o mes")
+    inicio, fin = rango_fechas(desde, hasta)
+
+    def calcular():
+        with archivo.con_archivo(conn, inicio, fin):
+            filas = repositorio.todos(conn, "reporte_serie", {"fmt": FORMATO_PERIODO[agrupar], "inicio": inicio, "fin": fin})
+        return {
+            "agrupar": agrupar, "desde": desde, "hasta": hasta,
+            "periodos": [dict(f) for f in filas],
+            "totales": {
+                "ventas": sum(f["ventas"] for f in filas),
+                "ingresos": round(sum(f["ingresos"] for f in filas), 2),
+                "unidades": sum(f["unidades"] for f in filas),
+            },
+        }
+    return cache.obtener_o_calcular("ventas", ("serie", version, desde, hasta, agrupar), calcular, ttl=300)
+
+
+def desglose_ventas(conn, desde=None, hasta=None, por="categoria", limite=50, version=None):
+    """Unidades, ingresos y participación por categoría o producto en el rango (`version` como en serie_ventas)."""
+    if por not in DESGLOSES: raise ValueError("por debe ser categoria o producto")
+    inicio, fin = rango_fechas(desde, hasta)
+
+    def calcular():
+        with archivo.con_archivo(conn, inicio, fin):
+            filas = repositorio.todos(conn, DESGLOSES[por], {"inicio": inicio, "fin": fin, "limite": limite})
+        return {"por": por, "desde": desde, "hasta": hasta, "filas": [dict(f) for f in filas]}
+    return cache.obtener_o_calcular("ventas", ("desglose", version, desde, hasta, por, limite), calcular, ttl=300)
@@ -0,0 +1,680 @@
+# repositorio.py
+# Capa de acceso a datos de las rutas de app.py y de los módulos que usan
+# (alertas, reportes, exportar, cancelaciones, reservas, movimientos,
+# pronostico, archivo, auditoria).
+# - Cada consulta tiene nombre y columnas explícitas (CONSULTAS); nada de SELECT *.
+# - Las filas se devuelven como tuplas livianas (Fila, con __slots__ vacío) en
+#   vez de sqlite3.Row: se accede por atributo (p.nombre) o por nombre (p["nombre"]).
+# - Las conexiones se reutilizan por hilo, así el cache de sentencias preparadas
+#   de sqlite3 (una por texto SQL) sobrevive entre requests. Con varias tiendas
+#   (tiendas.py) cada hilo guarda conexiones libres de las MAX_BASES_POR_HILO
+#   bases usadas más recientemente; las de las demás se cierran.
+# - Cada ejecución se mide por nombre (estadisticas()) y se avisa a los hooks
+#   registrados con al_medir().
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from operator import itemgetter
+
+from conexion import SQL_RECALCULAR_ALERTAS
+
+SENTENCIAS_EN_CACHE = 256
+CONEXIONES_LIBRES_POR_HILO = 2
+MAX_BASES_POR_HILO = 8
+
+# ---------------------------------------------------------------------------
+# Consultas
+# ---------------------------------------------------------------------------
+
+_ES_BAJA = "cs.stock_nuevo = 0 AND instr(cs.motivo, 'Baja') > 0"
+_BAJAS_DEL_LOTE = f"SELECT cs.producto_id FROM cambios_stock cs JOIN lote_cambios l ON l.id = cs.id WHERE {_ES_BAJA}"
+# Las fechas se filtran y ordenan por las marcas enteras (segundos unix, ver conexion.MARCAS)
+_AHORA = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+
+def _hora_local(marca, texto):
+    """Columna `texto` para mostrar, en hora local, calculada desde su marca entera (o el texto si no la tiene)."""
+    return f"COALESCE(datetime({marca}, 'unixepoch', 'localtime'), {texto}) AS {texto.split('.')[-1]}"
+
+
+# Unidades apartadas por otros carritos (reservas activas); usa idx_reservas_producto
+_RESERVADO_POR_OTROS = """
+    COALESCE((SELECT SUM(r.cantidad) FROM reservas r
+              WHERE r.producto_id = p.id AND r.expira_en > :ahora AND r.sesion <> :sesion), 0)"""
+
+_ALERTAS_ACTIVAS = """
+    SELECT a.id, a.producto_id, p.nombre, a.stock, a.umbral, a.creada_en, a.vendedor_id
+    FROM alertas_stock a JOIN productos p ON p.id = a.producto_id
+    WHERE a.activa = 1 {filtro}
+    ORDER BY a.id DESC LIMIT ? OFFSET ?"""
+
+# Ids de un lote de archivo, como arreglo JSON
+_LOTE = "(SELECT value FROM json_each(?))"
+
+_VENTAS_CERRADAS = """
+        SELECT id, strftime('%Y-%m', fecha_ts, 'unixepoch', 'localtime') FROM ventas
+        WHERE fecha_ts < ? AND (cancelable = 0 OR estado = 'cancelada'){pendientes}
+        ORDER BY id LIMIT ?"""
+
+_DESGLOSE_VENTAS = """
+    WITH items AS (
+        SELECT {clave} AS clave, vi.cantidad, vi.cantidad * vi.precio_unitario AS importe
+        FROM ventas v
+        JOIN venta_items vi ON vi.venta_id = v.id
+        LEFT JOIN productos p ON p.id = vi.producto_id
+        WHERE v.estado = 'completada' AND v.fecha_ts >= :inicio AND v.fecha_ts < :fin
+    )
+    SELECT clave, SUM(cantidad) AS unidades, ROUND(SUM(importe), 2) AS ingresos,
+           ROUND(100.0 * SUM(importe) / SUM(SUM(importe)) OVER (), 2) AS porcentaje,
+           RANK() OVER (ORDER BY SUM(importe) DESC) AS ranking
+    FROM items GROUP BY clave
+    ORDER BY ingresos DESC
+    LIMIT :limite"""
+
+CONSULTAS = {
+    # --- Usuarios ---
+    "usuario_por_id": """
+        SELECT u.id, u.username, r.nombre AS rol_nombre
+        FROM usuarios u JOIN roles r ON u.rol_id = r.id WHERE u.id = ?""",
+    "usuario_para_login": """
+        SELECT u.id, u.username, u.password, r.nombre AS rol_nombre
+        FROM usuarios u JOIN roles r ON u.rol_id = r.id WHERE u.username = ?""",
+    "ids_personal": """
+        SELECT u.id FROM usuarios u JOIN roles r ON u.rol_id = r.id WHERE r.nombre IN ('dueno', 'vendedor')""",
+    "actualizar_password": "UPDATE usuarios SET password = ? WHERE id = ?",
+
+    # --- Catálogo y carrito ---
+    "catalogo": """
+        SELECT id, nombre, descripcion, precio, stock, categoria, imagen_url, imagen_hash, version
+        FROM productos WHERE activo = 1 AND stock > 0 ORDER BY nombre ASC""",
+    "producto_para_carrito": "SELECT nombre, precio FROM productos WHERE id = ? AND activo = 1",
+    "producto_para_cambio": """
+        SELECT id, nombre, precio, stock, umbral_alerta, version FROM productos WHERE id = ?""",
+    "metodo_pago_predeterminado": """
+        SELECT id, tipo_tarjeta, ultimos_4 FROM metodos_pago WHERE usuario_id = ? AND predeterminado = 1""",
+
+    # --- Ventas ---
+    "insertar_venta": """
+        INSERT INTO ventas (usuario_id, total, fecha, fecha_ts, estado, clave_idempotencia) VALUES (?, ?, ?, ?, 'completada', ?)""",
+    "asignar_numero_pedido": "UPDATE ventas SET numero_pedido = ? WHERE id = ?",
+    "insertar_venta_item": """
+        INSERT INTO venta_items (venta_id, producto_id, cantidad, precio_unitario) VALUES (?, ?, ?, ?)""",
+    "pedido_por_clave": "SELECT numero_pedido FROM ventas WHERE clave_idempotencia = ? AND usuario_id = ?",
+    "venta_de_cliente": f"""
+        SELECT id, numero_pedido, {_hora_local("fecha_ts", "fecha")}, estado, total, tipo_tarjeta, ultimos_4, cancelable
+        FROM ventas WHERE numero_pedido = ? AND usuario_id = ?""",
+    "items_de_venta": """
+        SELECT p.nombre, vi.cantidad, vi.precio_unitario
+        FROM venta_items vi JOIN productos p ON vi.producto_id = p.id WHERE vi.venta_id = ?""",
+    "ventas_de_cliente": f"""
+        SELECT id, numero_pedido, {_hora_local("fecha_ts", "fecha")}, estado, total, cancelable
+        FROM ventas WHERE usuario_id = ? ORDER BY fecha_ts DESC""",
+    # Todos los ítems de un cliente de una vez (evita una consulta por venta en mis_compras)
+    "items_de_cliente": """
+        SELECT vi.venta_id, p.nombre, vi.cantidad, vi.precio_unitario
+        FROM venta_items vi JOIN ventas v ON v.id = vi.venta_id JOIN productos p ON vi.producto_id = p.id
+        WHERE v.usuario_id = ?""",
+    "ventas_recientes": f"""
+        SELECT v.id, v.numero_pedido, {_hora_local("v.fecha_ts", "v.fecha")}, v.total, u.username AS cliente
+        FROM ventas v LEFT JOIN usuarios u ON u.id = v.usuario_id
+        WHERE v.estado = 'completada' ORDER BY v.id DESC LIMIT 20""",
+    # Los dos siguientes suman los totales de los meses archivados (ver archivo.py)
+    "estadisticas_ventas": """
+        WITH vivas AS (SELECT COUNT(*) AS n, COALESCE(SUM(total), 0) AS ingresos FROM ventas WHERE estado = 'completada'),
+             archivadas AS (SELECT COALESCE(SUM(completadas), 0) AS n, COALESCE(SUM(ingresos), 0) AS ingresos FROM archivo_meses)
+        SELECT v.n + a.n AS total_ventas, v.ingresos + a.ingresos AS total_ingresos,
+               COALESCE((v.ingresos + a.ingresos) / NULLIF(v.n + a.n, 0), 0) AS ticket_promedio
+        FROM vivas v, archivadas a""",
+    "top_productos": """
+        SELECT p.nombre, SUM(t.cantidad) AS total_vendido
+        FROM (SELECT vi.producto_id, vi.cantidad FROM venta_items vi JOIN ventas v ON vi.venta_id = v.id
+              WHERE v.estado = 'completada'
+              UNION ALL SELECT producto_id, unidades FROM archivo_productos) t
+        JOIN productos p ON t.producto_id = p.id
+        GROUP BY p.id ORDER BY total_vendido DESC LIMIT 5""",
+
+    # --- Vendedor ---
+    # Panel del vendedor en una pasada (ver tablero.py): cada producto con su alerta activa y sus
+    # solicitudes pendientes (una fila por solicitud; las bajas ya aplicadas solo si tienen pendientes)
+    "tablero_vendedor": f"""
+        SELECT p.id, p.nombre, p.descripcion, p.precio, p.stock, p.categoria, p.activo,
+               a.id AS alerta_id, a.stock AS alerta_stock, a.umbral, a.creada_en AS alerta_creada_en,
+               cs.id AS cambio_id, cs.stock_anterior, cs.stock_nuevo, cs.precio_anterior, cs.precio_nuevo,
+               cs.porcentaje_cambio, {_hora_local("cs.solicitud_ts", "cs.fecha_solicitud")}, cs.conflicto
+        FROM productos p
+        LEFT JOIN alertas_stock a ON a.producto_id = p.id AND a.activa = 1
+        LEFT JOIN cambios_stock cs ON cs.producto_id = p.id AND cs.estado = 'pendiente' AND cs.vendedor_id = p.vendedor_id
+        WHERE p.vendedor_id = ? AND (p.activo = 1 OR cs.id IS NOT NULL)
+        ORDER BY p.id, cs.id""",
+    # Huella del panel: SUM(version) sube con cualquier cambio de un producto (trigger trg_producto_version),
+    # COUNT con altas y bajas; MAX(cs.id) sube con cada solicitud nueva y el COUNT baja al resolverlas
+    "tablero_huella": """
+        SELECT (SELECT COUNT(*) || ':' || COALESCE(SUM(version), 0) FROM productos WHERE vendedor_id = :vendedor) AS productos,
+               (SELECT COUNT(*) || ':' || COALESCE(MAX(cs.id), 0) || ':' || COUNT(cs.conflicto) || ':'
+                       || COALESCE(SUM(length(cs.conflicto)), 0)
+                FROM productos p JOIN cambios_stock cs ON cs.producto_id = p.id AND cs.estado = 'pendiente'
+                                                      AND cs.vendedor_id = p.vendedor_id
+                WHERE p.vendedor_id = :vendedor) AS cambios""",
+    "insertar_producto": """
+        INSERT INTO productos (nombre, descripcion, precio, stock, categoria, vendedor_id, imagen_url, activo)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 1)""",
+    "actualizar_umbral_producto": "UPDATE productos SET umbral_alerta = ? WHERE id = ? AND vendedor_id = ?",
+
+    # --- Solicitudes de cambio (cambios_stock) ---
+    "insertar_cambio_stock": f"""
+        INSERT INTO cambios_stock (producto_id, vendedor_id, stock_anterior, stock_nuevo, precio_anterior, precio_nuevo,
+                                   porcentaje_cambio, motivo, version_producto, estado, fecha_solicitud, solicitud_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'pendiente', datetime('now'), {_AHORA})""",
+    "cambios_pendientes": f"""
+        SELECT cs.id, cs.producto_id, p.nombre, p.nombre AS producto_nombre, u.username AS vendedor,
+               cs.stock_anterior, cs.stock_nuevo, cs.precio_anterior, cs.precio_nuevo, cs.porcentaje_cambio,
+               cs.motivo, {_hora_local("cs.solicitud_ts", "cs.fecha_solicitud")}, p.stock AS stock_actual, cs.conflicto
+        FROM cambios_stock cs JOIN productos p ON cs.producto_id = p.id JOIN usuarios u ON cs.vendedor_id = u.id
+        WHERE cs.estado = 'pendiente' ORDER BY cs.solicitud_ts DESC""",
+    "cambios_autorizados": f"""
+        SELECT cs.id, cs.producto_id, p.nombre, u.username AS vendedor, cs.stock_anterior, cs.stock_nuevo,
+               cs.precio_anterior, cs.precio_nuevo, cs.porcentaje_cambio, cs.motivo,
+               {_hora_local("cs.autorizacion_ts", "cs.fecha_autorizacion")}, cs.autorizado_por
+        FROM cambios_stock cs JOIN productos p ON cs.producto_id = p.id JOIN usuarios u ON cs.vendedor_id = u.id
+        WHERE cs.estado = 'autorizado' ORDER BY cs.autorizacion_ts DESC LIMIT 10""",
+    # Lote de aprobación: ids en una tabla temporal y sentencias por conjunto
+    "lote_crear": "CREATE TEMP TABLE IF NOT EXISTS lote_cambios (id INTEGER PRIMARY KEY)",
+    "lote_vaciar": "DELETE FROM lote_cambios",
+    "lote_agregar": "INSERT INTO lote_cambios (id) VALUES (?)",
+    "lote_solo_pendientes": "DELETE FROM lote_cambios WHERE id NOT IN (SELECT id FROM cambios_stock WHERE estado = 'pendiente')",
+    "lote_rechazar": f"""
+        UPDATE cambios_stock SET estado = 'rechazado', fecha_autorizacion = datetime('now'), autorizacion_ts = {_AHORA}
+        WHERE id IN (SELECT id FROM lote_cambios)""",
+    "lote_aplicar_bajas": f"""
+        UPDATE productos SET stock = 0, activo = 0, version = version + 1
+        WHERE id IN ({_BAJAS_DEL_LOTE})""",
+    # Plan del lote: por producto gana la solicitud más reciente. Si el producto cambió desde la
+    # solicitud (otra versión) se reajusta: el stock se aplica como diferencia sobre el actual y el
+    # precio solo si nadie lo cambió mientras tanto. Lo que no se puede reajustar queda en conflicto.
+    # Si el mismo lote da de baja el producto, la baja gana y sus otras solicitudes se cierran con ella.
+    "lote_plan_crear": """
+        CREATE TEMP TABLE IF NOT EXISTS lote_plan (
+            producto_id INTEGER PRIMARY KEY, cambio_id INTEGER, version INTEGER, stock INTEGER, precio REAL,
+            reajustado INTEGER, conflicto TEXT)""",
+    "lote_plan_vaciar": "DELETE FROM lote_plan",
+    "lote_planificar": f"""
+        WITH ultimo AS (
+            SELECT cs.producto_id, MAX(cs.id) AS cambio_id
+            FROM cambios_stock cs JOIN lote_cambios l ON l.id = cs.id
+            WHERE NOT ({_ES_BAJA}) AND cs.producto_id NOT IN ({_BAJAS_DEL_LOTE})
+            GROUP BY cs.producto_id
+        ), plan AS (
+            SELECT p.id AS producto_id, cs.id AS cambio_id, p.version, p.precio AS precio_actual,
+                   p.stock + cs.stock_nuevo - cs.stock_anterior AS stock,
+                   CASE WHEN cs.precio_nuevo IS cs.precio_anterior THEN p.precio
+                        WHEN cs.version_producto IS p.version OR p.precio IS cs.precio_anterior THEN cs.precio_nuevo
+                   END AS precio,
+                   -- Solicitudes de antes de la versión: frescas si el stock y el precio siguen iguales
+                   NOT COALESCE(cs.version_producto = p.version,
+                                p.stock IS cs.stock_anterior AND p.precio IS cs.precio_anterior) AS reajustado
+            FROM ultimo u JOIN cambios_stock cs ON cs.id = u.cambio_id JOIN productos p ON p.id = u.producto_id
+        )
+        INSERT INTO lote_plan (producto_id, cambio_id, version, stock, precio, reajustado, conflicto)
+        SELECT producto_id, cambio_id, version, stock, precio, reajustado,
+               CASE WHEN stock < 0 THEN 'Con las ventas desde la solicitud el stock quedaría en ' || stock
+                    WHEN precio IS NULL THEN 'El precio cambió a $' || printf('%.2f', precio_actual) || ' desde la solicitud'
+               END
+        FROM plan""",
+    "lote_marcar_conflictos": """
+        UPDATE cambios_stock SET conflicto = pl.conflicto
+        FROM lote_plan pl WHERE pl.cambio_id = cambios_stock.id AND pl.conflicto IS NOT NULL""",
+    # Las demás solicitudes del lote para un producto en conflicto tampoco se aplican
+    "lote_quitar_conflictos": f"""
+        DELETE FROM lote_cambios WHERE id IN (
+            SELECT cs.id FROM cambios_stock cs JOIN lote_plan pl ON pl.producto_id = cs.producto_id
+            WHERE pl.conflicto IS NOT NULL AND NOT ({_ES_BAJA}))""",
+    # Escribe sobre la versión planificada (plan y escritura van en la misma transacción del
+    # escritor) y sube la versión ella misma
+    "lote_aplicar_cambios": """
+        UPDATE productos SET stock = pl.stock, precio = pl.precio, version = productos.version + 1
+        FROM lote_plan pl
+        WHERE pl.producto_id = productos.id AND pl.conflicto IS NULL AND productos.version = pl.version""",
+    "lote_contar_reajustados": "SELECT COUNT(*) FROM lote_plan WHERE conflicto IS NULL AND reajustado",
+    # Autorizadas: las del plan que se escribieron (el producto quedó en la versión siguiente) y las bajas
+    "lote_marcar_autorizados": f"""
+        UPDATE cambios_stock SET estado = 'autorizado', autorizado_por = ?, fecha_autorizacion = datetime('now'),
+                                 autorizacion_ts = {_AHORA}, conflicto = NULL
+        WHERE id IN (SELECT pl.cambio_id FROM lote_plan pl JOIN productos p ON p.id = pl.producto_id
+                     WHERE pl.conflicto IS NULL AND p.version = pl.version + 1)
+           OR id IN (SELECT cs.id FROM cambios_stock cs JOIN lote_cambios l ON l.id = cs.id WHERE {_ES_BAJA})""",
+    # Las demás del lote de un producto con una autorizada (más vieja que ella, o pisada por la baja)
+    "lote_marcar_reemplazados": f"""
+        UPDATE cambios_stock SET estado = 'reemplazado', autorizado_por = ?, fecha_autorizacion = datetime('now'),
+                                 autorizacion_ts = {_AHORA}
+        WHERE id IN (SELECT id FROM lote_cambios) AND estado = 'pendiente'
+          AND producto_id IN (SELECT cs.producto_id FROM cambios_stock cs JOIN lote_cambios l ON l.id = cs.id
+                              WHERE cs.estado = 'autorizado')""",
+
+    # --- Alertas de stock bajo (alertas.py) ---
+    "alertas_contar": "SELECT COUNT(*) FROM alertas_stock WHERE activa = 1",
+    "alertas_contar_de_vendedor": "SELECT COUNT(*) FROM alertas_stock WHERE activa = 1 AND vendedor_id = ?",
+    "alertas_pagina": _ALERTAS_ACTIVAS.format(filtro=""),
+    "alertas_pagina_de_vendedor": _ALERTAS_ACTIVAS.format(filtro="AND a.vendedor_id = ?"),
+    "umbral_global": "SELECT limite_stock_alerta FROM config_empresa WHERE id = 1",
+    "cambiar_umbral_global": "UPDATE config_empresa SET limite_stock_alerta = ? WHERE id = 1",
+    # Las mismas sentencias que usa conexion.migrar_esquema al crear la tabla
+    "alertas_recalcular_resueltas": SQL_RECALCULAR_ALERTAS[0],
+    "alertas_recalcular_activas": SQL_RECALCULAR_ALERTAS[1],
+    "alertas_recalcular_nuevas": SQL_RECALCULAR_ALERTAS[2],
+
+    # --- Reportes de ventas (reportes.py); parámetros con nombre ---
+    "reporte_serie": """
+        WITH v AS (
+            SELECT id, total, strftime(:fmt, fecha_ts, 'unixepoch', 'localtime') AS periodo
+            FROM ventas
+            WHERE estado = 'completada' AND fecha_ts >= :inicio AND fecha_ts < :fin
+        ),
+        por_venta AS (
+            SELECT periodo, COUNT(*) AS ventas, SUM(total) AS ingresos
+            FROM v GROUP BY periodo
+        ),
+        por_item AS (
+            SELECT v.periodo, SUM(vi.cantidad) AS unidades
+            FROM v JOIN venta_items vi ON vi.venta_id = v.id
+            GROUP BY v.periodo
+        )
+        SELECT pv.periodo, pv.ventas, ROUND(pv.ingresos, 2) AS ingresos,
+               COALESCE(pi.unidades, 0) AS unidades,
+               ROUND(pv.ingresos / pv.ventas, 2) AS ticket_promedio,
+               ROUND(SUM(pv.ingresos) OVER (ORDER BY pv.periodo), 2) AS ingresos_acumulados
+        FROM por_venta pv LEFT JOIN por_item pi ON pi.periodo = pv.periodo
+        ORDER BY pv.periodo""",
+    "reporte_desglose_categoria": _DESGLOSE_VENTAS.format(clave="COALESCE(p.categoria, 'General')"),
+    "reporte_desglose_producto": _DESGLOSE_VENTAS.format(clave="COALESCE(p.nombre, 'Producto #' || vi.producto_id)"),
+
+    # --- Exportaciones (exportar.py); se recorren en bloques con bloques() ---
+    "exportar_ventas": f"""
+        SELECT v.id, v.numero_pedido, {_hora_local("v.fecha_ts", "v.fecha")}, v.estado, v.usuario_id, v.total,
+               vi.producto_id, p.nombre, vi.cantidad, vi.precio_unitario
+        FROM ventas v
+        JOIN venta_items vi ON vi.venta_id = v.id
+        LEFT JOIN productos p ON p.id = vi.producto_id
+        WHERE v.fecha_ts >= ? AND v.fecha_ts < ?
+        ORDER BY v.id, vi.id""",
+    "exportar_cambios_stock": f"""
+        SELECT cs.id, cs.producto_id, p.nombre, cs.vendedor_id, cs.stock_anterior, cs.stock_nuevo,
+               cs.precio_anterior, cs.precio_nuevo, cs.porcentaje_cambio, cs.motivo, cs.estado,
+               {_hora_local("cs.solicitud_ts", "cs.fecha_solicitud")},
+               {_hora_local("cs.autorizacion_ts", "cs.fecha_autorizacion")}, cs.autorizado_por
+        FROM cambios_stock cs
+        LEFT JOIN productos p ON p.id = cs.producto_id
+        WHERE cs.solicitud_ts >= ? AND cs.solicitud_ts < ?
+        ORDER BY cs.id""",
+    "exportar_productos": "SELECT id, nombre, categoria, precio, stock, activo, vendedor_id FROM productos ORDER BY id",
+
+    # --- Cancelaciones (cancelaciones.py) ---
+    "minutos_cancelacion": "SELECT minutos_cancelacion FROM config_empresa WHERE id = 1",
+    # Los ids van como arreglo JSON (json_each): el texto no cambia con la cantidad y la sentencia queda en cache.
+    # El cambio de estado va primero y toma el lock de escritura: una venta nunca se repone dos veces.
+    "cancelar_ventas": """
+        UPDATE ventas SET estado = 'cancelada', cancelable = 0
+        WHERE id IN (SELECT value FROM json_each(:ids)) AND estado = 'completada'
+          AND (:usuario_id IS NULL OR usuario_id = :usuario_id)
+          AND (:limite IS NULL OR fecha_ts >= :limite)
+        RETURNING id""",
+    "reponer_stock_de_ventas": """
+        UPDATE productos SET stock = stock + (
+            SELECT SUM(vi.cantidad) FROM venta_items vi
+            WHERE vi.venta_id IN (SELECT value FROM json_each(:ids)) AND vi.producto_id = productos.id),
+            version = version + 1
+        WHERE id IN (SELECT producto_id FROM venta_items WHERE venta_id IN (SELECT value FROM json_each(:ids)))""",
+    "marcar_no_cancelables": """
+        UPDATE ventas SET cancelable = 0
+        WHERE id IN (SELECT id FROM ventas WHERE cancelable = 1 AND fecha_ts < ? LIMIT ?)""",
+
+    # --- Reservas del carrito (reservas.py); parámetros con nombre ---
+    "stock_disponible": f"""
+        SELECT p.stock - {_RESERVADO_POR_OTROS} FROM productos p WHERE p.id = :id AND p.activo = 1""",
+    "reservado_por_producto": "SELECT producto_id, SUM(cantidad) FROM reservas WHERE expira_en > ? GROUP BY producto_id",
+    # Una sola sentencia (atómica en SQLite): si no alcanza lo disponible no inserta ni actualiza
+    "reservar": f"""
+        INSERT INTO reservas (sesion, producto_id, cantidad, expira_en)
+        SELECT :sesion, p.id, :cantidad, :expira FROM productos p
+        WHERE p.id = :id AND p.activo = 1 AND p.stock - {_RESERVADO_POR_OTROS} >= :cantidad
+        ON CONFLICT(sesion, producto_id) DO UPDATE SET cantidad = excluded.cantidad, expira_en = excluded.expira_en""",
+    "liberar_reservas": "DELETE FROM reservas WHERE sesion = ?",
+    "liberar_reserva": "DELETE FROM reservas WHERE sesion = ? AND producto_id = ?",
+    "renovar_reservas": "UPDATE reservas SET expira_en = ? WHERE sesion = ? AND expira_en > ?",
+    "descontar_stock": "UPDATE productos SET stock = stock - ?, version = version + 1 WHERE id = ? AND stock >= ?",
+    "barrer_reservas": "DELETE FROM reservas WHERE id IN (SELECT id FROM reservas WHERE expira_en <= ? LIMIT ?)",
+
+    # --- Libro de movimientos de stock (movimientos.py); fechas en segundos unix ---
+    # Un snapshot por producto con movimientos posteriores al último snapshot; el saldo
+    # es el del snapshot anterior más los deltas nuevos (no se lee productos.stock)
+    "movimientos_tomar_snapshots": """
+        INSERT INTO stock_snapshots (producto_id, stock, movimiento_id, fecha)
+        WITH ultimo AS (
+            SELECT producto_id, MAX(movimiento_id) AS movimiento_id FROM stock_snapshots GROUP BY producto_id
+        ),
+        nuevos AS (
+            SELECT m.producto_id, MAX(m.id) AS movimiento_id, SUM(m.delta) AS delta, MAX(m.fecha) AS fecha
+            FROM movimientos_stock m LEFT JOIN ultimo u ON u.producto_id = m.producto_id
+            WHERE m.id > COALESCE(u.movimiento_id, 0)
+            GROUP BY m.producto_id
+        )
+        SELECT n.producto_id, COALESCE(s.stock, 0) + n.delta, n.movimiento_id, n.fecha
+        FROM nuevos n
+        LEFT JOIN ultimo u ON u.producto_id = n.producto_id
+        LEFT JOIN stock_snapshots s ON s.producto_id = u.producto_id AND s.movimiento_id = u.movimiento_id""",
+    "movimientos_stock_en": """
+        WITH base AS (
+            SELECT stock, movimiento_id FROM stock_snapshots
+            WHERE producto_id = :producto_id AND fecha <= :momento
+            ORDER BY movimiento_id DESC LIMIT 1
+        )
+        SELECT COALESCE((SELECT stock FROM base), 0) + COALESCE(SUM(m.delta), 0) AS stock,
+               (SELECT COUNT(*) FROM base) + COUNT(m.id) AS filas
+        FROM movimientos_stock m
+        WHERE m.producto_id = :producto_id AND m.id > COALESCE((SELECT movimiento_id FROM base), 0) AND m.fecha <= :momento""",
+    "movimientos_stock_en_todos": """
+        WITH base AS (
+            SELECT producto_id, stock, movimiento_id FROM (
+                SELECT producto_id, stock, movimiento_id,
+                       ROW_NUMBER() OVER (PARTITION BY producto_id ORDER BY movimiento_id DESC) AS n
+                FROM stock_snapshots WHERE fecha <= :momento)
+            WHERE n = 1
+        )
+        SELECT p.id, p.nombre,
+               COALESCE(b.stock, 0) + COALESCE((SELECT SUM(m.delta) FROM movimientos_stock m
+                                                WHERE m.producto_id = p.id AND m.id > COALESCE(b.movimiento_id, 0)
+                                                  AND m.fecha <= :momento), 0) AS stock
+        FROM productos p LEFT JOIN base b ON b.producto_id = p.id
+        WHERE b.producto_id IS NOT NULL
+           OR EXISTS (SELECT 1 FROM movimientos_stock m WHERE m.producto_id = p.id AND m.fecha <= :momento)
+        ORDER BY p.nombre""",
+    # Último snapshot + cola del libro contra productos.stock
+    "movimientos_verificar": """
+        WITH base AS (
+            SELECT producto_id, stock, movimiento_id FROM (
+                SELECT producto_id, stock, movimiento_id,
+                       ROW_NUMBER() OVER (PARTITION BY producto_id ORDER BY movimiento_id DESC) AS n
+                FROM stock_snapshots)
+            WHERE n = 1
+        ),
+        libro AS (
+            SELECT p.id AS producto_id, p.stock AS actual,
+                   COALESCE(b.stock, 0) + COALESCE((SELECT SUM(m.delta) FROM movimientos_stock m
+                                                    WHERE m.producto_id = p.id AND m.id > COALESCE(b.movimiento_id, 0)), 0) AS libro
+            FROM productos p LEFT JOIN base b ON b.producto_id = p.id
+        )
+        SELECT producto_id, libro, actual FROM libro WHERE libro <> actual""",
+    # Cada snapshot contra la suma de todos los movimientos hasta él (recorre el libro entero)
+    "movimientos_verificar_snapshots": """
+        WITH acumulado AS (
+            SELECT id, SUM(delta) OVER (PARTITION BY producto_id ORDER BY id) AS saldo FROM movimientos_stock
+        )
+        SELECT s.producto_id, s.movimiento_id, s.stock, a.saldo
+        FROM stock_snapshots s LEFT JOIN acumulado a ON a.id = s.movimiento_id
+        WHERE a.saldo IS NULL OR a.saldo <> s.stock""",
+
+    # --- Pronóstico de reposición (pronostico.py) ---
+    "pronostico_productos": "SELECT id, stock FROM productos WHERE vendedor_id = ? AND activo = 1 ORDER BY id",
+    # dia = 0 para el primer día de la ventana, DIAS - 1 para hoy (en hora local; :inicio_ts es su medianoche)
+    "pronostico_ventas": """
+        SELECT vi.id, vi.producto_id,
+               CAST(julianday(date(v.fecha_ts, 'unixepoch', 'localtime')) - julianday(:inicio) AS INTEGER) AS dia, vi.cantidad
+        FROM venta_items vi
+        JOIN ventas v ON v.id = vi.venta_id
+        JOIN productos p ON p.id = vi.producto_id
+        WHERE p.vendedor_id = :vendedor AND p.activo = 1 AND v.estado = 'completada'
+          AND v.fecha_ts >= :inicio_ts AND vi.id > :desde""",
+
+    # --- Auditoría (auditoria.py); un lote por executemany ---
+    "registrar_acciones": "INSERT INTO acciones_admin (admin_id, accion, detalle, fecha) VALUES (?, ?, ?, ?)",
+
+    # --- Archivo mensual (archivo.py); `main.` porque la conexión tiene adjunto un mes como `arch` ---
+    "dias_archivo": "SELECT dias_archivo FROM config_empresa WHERE id = 1",
+    "tabla_existe": "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+    "archivo_ventas_cerradas": _VENTAS_CERRADAS.format(pendientes=""),
+    # Una venta con un pedido de cancelación sin responder no se archiva
+    "archivo_ventas_cerradas_sin_pedidos": _VENTAS_CERRADAS.format(pendientes="""
+          AND id NOT IN (SELECT venta_id FROM cancelaciones WHERE estado = 'pendiente' AND venta_id IS NOT NULL)"""),
+    "archivo_cambios_resueltos": """
+        SELECT id, strftime('%Y-%m', solicitud_ts, 'unixepoch', 'localtime') FROM cambios_stock
+        WHERE solicitud_ts < ? AND estado IN ('autorizado', 'rechazado', 'reemplazado')
+        ORDER BY id LIMIT ?""",
+    "archivo_sumar_productos": f"""
+        INSERT INTO archivo_productos (producto_id, unidades)
+        SELECT vi.producto_id, SUM(vi.cantidad) FROM main.venta_items vi JOIN main.ventas v ON v.id = vi.venta_id
+        WHERE v.id IN {_LOTE} AND v.estado = 'completada' GROUP BY vi.producto_id
+        ON CONFLICT(producto_id) DO UPDATE SET unidades = unidades + excluded.unidades""",
+    "archivo_totales_lote": f"""
+        SELECT COUNT(*) AS completadas, COALESCE(SUM(total), 0) AS ingresos
+        FROM main.ventas WHERE id IN {_LOTE} AND estado = 'completada'""",
+    "archivo_anotar_clientes": f"""
+        INSERT OR IGNORE INTO archivo_clientes (usuario_id, mes)
+        SELECT DISTINCT usuario_id, ? FROM main.ventas WHERE id IN {_LOTE} AND usuario_id IS NOT NULL""",
+    "archivo_borrar_items": f"DELETE FROM main.venta_items WHERE venta_id IN {_LOTE}",
+    "archivo_borrar_ventas": f"DELETE FROM main.ventas WHERE id IN {_LOTE}",
+    "archivo_borrar_cambios": f"DELETE FROM main.cambios_stock WHERE id IN {_LOTE}",
+    "archivo_sumar_mes_ventas": """
+        INSERT INTO archivo_meses (mes, ventas, completadas, ingresos, actualizado) VALUES (?, ?, ?, ?, datetime('now'))
+        ON CONFLICT(mes) DO UPDATE SET ventas = ventas + excluded.ventas, completadas = completadas + excluded.completadas,
+                                       ingresos = ingresos + excluded.ingresos, actualizado = excluded.actualizado""",
+    "archivo_sumar_mes_cambios": """
+        INSERT INTO archivo_meses (mes, cambios, actualizado) VALUES (?, ?, datetime('now'))
+        ON CONFLICT(mes) DO UPDATE SET cambios = cambios + excluded.cambios, actualizado = excluded.actualizado""",
+    "archivo_meses": "SELECT mes FROM archivo_meses ORDER BY mes",
+    "archivo_meses_de_cliente": "SELECT mes FROM archivo_clientes WHERE usuario_id = ? ORDER BY mes",
+    # Cambia cada vez que el archivador agrega filas al mes: invalida la copia en la caché de la conexión
+    "archivo_estados": "SELECT mes, ventas || '/' || cambios || '/' || COALESCE(actualizado, '') FROM archivo_meses",
+    # Meses copiados a la caché TEMP de la conexión (ver archivo.con_archivo); `usado` en segundos unix
+    "archivo_cache_crear": """
+        CREATE TEMP TABLE IF NOT EXISTS archivo_cargados (
+            tabla TEXT, mes TEXT, estado TEXT, usado REAL, PRIMARY KEY(tabla, mes))""",
+    "archivo_cache_cargados": "SELECT tabla, mes, estado FROM temp.archivo_cargados",
+    "archivo_cache_anotar": "INSERT OR REPLACE INTO temp.archivo_cargados (tabla, mes, estado, usado) VALUES (?, ?, ?, ?)",
+    "archivo_cache_usar": "UPDATE temp.archivo_cargados SET usado = ? WHERE mes IN (SELECT value FROM json_each(?))",
+    "archivo_cache_olvidar_tabla": "DELETE FROM temp.archivo_cargados WHERE tabla = ?",
+    "archivo_cache_olvidar_mes": "DELETE FROM temp.archivo_cargados WHERE mes = ?",
+    "archivo_cache_borrar": "DROP TABLE IF EXISTS temp.archivo_cargados",
+    # Meses a sacar de la caché: los que no se usan hace `ttl` segundos y los que pasan el tope (menos usados primero)
+    "archivo_cache_sobrantes": """
+        SELECT mes FROM (SELECT mes, MAX(usado) AS usado FROM temp.archivo_cargados GROUP BY mes)
+        WHERE usado < :vence
+           OR mes NOT IN (SELECT mes FROM temp.archivo_cargados GROUP BY mes ORDER BY MAX(usado) DESC LIMIT :tope)""",
+}
+
+# ---------------------------------------------------------------------------
+# Filas
+# ---------------------------------------------------------------------------
+
+
+class Fila(tuple):
+    """Tupla con acceso por nombre. Compatible con el uso que se hacía de sqlite3.Row."""
+    __slots__ = ()
+    _campos = ()
+    _consulta = None
+
+    def __getitem__(self, clave):
+        if isinstance(clave, str): return getattr(self, clave)
+        return tuple.__getitem__(self, clave)
+
+    def keys(self):
+        return self._campos
+
+    def _asdict(self):
+        return dict(zip(self._campos, self))
+
+    def __reduce__(self):
+        # Las clases se crean en tiempo de ejecución: para pickle (cache compartido) se rearman por consulta
+        return _reconstruir, (self._consulta, self._campos, tuple(self))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{c}={v!r}' for c, v in zip(self._campos, self))})"
+
+
+_clases = {}
+
+
+def _clase(nombre, campos):
+    """Clase de fila para una consulta; se arma en la primera ejecución a partir de cursor.description."""
+    clase = _clases.get(nombre)
+    if clase is None:
+        atributos = {"__slots__": (), "_campos": tuple(campos), "_consulta": nombre}
+        for i, campo in enumerate(campos):
+            atributos[campo] = property(itemgetter(i))
+        clase = _clases[nombre] = type(nombre.title().replace("_", ""), (Fila,), atributos)
+    return clase
+
+
+def _campos(descripcion):
+    return [d[0] for d in descripcion]
+
+
+def _reconstruir(consulta, campos, valores):
+    return _clase(consulta, campos)(valores)
+
+# ---------------------------------------------------------------------------
+# Conexiones reutilizadas por hilo
+# ---------------------------------------------------------------------------
+
+
+class Conexion(sqlite3.Connection):
+    """close() devuelve la conexión al pool del hilo (con rollback de lo no confirmado)."""
+
+    def close(self):
+        if self.in_transaction: self.rollback()
+        self.row_factory = sqlite3.Row
+        libres = _libres(self.db_path)
+        if len(libres) < CONEXIONES_LIBRES_POR_HILO: libres.append(self)
+        else: self.cerrar()
+
+    def cerrar(self):
+        super().close()
+
+
+_local = threading.local()
+
+
+def _libres(db_path):
+    pools = getattr(_local, "pools", None)
+    if pools is None: pools = _local.pools = OrderedDict()
+    libres = pools.get(db_path)
+    if libres is None:
+        libres = pools[db_path] = []
+        # Acotado: se cierran las conexiones libres de la base usada hace más tiempo
+        while len(pools) > MAX_BASES_POR_HILO:
+            for conn in pools.popitem(last=False)[1]: conn.cerrar()
+    else:
+        pools.move_to_end(db_path)
+    return libres
+
+
+def conectar(db_path):
+    """Conexión (con sqlite3.Row por defecto) del pool del hilo actual, o una nueva."""
+    libres = _libres(db_path)
+    if libres: return libres.pop()
+    conn = sqlite3.connect(db_path, factory=Conexion, cached_statements=SENTENCIAS_EN_CACHE)
+    conn.db_path = db_path
+    conn.row_factory = sqlite3.Row
+    return conn
+
+# ---------------------------------------------------------------------------
+# Ejecución y medición
+# ---------------------------------------------------------------------------
+
+_estadisticas = {}
+_hooks = []
+_lock_estadisticas = threading.Lock()
+
+
+def al_medir(funcion):
+    """Registra funcion(nombre, ms, filas), llamada después de cada consulta. Se puede usar como decorador."""
+    _hooks.append(funcion)
+    return funcion
+
+
+def _medir(nombre, inicio, filas):
+    ms = (time.perf_counter() - inicio) * 1000
+    with _lock_estadisticas:
+        e = _estadisticas.get(nombre)
+        if e is None: e = _estadisticas[nombre] = [0, 0.0, 0.0]
+        e[0] += 1
+        e[1] += ms
+        if ms > e[2]: e[2] = ms
+    for hook in _hooks:
+        hook(nombre, ms, filas)
+
+
+def _ejecutar(conn, nombre, params):
+    cur = conn.cursor()
+    # Tuplas crudas: la fila se arma con la clase de la consulta
+    cur.row_factory = None
+    return cur.execute(CONSULTAS[nombre], params)
+
+
+def todos(conn, nombre, params=()):
+    """Lista de filas de la consulta `nombre`."""
+    inicio = time.perf_counter()
+    cur = _ejecutar(conn, nombre, params)
+    filas = cur.fetchall()
+    resultado = list(map(_clases.get(nombre) or _clase(nombre, _campos(cur.description)), filas)) if filas else []
+    _medir(nombre, inicio, len(resultado))
+    return resultado
+
+
+def uno(conn, nombre, params=()):
+    """Primera fila de la consulta `nombre`, o None."""
+    inicio = time.perf_counter()
+    cur = _ejecutar(conn, nombre, params)
+    fila = cur.fetchone()
+    _medir(nombre, inicio, 0 if fila is None else 1)
+    if fila is None: return None
+    return (_clases.get(nombre) or _clase(nombre, _campos(cur.description)))(fila)
+
+
+def valor(conn, nombre, params=(), defecto=None):
+    """Primera columna de la primera fila, o `defecto`."""
+    inicio = time.perf_counter()
+    fila = _ejecutar(conn, nombre, params).fetchone()
+    _medir(nombre, inicio, 0 if fila is None else 1)
+    return defecto if fila is None else fila[0]
+
+
+def ejecutar(conn, nombre, params=()):
+    """INSERT/UPDATE/DELETE con nombre. Devuelve el cursor (rowcount, lastrowid). No hace commit."""
+    inicio = time.perf_counter()
+    cur = _ejecutar(conn, nombre, params)
+    _medir(nombre, inicio, cur.rowcount)
+    return cur
+
+
+def ejecutar_muchos(conn, nombre, lista_params):
+    inicio = time.perf_counter()
+    cur = conn.cursor()
+    cur.executemany(CONSULTAS[nombre], lista_params)
+    _medir(nombre, inicio, cur.rowcount)
+    return cur
+
+
+def bloques(conn, nombre, params=(), tamano=500):
+    """Generador de listas de hasta `tamano` tuplas crudas, para recorrer resultados grandes sin
+    cargarlos enteros. Se mide al terminar el recorrido (el tiempo incluye al consumidor)."""
+    inicio = time.perf_counter()
+    cur = _ejecutar(conn, nombre, params)
+    filas = 0
+    try:
+        while True:
+            bloque = cur.fetchmany(tamano)
+            if not bloque: return
+            filas += len(bloque)
+            yield bloque
+    finally:
+        # Si el consumidor corta antes, la sentencia no queda abierta
+        cur.close()
+        _medir(nombre, inicio, filas)
+
+
+def estadisticas():
+    """{nombre: {"llamadas", "ms_total", "ms_promedio", "ms_max"}}, de la más costosa a la menos."""
+    with _lock_estadisticas:
+        copia = {n: list(e) for n, e in _estadisticas.items()}
+    return {n: {"llamadas": c, "ms_total": round(t, 2), "ms_promedio": round(t / c, 3), "ms_max": round(m, 2)}
+            for n, (c, t, m) in sorted(copia.items(), key=lambda x: -x[1][1])}
@@ -0,0 +1,100 @@
+# reservas.py
+# Reservas de stock con vencimiento para el carrito.
+# Agregar al carrito aparta unidades en la tabla `reservas` por TTL_SEGUNDOS;
+# el stock disponible para los demás es stock - reservas activas. En el pago
+# las reservas de la sesión se convierten en venta dentro de la misma
+# transacción, y un barrido periódico borra las vencidas.
+#
+# Cada carrito se identifica con una clave aleatoria guardada en la sesión
+# (así funciona también para invitados). Las sentencias están en
+# repositorio.CONSULTAS.
+import time
+
+import repositorio
+
+TTL_SEGUNDOS = 15 * 60
+TAMANO_LOTE = 1000
+
+
+class SinStock(Exception):
+    """No hay stock disponible para convertir la reserva en venta."""
+
+    def __init__(self, producto_id, disponible):
+        super().__init__(f"Stock insuficiente para el producto {producto_id}")
+        self.producto_id = producto_id
+        self.disponible = disponible
+
+
+def disponible(conn, producto_id, sesion=""):
+    """Stock que puede apartar `sesion`: el físico menos lo reservado por otros carritos."""
+    valor = repositorio.valor(conn, "stock_disponible", {"id": producto_id, "sesion": sesion, "ahora": int(time.time())})
+    return 0 if valor is None else max(0, valor)
+
+
+def reservado_por_producto(conn):
+    """Unidades apartadas por todos los carritos activos, por producto (para las tarjetas del catálogo)."""
+    return dict(repositorio.todos(conn, "reservado_por_producto", (int(time.time()),)))
+
+
+def reservar(conn, sesion, producto_id, cantidad):
+    """Fija la reserva de `sesion` para el producto en `cantidad` unidades y renueva su vencimiento.
+
+    Es una sola sentencia (atómica en SQLite): si no alcanza el stock disponible no
+    cambia nada y devuelve False. Con cantidad <= 0 libera la reserva. No hace commit.
+    """
+    if cantidad <= 0:
+        liberar(conn, sesion, producto_id)
+        return True
+    ahora = int(time.time())
+    cur = repositorio.ejecutar(conn, "reservar", {"sesion": sesion, "id": producto_id, "cantidad": cantidad, "ahora": ahora, "expira": ahora + TTL_SEGUNDOS})
+    return cur.rowcount > 0
+
+
+def liberar(conn, sesion, producto_id=None):
+    """Borra las reservas de la sesión (de un producto o todas). No hace commit."""
+    if producto_id is None:
+        repositorio.ejecutar(conn, "liberar_reservas", (sesion,))
+    else:
+        repositorio.ejecutar(conn, "liberar_reserva", (sesion, producto_id))
+
+
+def renovar(conn, sesion):
+    """Extiende el vencimiento de todas las reservas activas de la sesión (p. ej. al entrar al checkout)."""
+    ahora = int(time.time())
+    repositorio.ejecutar(conn, "renovar_reservas", (ahora + TTL_SEGUNDOS, sesion, ahora))
+
+
+def convertir(conn, sesion, carrito):
+    """Descuenta del stock las unidades del carrito y borra las reservas de la sesión.
+
+    Debe llamarse dentro de la transacción que inserta la venta: si una reserva
+    venció y otro carrito tomó el stock, lanza SinStock y el llamador hace rollback.
+    """
+    for pid, item in carrito.items():
+        # Re-aparta lo del carrito: mantiene la reserva o la recupera si venció y sigue habiendo stock
+        if not reservar(conn, sesion, int(pid), item["cantidad"]):
+            raise SinStock(int(pid), disponible(conn, int(pid), sesion))
+        # Descuento condicional (nunca deja stock negativo); sube la versión para que una aprobación
+        # pendiente calculada sobre el stock anterior se reajuste (ver app.aplicar_cambios_lote)
+        if not repositorio.ejecutar(conn, "descontar_stock", (item["cantidad"], pid, item["cantidad"])).rowcount:
+            raise SinStock(int(pid), disponible(conn, int(pid), sesion))
+    liberar(conn, sesion)
+
+
+def borrar_vencidas(conn, ahora):
+    """Un lote del barrido: borra hasta TAMANO_LOTE reservas vencidas. Devuelve cuántas. No hace commit."""
+    return repositorio.ejecutar(conn, "barrer_reservas", (ahora, TAMANO_LOTE)).rowcount
+
+
+def barrer_vencidas(conn=None, escribir=None):
+    """Borra las reservas vencidas en lotes. Devuelve cuántas borró.
+    Con `escribir` (app.escribir) cada lote es una unidad del escritor; si no, commit por lote en `conn`."""
+    ahora = int(time.time())
+    total = 0
+    while True:
+        if escribir: borradas = escribir(borrar_vencidas, ahora)
+        else:
+            borradas = borrar_vencidas(conn, ahora)
+            conn.commit()
+        total += borradas
+        if borradas < TAMANO_LOTE: return total
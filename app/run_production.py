@@ -1,6 +1,8 @@
 import os
 os.environ['FLASK_ENV'] = 'production'
-from app import app
+from app import crear_app
+
+app = crear_app()
 
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
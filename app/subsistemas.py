@@ -0,0 +1,52 @@
+# subsistemas.py
+# Importación diferida de dependencias pesadas u opcionales.
+# xhtml2pdf arrastra reportlab y html5lib, y la API externa arrastra
+# requests: solo se importan la primera vez que una ruta los necesita,
+# así el arranque de cada worker y de los scripts no paga ese costo.
+import importlib
+import threading
+
+_lock = threading.Lock()
+_modulos = {}
+
+
+def _importar(nombre):
+    modulo = _modulos.get(nombre)
+    if modulo is None:
+        with _lock:
+            modulo = _modulos.get(nombre)
+            if modulo is None:
+                modulo = importlib.import_module(nombre)
+                _modulos[nombre] = modulo
+    return modulo
+
+
+def pdf():
+    """Módulo xhtml2pdf.pisa (generación de comprobantes en PDF)."""
+    return _importar("xhtml2pdf.pisa")
+
+
+def api_productos():
+    """Módulo api_helper (búsqueda en Open Food Facts, usa requests)."""
+    return _importar("api_helper")
+
+
+def pil_image():
+    """PIL.Image o None si Pillow no está instalado."""
+    try:
+        return _importar("PIL.Image")
+    except ImportError:
+        return None
+
+
+def numpy():
+    """NumPy o None si no está instalado (el pronóstico tiene una versión en Python puro)."""
+    try:
+        return _importar("numpy")
+    except ImportError:
+        return None
+
+
+def cargados():
+    """Nombres de los subsistemas que ya se importaron (para métricas)."""
+    return sorted(_modulos)
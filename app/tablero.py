@@ -0,0 +1,71 @@
+# tablero.py
+# Datos del panel del vendedor.
+# Una sola consulta (repositorio "tablero_vendedor") trae cada producto del
+# vendedor con su alerta de stock bajo y sus solicitudes pendientes; de esas
+# filas salen las tres listas del panel: productos, stock bajo y
+# solicitudes. El resultado queda en cache por vendedor; el panel y la API
+# muestran los productos de a POR_PAGINA.
+#
+# Invalidación: la clave lleva la huella de los datos del vendedor
+# (repositorio "tablero_huella": versiones de sus productos y solicitudes
+# pendientes, leída del índice), así una venta o una aprobación de otro
+# vendedor no le vacía el panel. Lo que no mueve esas versiones invalida a
+# mano: el umbral global de alertas ("vendedores") y los umbrales por
+# producto del vendedor (su espacio, espacio(vendedor_id)).
+import cache
+import repositorio
+
+TTL = 300
+MAX_BAJO = 50     # el aviso de stock bajo del panel muestra hasta tantos productos
+POR_PAGINA = 100  # productos por página del panel y de la API (renderizar miles de filas es lo caro)
+
+CAMPOS_PRODUCTO = ("id", "nombre", "descripcion", "precio", "stock", "categoria")
+CAMPOS_CAMBIO = ("stock_anterior", "stock_nuevo", "precio_anterior", "precio_nuevo", "porcentaje_cambio", "fecha_solicitud", "conflicto")
+
+
+def espacio(vendedor_id):
+    return f"vendedor:{vendedor_id}"
+
+
+def invalidar(vendedor_id=None):
+    """Invalida el panel de un vendedor, o el de todos sin `vendedor_id`."""
+    cache.invalidar(espacio(vendedor_id) if vendedor_id is not None else "vendedores")
+
+
+def _armar(filas):
+    productos, bajo, pendientes = [], [], []
+    ultimo = None
+    for f in filas:
+        if f.id != ultimo:
+            ultimo = f.id
+            if f.activo == 1: productos.append({c: f[c] for c in CAMPOS_PRODUCTO})
+            if f.alerta_id is not None:
+                bajo.append({"id": f.alerta_id, "producto_id": f.id, "nombre": f.nombre, "stock": f.alerta_stock,
+                             "umbral": f.umbral, "creada_en": f.alerta_creada_en})
+        if f.cambio_id is not None:
+            pendientes.append({"id": f.cambio_id, "producto_id": f.id, "nombre": f.nombre, **{c: f[c] for c in CAMPOS_CAMBIO}})
+    # Mismo orden que antes: alertas más recientes primero, solicitudes por orden de llegada
+    bajo.sort(key=lambda a: a["id"], reverse=True)
+    pendientes.sort(key=lambda c: c["id"])
+    return {"productos": productos, "productos_bajo": bajo, "cambios_pendientes": pendientes}
+
+
+def datos(conn, vendedor_id):
+    """{"productos", "productos_bajo", "cambios_pendientes"} del vendedor (listas de dicts)."""
+    huella = tuple(repositorio.uno(conn, "tablero_huella", {"vendedor": vendedor_id}))
+    clave = ("tablero", vendedor_id, huella, cache.version("vendedores"))
+    return cache.obtener_o_calcular(espacio(vendedor_id), clave,
+                                    lambda: _armar(repositorio.todos(conn, "tablero_vendedor", (vendedor_id,))), ttl=TTL)
+
+
+def pagina(conn, vendedor_id, numero=1, por_pagina=POR_PAGINA):
+    """Una página de productos con los totales, todas las alertas y todas las solicitudes pendientes."""
+    por_pagina = min(max(int(por_pagina), 1), 500)
+    d = datos(conn, vendedor_id)
+    total = len(d["productos"])
+    paginas = max((total + por_pagina - 1) // por_pagina, 1)
+    numero = min(max(int(numero), 1), paginas)
+    desde = (numero - 1) * por_pagina
+    return {"pagina": numero, "por_pagina": por_pagina, "paginas": paginas, "total_productos": total,
+            "productos": d["productos"][desde:desde + por_pagina],
+            "productos_bajo": d["productos_bajo"], "cambios_pendientes": d["cambios_pendientes"]}
@@ -0,0 +1,58 @@
+# tareas.py
+# Tareas periódicas en hilos de fondo (barrido de cancelaciones, etc.).
+# Las inicia crear_app(); cada worker corre las suyas, así que las tareas
+# deben ser idempotentes (UPDATE/DELETE acotados que se pueden repetir).
+import atexit
+import logging
+import threading
+
+log = logging.getLogger("verduleria.tareas")
+
+_tareas = []
+
+
+class TareaPeriodica(threading.Thread):
+    def __init__(self, nombre, intervalo, funcion, inmediata=False):
+        super().__init__(name=f"tarea-{nombre}", daemon=True)
+        self.nombre = nombre
+        self.intervalo = intervalo
+        self.funcion = funcion
+        self.inmediata = inmediata
+        self.ejecuciones = 0
+        self.ultimo_error = None
+        self._detener = threading.Event()
+
+    def run(self):
+        if self.inmediata: self.ejecutar()
+        while not self._detener.wait(self.intervalo):
+            self.ejecutar()
+
+    def ejecutar(self):
+        try:
+            self.funcion()
+            self.ejecuciones += 1
+        except Exception as e:
+            self.ultimo_error = str(e)
+            log.exception("Error en la tarea %s", self.nombre)
+
+    def detener(self):
+        self._detener.set()
+
+
+def iniciar(nombre, intervalo, funcion, inmediata=False):
+    """Arranca `funcion` cada `intervalo` segundos en un hilo de fondo (con `inmediata`, también al iniciar)."""
+    tarea = TareaPeriodica(nombre, intervalo, funcion, inmediata)
+    _tareas.append(tarea)
+    tarea.start()
+    return tarea
+
+
+def estado():
+    return {t.nombre: {"intervalo": t.intervalo, "ejecuciones": t.ejecuciones, "ultimo_error": t.ultimo_error}
+            for t in _tareas}
+
+
+@atexit.register
+def detener_todas():
+    for tarea in _tareas:
+        tarea.detener()
@@ -0,0 +1,263 @@
+# tiendas.py
+# Varias verdulerías en la misma flota de procesos, cada una con su propia
+# base SQLite (un shard por tienda: el lock de escritura de una no frena a
+# las otras).
+#
+# Las tiendas se declaran en tiendas.json (o el archivo de TIENDAS_CONFIG):
+#     {"centro": {"hosts": ["centro.verduleria.com"]}, "norte": {}}
+# El middleware Enrutador resuelve la tienda de cada request por el host o
+# por el prefijo /t/<clave>/; el prefijo pasa de PATH_INFO a SCRIPT_NAME,
+# así las rutas de Flask no cambian y url_for arma los links con él. Sin
+# host ni prefijo conocido es la tienda principal, que sigue usando los
+# archivos de siempre (inventario.db, analitica.db, archivo/) junto a este
+# módulo; cada tienda más tiene los suyos en tiendas/<clave>/. ruta() da
+# siempre rutas absolutas, sea cual sea el directorio de trabajo.
+#
+# actual() es la tienda en curso: la fijada con usar() (tareas de fondo,
+# capa async) o la del request de Flask. ruta() da los archivos de esa
+# tienda, y el cache, los fragmentos y el pronóstico la incluyen en sus
+# claves. La sesión se firma y se nombra por tienda (SesionPorTienda): una
+# cookie de una tienda no sirve en otra.
+#
+#     python tiendas.py migrar          migra todas las bases en paralelo
+#     python tiendas.py sembrar [norte] crea las bases que faltan con los datos iniciales
+#     python tiendas.py convertir       pasa las bases a auto_vacuum incremental (ver archivo.py)
+import argparse
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from flask.sessions import SecureCookieSessionInterface
+
+PRINCIPAL = "principal"
+DIR_APP = os.path.dirname(os.path.abspath(__file__))
+DIRECTORIO = os.path.join(DIR_APP, "tiendas")
+CONFIG = os.environ.get("TIENDAS_CONFIG", os.path.join(DIR_APP, "tiendas.json"))
+HILOS = 4
+CLAVE_ENVIRON = "verduleria.tienda"
+
+CLAVE_VALIDA = re.compile(r"[a-z0-9][a-z0-9_-]{0,31}")
+PREFIJO = re.compile(r"^/t/([^/]+)(?=/|$)")
+
+log = logging.getLogger("verduleria.tiendas")
+
+_actual = contextvars.ContextVar("tienda", default=None)
+_lock = threading.Lock()
+_tiendas = None
+_hosts = None
+
+
+def _cargar():
+    global _tiendas, _hosts
+    with _lock:
+        if _tiendas is not None: return
+        try:
+            with open(CONFIG, encoding="utf-8") as f: datos = json.load(f)
+        except FileNotFoundError:
+            datos = {}
+        tiendas, hosts = {}, {}
+        for clave, opciones in datos.items():
+            if not CLAVE_VALIDA.fullmatch(clave) or clave == PRINCIPAL:
+                raise ValueError(f"Clave de tienda inválida en {CONFIG}: {clave!r}")
+            tiendas[clave] = opciones or {}
+            for host in tiendas[clave].get("hosts", []): hosts[host.lower()] = clave
+        _tiendas, _hosts = tiendas, hosts
+
+
+def configurar(tiendas=None):
+    """Recarga la configuración; con `tiendas` (dict como el de tiendas.json) la reemplaza."""
+    global _tiendas, _hosts
+    with _lock: _tiendas = _hosts = None
+    if tiendas is None: return _cargar()
+    with _lock:
+        _tiendas = {c: o or {} for c, o in tiendas.items()}
+        _hosts = {h.lower(): c for c, o in _tiendas.items() for h in (o or {}).get("hosts", [])}
+
+
+def claves():
+    """La principal y las configuradas."""
+    _cargar()
+    return [PRINCIPAL, *sorted(_tiendas)]
+
+
+def existe(clave):
+    _cargar()
+    return clave == PRINCIPAL or clave in _tiendas
+
+
+def resolver(host, ruta):
+    """(clave, prefijo) del pedido. clave es None si el prefijo nombra una tienda que no existe."""
+    _cargar()
+    encontrado = PREFIJO.match(ruta or "")
+    if encontrado:
+        clave = encontrado.group(1)
+        return (clave if clave in _tiendas else None), encontrado.group(0)
+    return _hosts.get((host or "").rsplit(":", 1)[0].lower(), PRINCIPAL), ""
+
+
+def actual():
+    clave = _actual.get()
+    if clave is not None: return clave
+    from flask import has_request_context, request
+    if has_request_context(): return request.environ.get(CLAVE_ENVIRON, PRINCIPAL)
+    return PRINCIPAL
+
+
+@contextmanager
+def usar(clave):
+    """Fija la tienda en curso dentro del bloque (hilos de fondo, corrutinas, scripts)."""
+    token = _actual.set(clave)
+    try: yield clave
+    finally: _actual.reset(token)
+
+
+def ruta(nombre=None, clave=None):
+    """Archivo `nombre` de la tienda (por defecto la en curso); sin `nombre`, su base."""
+    clave = clave or actual()
+    if clave == PRINCIPAL:
+        if nombre is None:
+            from conexion import DB_PATH
+            return os.path.join(DIR_APP, DB_PATH)
+        return os.path.join(DIR_APP, nombre)
+    return os.path.join(DIRECTORIO, clave, nombre or "inventario.db")
+
+
+def con_prefijo(texto):
+    """`texto` con la tienda en curso adelante (igual para la principal, así sus claves no cambian)."""
+    clave = actual()
+    return texto if clave == PRINCIPAL else f"{clave}:{texto}"
+
+
+class Enrutador:
+    """Middleware WSGI: anota la tienda del pedido en el environ y saca el prefijo /t/<clave> de la ruta."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        clave, prefijo = resolver(environ.get("HTTP_HOST", ""), environ.get("PATH_INFO", ""))
+        if clave is None:
+            start_response("404 NOT FOUND", [("Content-Type", "text/plain; charset=utf-8")])
+            return ["Tienda inexistente".encode()]
+        if prefijo:
+            environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + prefijo
+            environ["PATH_INFO"] = environ["PATH_INFO"][len(prefijo):] or "/"
+        environ[CLAVE_ENVIRON] = clave
+        return self.app(environ, start_response)
+
+
+class SesionPorTienda(SecureCookieSessionInterface):
+    """Cookie de sesión con nombre y firma propios de cada tienda."""
+
+    @property
+    def salt(self):
+        clave = actual()
+        return "cookie-session" if clave == PRINCIPAL else f"cookie-session:{clave}"
+
+    def get_cookie_name(self, app):
+        clave = actual()
+        nombre = super().get_cookie_name(app)
+        return nombre if clave == PRINCIPAL else f"{nombre}_{clave}"
+
+
+def en_cada(funcion):
+    """Envuelve una tarea de fondo para que corra una vez por tienda, con cada una en curso.
+    Si falla en una tienda sigue con las demás y al final relanza el último error."""
+    def correr():
+        error = None
+        for clave in claves():
+            if clave != PRINCIPAL and not os.path.exists(ruta(clave=clave)): continue
+            with usar(clave):
+                try: funcion()
+                except Exception as e:
+                    log.exception("Error en %s para la tienda %s", funcion.__name__, clave)
+                    error = e
+        if error is not None: raise error
+    correr.__name__ = funcion.__name__
+    return correr
+
+
+def para_todas(funcion, seleccion=None, hilos=HILOS):
+    """funcion(clave) para cada tienda en paralelo, con la tienda en curso. {clave: resultado o excepción}."""
+    def una(clave):
+        with usar(clave):
+            try: return funcion(clave)
+            except Exception as e:
+                log.exception("Error en la tienda %s", clave)
+                return e
+    seleccion = list(seleccion or claves())
+    with ThreadPoolExecutor(hilos, thread_name_prefix="tiendas") as pool:
+        return dict(zip(seleccion, pool.map(una, seleccion)))
+
+
+def migrar_todas(seleccion=None, hilos=HILOS):
+    """Migra el esquema de cada tienda que ya tiene base (y sus meses archivados); avisa de las que falta sembrar."""
+    import archivo
+    import conexion
+
+    def migrar(clave):
+        db_path = ruta(clave=clave)
+        if clave != PRINCIPAL and not os.path.exists(db_path):
+            log.warning("La tienda %s no tiene base (%s): correr python tiendas.py sembrar %s", clave, db_path, clave)
+            return None
+        conexion.migrar_esquema(db_path)
+        archivo.migrar(db_path)
+        return db_path
+    return para_todas(migrar, seleccion, hilos)
+
+
+def sembrar(seleccion=None, forzar=False, hilos=HILOS):
+    """Crea la base de cada tienda que no la tiene, con los datos iniciales y el esquema migrado.
+    Con `forzar` la recrea aunque exista (se pierden sus datos)."""
+    import conexion
+    import init_db_mejorado
+
+    def una(clave):
+        db_path = ruta(clave=clave)
+        if os.path.exists(db_path) and not forzar: return None
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        init_db_mejorado.init_database(db_path)
+        conexion.migrar_esquema(db_path)
+        return db_path
+    return para_todas(una, seleccion, hilos)
+
+
+def convertir_todas(seleccion=None, hilos=HILOS):
+    """Pasa a auto_vacuum incremental las bases que existen. {clave: True si se convirtió}."""
+    import conexion
+
+    def convertir(clave):
+        db_path = ruta(clave=clave)
+        return os.path.exists(db_path) and conexion.convertir_auto_vacuum(db_path)
+    return para_todas(convertir, seleccion, hilos)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migraciones y datos iniciales de todas las tiendas")
+    parser.add_argument("accion", choices=["migrar", "sembrar", "convertir", "listar"])
+    parser.add_argument("tiendas", nargs="*", help="solo estas (por defecto todas)")
+    parser.add_argument("--forzar", action="store_true", help="sembrar: recrear aunque la base exista")
+    parser.add_argument("--hilos", type=int, default=HILOS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    desconocidas = [c for c in args.tiendas if not existe(c)]
+    if desconocidas: parser.error(f"tiendas desconocidas: {', '.join(desconocidas)}")
+    if args.accion == "listar":
+        for clave in claves():
+            hosts = ", ".join(_tiendas.get(clave, {}).get("hosts", []))
+            print(f"🏪 {clave:<16} {ruta(clave=clave)}  {hosts}")
+    elif args.accion == "migrar":
+        for clave, r in migrar_todas(args.tiendas, args.hilos).items():
+            print(f"{'❌' if isinstance(r, Exception) else '✅' if r else '⚠️'} {clave}: {r or 'sin base'}")
+    elif args.accion == "convertir":
+        for clave, r in convertir_todas(args.tiendas, args.hilos).items():
+            print(f"{'❌' if isinstance(r, Exception) else '🧹' if r else '⏭️'} {clave}: "
+                  f"{r if isinstance(r, Exception) else 'convertida' if r else 'sin cambios'}")
+    else:
+        for clave, r in sembrar(args.tiendas, args.forzar, args.hilos).items():
+            print(f"{'❌' if isinstance(r, Exception) else '🌱' if r else '⏭️'} {clave}: {r or 'ya existía'}")
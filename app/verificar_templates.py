@@ -7,7 +7,7 @@ print("🔍 Verificando templates...")
 problemas = []
 
 for filename in os.listdir('templates'):
-    if filename.endswith('.html'):
+    if filename.endswith('.html') and not filename.startswith('_'):  # los parciales no extienden base
         filepath = os.path.join('templates', filename)
         
         try:
@@ -0,0 +1,96 @@
+# conftest.py
+# Las pruebas importan los módulos de app/ planos, como lo hace la app, y cada
+# una trabaja sobre una base SQLite temporal creada con init_db_mejorado
+# (usuarios admin / vendedor / cliente y el catálogo inicial).
+import os
+import sqlite3
+import sys
+
+import pytest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP)
+
+import app as modulo  # noqa: E402
+import auditoria  # noqa: E402
+import cache  # noqa: E402
+import conexion  # noqa: E402
+import init_db_mejorado  # noqa: E402
+import limitador  # noqa: E402
+import tiendas  # noqa: E402
+
+CONFIG_PRUEBAS = {"TESTING": True, "WTF_CSRF_ENABLED": False, "PRECALENTAR": False}
+
+
+@pytest.fixture(autouse=True)
+def sin_tareas(monkeypatch):
+    """Ninguna prueba arranca los barridos periódicos ni el hilo de auditoría (crear_app puede correr más de una vez)."""
+    monkeypatch.setitem(modulo.app.config, "TAREAS_EN_SEGUNDO_PLANO", False)
+    monkeypatch.setattr(auditoria, "iniciar", lambda: None)
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Base nueva de la tienda principal (app y conexion apuntan a ella durante la prueba); los demás
+    archivos de la tienda (copia de analítica, archivo/, tiendas/) quedan también en tmp_path."""
+    ruta = str(tmp_path / "inventario.db")
+    init_db_mejorado.init_database(ruta)
+    conexion.migrar_esquema(ruta)
+    monkeypatch.setattr(conexion, "DB_PATH", ruta)
+    monkeypatch.setattr(modulo, "DB_PATH", ruta)
+    monkeypatch.setattr(tiendas, "DIR_APP", str(tmp_path))
+    monkeypatch.setattr(tiendas, "DIRECTORIO", str(tmp_path / "tiendas"))
+    tiendas.configurar({})
+    cache.limpiar()
+    yield ruta
+    cache.limpiar()
+    tiendas.configurar({})
+
+
+@pytest.fixture
+def app(db_path, monkeypatch):
+    """La app lista para el test client, sin CSRF, sin precalentado y con un limitador nuevo."""
+    for clave, valor in CONFIG_PRUEBAS.items():
+        monkeypatch.setitem(modulo.app.config, clave, valor)
+    monkeypatch.setattr(modulo.time, "sleep", lambda segundos: None)  # la demora simulada del pago
+    monkeypatch.setattr(modulo, "limitador_login", limitador.Limitador(limitador.crear_store(), modulo.limitador_login.reglas))
+    return modulo.crear_app()
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+def usuario_id(conn, username):
+    return conn.execute("SELECT id FROM usuarios WHERE username = ?", (username,)).fetchone()[0]
+
+
+def producto(conn, stock=None):
+    """Id de un producto activo del vendedor; con `stock`, se lo fija antes."""
+    pid = conn.execute("SELECT id FROM productos WHERE activo = 1 ORDER BY id LIMIT 1").fetchone()[0]
+    if stock is not None:
+        conn.execute("UPDATE productos SET stock = ? WHERE id = ?", (stock, pid))
+        conn.commit()
+    return pid
+
+
+def stock(conn, pid):
+    return conn.execute("SELECT stock FROM productos WHERE id = ?", (pid,)).fetchone()[0]
+
+
+def venta(conn, username, items, fecha="2025-01-15 12:00:00"):
+    """Inserta una venta 'completada' con sus ítems ({producto_id: cantidad}, a $100) y descuenta el stock subiendo la versión, como el pago."""
+    total = 100 * sum(items.values())
+    venta_id = conn.execute("INSERT INTO ventas (usuario_id, total, fecha, estado) VALUES (?, ?, ?, 'completada')",
+                            (usuario_id(conn, username), total, fecha)).lastrowid
+    conn.execute("UPDATE ventas SET numero_pedido = ? WHERE id = ?", (f"VDL-PRUEBA-{venta_id:06d}", venta_id))
+    for pid, cantidad in items.items():
+        conn.execute("INSERT INTO venta_items (venta_id, producto_id, cantidad, precio_unitario) VALUES (?, ?, ?, 100)",
+                     (venta_id, pid, cantidad))
+        conn.execute("UPDATE productos SET stock = stock - ?, version = version + 1 WHERE id = ?", (cantidad, pid))
+    conn.commit()
+    return venta_id
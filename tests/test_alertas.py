@@ -0,0 +1,52 @@
+# Alertas de stock bajo mantenidas por triggers sobre productos.
+import alertas
+from conftest import producto, usuario_id
+
+
+def activas(conn):
+    return {a["producto_id"]: (a["stock"], a["umbral"]) for a in alertas.listar(conn, por_pagina=100)}
+
+
+def test_triggers_abren_y_resuelven(conn):
+    pid = producto(conn, stock=100)
+    assert pid not in activas(conn)
+    conn.execute("UPDATE productos SET stock = 4 WHERE id = ?", (pid,))
+    assert activas(conn)[pid] == (4, 10)
+    conn.execute("UPDATE productos SET stock = 3 WHERE id = ?", (pid,))
+    assert activas(conn)[pid] == (3, 10)  # se actualiza la misma alerta
+    conn.execute("UPDATE productos SET stock = 50 WHERE id = ?", (pid,))
+    assert pid not in activas(conn)
+    assert conn.execute("SELECT COUNT(*) FROM alertas_stock WHERE producto_id = ? AND activa = 0", (pid,)).fetchone()[0] == 1
+
+
+def test_alta_y_baja_de_producto(conn):
+    pid = conn.execute("INSERT INTO productos (nombre, precio, stock, vendedor_id) VALUES ('Kiwi', 1, 2, ?)",
+                       (usuario_id(conn, "vendedor"),)).lastrowid
+    assert pid in activas(conn)
+    conn.execute("UPDATE productos SET activo = 0 WHERE id = ?", (pid,))
+    assert pid not in activas(conn)
+
+
+def test_umbral_del_producto_y_global(conn):
+    pid = producto(conn, stock=15)
+    conn.execute("UPDATE productos SET umbral_alerta = 20 WHERE id = ?", (pid,))
+    assert activas(conn)[pid] == (15, 20)
+    conn.execute("UPDATE productos SET umbral_alerta = NULL WHERE id = ?", (pid,))
+    assert pid not in activas(conn)
+    alertas.cambiar_umbral_global(conn, 500)
+    assert alertas.umbral_global(conn) == 500
+    assert activas(conn)[pid] == (15, 500)
+    assert alertas.contar(conn) == conn.execute("SELECT COUNT(*) FROM productos WHERE activo = 1 AND stock < 500").fetchone()[0]
+    alertas.cambiar_umbral_global(conn, 1)
+    assert alertas.contar(conn) == 0
+
+
+def test_filtro_por_vendedor_y_paginas(conn):
+    alertas.cambiar_umbral_global(conn, 1000)
+    vendedor = usuario_id(conn, "vendedor")
+    total = alertas.contar(conn, vendedor)
+    assert total == alertas.contar(conn) > 2
+    assert alertas.contar(conn, usuario_id(conn, "cliente")) == 0
+    paginas = [alertas.listar(conn, vendedor, pagina, 2) for pagina in (1, 2)]
+    ids = [a["id"] for pagina in paginas for a in pagina]
+    assert len(ids) == 4 and ids == sorted(ids, reverse=True)
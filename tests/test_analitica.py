@@ -0,0 +1,50 @@
+# Copia de solo lectura para reportes: se rehace aparte y los reportes memorizados
+# siguen a la copia, aunque la haya rehecho otro worker.
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import analitica
+from conftest import APP, producto, venta
+
+
+def dueno(app):
+    c = app.test_client()
+    assert c.post("/login", data={"username": "admin", "password": "admin"}).status_code == 302
+    return c
+
+
+def ventas_reportadas(c):
+    return c.get("/api/reportes/ventas").get_json()["totales"]["ventas"]
+
+
+def test_copia_de_solo_lectura(db_path, conn):
+    assert analitica.ruta_lectura(db_path) == db_path and analitica.frescura() is None
+    assert analitica.actualizar(db_path) is not None
+    assert analitica.actualizar(db_path, si_mas_vieja_que=60) is None  # otro worker la acaba de hacer
+    assert analitica.ruta_lectura(db_path) == analitica._copia(None) and analitica.frescura()["segundos"] == 0
+    lectura = analitica.conectar_lectura(db_path)
+    with pytest.raises(sqlite3.OperationalError): lectura.execute("DELETE FROM ventas")
+    lectura.close()
+
+
+def test_la_copia_no_ve_las_ventas_nuevas_hasta_rehacerse(db_path, conn):
+    analitica.actualizar(db_path)
+    venta(conn, "cliente", {producto(conn): 1})
+    lectura = analitica.conectar_lectura(db_path)
+    assert lectura.execute("SELECT COUNT(*) FROM ventas").fetchone()[0] == 0
+    lectura.close()
+
+
+def test_copia_de_otro_worker_renueva_los_reportes(app, db_path, conn):
+    analitica.actualizar(db_path)
+    c = dueno(app)
+    assert ventas_reportadas(c) == 0
+    venta(conn, "cliente", {producto(conn): 1})
+    assert ventas_reportadas(c) == 0  # memorizado sobre la misma copia
+    # Otro proceso rehace la copia; este no invalida nada
+    codigo = f"import analitica; analitica.actualizar({db_path!r}, {analitica._copia(None)!r})"
+    subprocess.run([sys.executable, "-c", codigo], cwd=APP, check=True)
+    assert ventas_reportadas(c) == 1
@@ -0,0 +1,101 @@
+# Capa ASGI del carrito y el stock: misma sesión, mismo CSRF y mismas respuestas que Flask.
+import asyncio
+import json
+import re
+import sqlite3
+
+import pytest
+
+import api_async
+import app as modulo
+import tiendas
+from conftest import producto
+
+
+@pytest.fixture
+def capa(app, db_path):
+    return api_async.montar(app, db_path, cargar_usuario=modulo.load_user)
+
+
+def llamar(capa, metodo, ruta, datos=None, cookie=None, **encabezados):
+    """(status, encabezados, cuerpo) de un request ASGI."""
+    cuerpo = json.dumps(datos).encode() if datos is not None else b""
+    headers = [(b"host", b"localhost"), (b"content-type", b"application/json")]
+    if cookie: headers.append((b"cookie", cookie.encode()))
+    headers += [(k.replace("_", "-").lower().encode(), v.encode()) for k, v in encabezados.items()]
+    scope = {"type": "http", "method": metodo, "path": ruta, "query_string": b"", "headers": headers,
+             "scheme": "http", "server": ("localhost", 80), "client": ("127.0.0.1", 5000), "http_version": "1.1"}
+    mensajes = []
+
+    async def receive(): return {"type": "http.request", "body": cuerpo, "more_body": False}
+    async def send(mensaje): mensajes.append(mensaje)
+    asyncio.run(capa(scope, receive, send))
+    inicio = mensajes[0]
+    return (inicio["status"], [(k.decode(), v.decode()) for k, v in inicio["headers"]],
+            b"".join(m.get("body", b"") for m in mensajes[1:]))
+
+
+def cookie_de(encabezados):
+    valor = next((v for k, v in encabezados if k.lower() == "set-cookie"), None)
+    return valor.split(";", 1)[0] if valor else None
+
+
+def test_carrito_async_y_flask_comparten_sesion(app, capa, conn):
+    pid = producto(conn, stock=10)
+    conn.commit()
+    status, encabezados, cuerpo = llamar(capa, "POST", "/api/carrito/agregar", {"producto_id": pid, "cantidad": 2})
+    assert status == 200 and json.loads(cuerpo)["total_items"] == 2
+    cookie = cookie_de(encabezados)
+    assert ("vary", "Cookie") in encabezados
+
+    cliente = app.test_client()
+    cliente.set_cookie(*cookie.split("=", 1))
+    flask = cliente.get("/api/carrito").get_json()
+    _, _, cuerpo = llamar(capa, "GET", "/api/carrito", cookie=cookie)
+    assert json.loads(cuerpo) == flask and flask["total_items"] == 2
+    # La reserva la hizo la capa async: el stock para otros ya la descuenta
+    assert json.loads(llamar(capa, "GET", f"/api/stock/{pid}")[2]) == {"stock": 8}
+    assert json.loads(llamar(capa, "GET", f"/api/stock/{pid}", cookie=cookie)[2]) == {"stock": 10}
+
+
+def test_csrf_igual_que_flask_wtf(app, capa, monkeypatch):
+    monkeypatch.setitem(app.config, "WTF_CSRF_ENABLED", True)
+    r = app.test_client().get("/")
+    token = re.search(r'name="csrf-token" content="([^"]+)"', r.get_data(as_text=True)).group(1)
+    cookie = r.headers["Set-Cookie"].split(";", 1)[0]
+
+    status, _, cuerpo = llamar(capa, "POST", "/api/carrito/limpiar", cookie=cookie)
+    assert (status, json.loads(cuerpo)["error"]) == (400, "The CSRF token is missing.")
+    status, _, cuerpo = llamar(capa, "POST", "/api/carrito/limpiar", cookie=cookie, X_CSRFToken="falso")
+    assert (status, json.loads(cuerpo)["error"]) == (400, "The CSRF token is invalid.")
+    assert llamar(capa, "POST", "/api/carrito/limpiar", cookie=cookie, X_CSRFToken=token)[0] == 200
+    # GET no pide token
+    assert llamar(capa, "GET", "/api/carrito")[0] == 200
+
+
+def test_sesion_sin_cambios_no_manda_cookie(capa, conn):
+    pid = producto(conn)
+    conn.commit()
+    assert cookie_de(llamar(capa, "GET", f"/api/stock/{pid}")[1]) is None
+
+
+def test_lo_demas_lo_atiende_flask(capa):
+    status, encabezados, cuerpo = llamar(capa, "GET", "/login")
+    assert status == 200 and b"<form" in cuerpo
+    assert llamar(capa, "GET", "/no-existe")[0] == 404
+    # Método distinto al de la capa async: también va a Flask
+    assert llamar(capa, "GET", "/api/carrito/limpiar")[0] == 405
+
+
+def test_cada_tienda_lee_su_base(app, conn):
+    tiendas.configurar({"norte": {}})
+    tiendas.sembrar(["norte"])
+    capa = api_async.montar(app, cargar_usuario=modulo.load_user)
+    pid = producto(conn, stock=3)
+    norte = sqlite3.connect(tiendas.ruta(clave="norte"))
+    norte.execute("UPDATE productos SET stock = 40 WHERE id = ?", (pid,))
+    norte.commit()
+    norte.close()
+    assert json.loads(llamar(capa, "GET", f"/api/stock/{pid}")[2]) == {"stock": 3}
+    assert json.loads(llamar(capa, "GET", f"/t/norte/api/stock/{pid}")[2]) == {"stock": 40}
+    assert llamar(capa, "GET", f"/t/nada/api/stock/{pid}")[0] == 404
@@ -0,0 +1,152 @@
+# Aprobación y rechazo de solicitudes de cambio de stock en lote, con control
+# optimista: una solicitud cuyo producto cambió desde que se pidió se reajusta
+# sobre el stock actual o queda pendiente con el conflicto anotado, nunca pisa
+# ventas ni precios ajenos.
+import pytest
+
+import cancelaciones
+import repositorio
+import tablero
+from app import aplicar_cambios_lote
+from conftest import producto, usuario_id, venta
+
+
+@pytest.fixture
+def rc(db_path):
+    conn = repositorio.conectar(db_path)
+    yield conn
+    conn.cerrar()
+
+
+def solicitar(rc, pid, stock_nuevo, precio_nuevo=None, motivo="Reposición", version=True):
+    """Solicitud del vendedor sobre los valores actuales del producto (version=False: fila anterior a las versiones)."""
+    p = rc.execute("SELECT stock, precio, version FROM productos WHERE id = ?", (pid,)).fetchone()
+    precio_nuevo = p["precio"] if precio_nuevo is None else precio_nuevo
+    cambio_id = repositorio.ejecutar(rc, "insertar_cambio_stock", (
+        pid, usuario_id(rc, "vendedor"), p["stock"], stock_nuevo, p["precio"], precio_nuevo, 0, motivo,
+        p["version"] if version else None)).lastrowid
+    rc.commit()
+    return cambio_id
+
+
+def procesar(rc, accion, *cambio_ids):
+    resultado = aplicar_cambios_lote(rc, cambio_ids, accion, usuario_id(rc, "admin"))
+    rc.commit()
+    return resultado
+
+
+def autorizar(rc, *cambio_ids):
+    return procesar(rc, "autorizar", *cambio_ids)
+
+
+def producto_actual(rc, pid):
+    return tuple(rc.execute("SELECT stock, precio, activo FROM productos WHERE id = ?", (pid,)).fetchone())
+
+
+def solicitud(rc, cambio_id):
+    return tuple(rc.execute("SELECT estado, conflicto FROM cambios_stock WHERE id = ?", (cambio_id,)).fetchone())
+
+
+def test_autorizar_lote(rc):
+    uno, otro = [r[0] for r in rc.execute("SELECT id FROM productos ORDER BY id LIMIT 2")]
+    precio = producto_actual(rc, uno)[1]
+    cambios = [solicitar(rc, uno, 150, precio + 5), solicitar(rc, otro, 5)]
+    assert autorizar(rc, *cambios) == {"autorizados": 2, "bajas": 0, "rechazados": 0, "reajustados": 0, "conflictos": 0}
+    assert producto_actual(rc, uno) == (150, precio + 5, 1)
+    assert producto_actual(rc, otro)[0] == 5
+    assert [solicitud(rc, c) for c in cambios] == [("autorizado", None)] * 2
+    assert autorizar(rc, *cambios)["autorizados"] == 0  # ya resueltas: no se reaplican
+
+
+def test_gana_la_mas_reciente_y_la_otra_queda_reemplazada(rc):
+    pid = producto(rc, stock=100)
+    vieja = solicitar(rc, pid, 120)
+    ultima = solicitar(rc, pid, 130)
+    assert autorizar(rc, vieja, ultima)["autorizados"] == 1
+    assert producto_actual(rc, pid)[0] == 130
+    assert (solicitud(rc, vieja)[0], solicitud(rc, ultima)[0]) == ("reemplazado", "autorizado")
+
+
+def test_ventas_desde_la_solicitud_se_reajustan(rc):
+    pid = producto(rc, stock=100)
+    cambio = solicitar(rc, pid, 150)
+    venta(rc, "cliente", {pid: 10})
+    resultado = autorizar(rc, cambio)
+    assert (resultado["autorizados"], resultado["reajustados"]) == (1, 1)
+    assert producto_actual(rc, pid)[0] == 140
+
+
+def test_una_cancelacion_tambien_se_reajusta(rc):
+    pid = producto(rc, stock=100)
+    vendida = venta(rc, "cliente", {pid: 10})
+    cambio = solicitar(rc, pid, 150)
+    assert cancelaciones.cancelar_ventas(rc, [vendida]) == [vendida]
+    rc.commit()
+    assert autorizar(rc, cambio)["reajustados"] == 1
+    assert producto_actual(rc, pid)[0] == 160
+
+
+def test_stock_negativo_queda_en_conflicto(rc):
+    pid = producto(rc, stock=100)
+    vendedor = usuario_id(rc, "vendedor")
+    cambio = solicitar(rc, pid, 20)
+    venta(rc, "cliente", {pid: 90})
+    assert tablero.datos(rc, vendedor)["cambios_pendientes"][0]["conflicto"] is None
+    assert autorizar(rc, cambio)["conflictos"] == 1
+    assert producto_actual(rc, pid)[0] == 10
+    estado, conflicto = solicitud(rc, cambio)
+    assert estado == "pendiente" and "-70" in conflicto
+    # El panel del vendedor lo muestra (la huella del tablero incluye el conflicto)
+    assert tablero.datos(rc, vendedor)["cambios_pendientes"][0]["conflicto"] == conflicto
+
+
+def test_otras_solicitudes_de_un_producto_en_conflicto_siguen_pendientes(rc):
+    pid = producto(rc, stock=100)
+    vieja = solicitar(rc, pid, 90)
+    ultima = solicitar(rc, pid, 20)
+    venta(rc, "cliente", {pid: 90})
+    assert autorizar(rc, vieja, ultima)["conflictos"] == 1
+    assert solicitud(rc, vieja) == ("pendiente", None) and solicitud(rc, ultima)[0] == "pendiente"
+
+
+def test_precio_cambiado_por_otro_queda_en_conflicto(rc):
+    pid = producto(rc, stock=100)
+    precio = producto_actual(rc, pid)[1]
+    cambio = solicitar(rc, pid, 100, precio + 2)
+    solo_stock = solicitar(rc, pid, 120)
+    rc.execute("UPDATE productos SET precio = ?, version = version + 1 WHERE id = ?", (precio + 1, pid))
+    rc.commit()
+    assert autorizar(rc, cambio)["conflictos"] == 1
+    assert producto_actual(rc, pid)[1] == precio + 1
+    # Una solicitud que no toca el precio conserva el actual
+    assert autorizar(rc, solo_stock)["autorizados"] == 1
+    assert producto_actual(rc, pid)[:2] == (120, precio + 1)
+
+
+@pytest.mark.parametrize("vendido, reajustados, final", [(0, 0, 50), (5, 1, 45)])
+def test_solicitudes_sin_version(rc, vendido, reajustados, final):
+    pid = producto(rc, stock=30)
+    cambio = solicitar(rc, pid, 50, version=False)
+    if vendido: venta(rc, "cliente", {pid: vendido})
+    resultado = autorizar(rc, cambio)
+    assert (resultado["autorizados"], resultado["reajustados"]) == (1, reajustados)
+    assert producto_actual(rc, pid)[0] == final
+
+
+def test_la_baja_gana_en_el_mismo_lote(rc):
+    pid = producto(rc, stock=100)
+    cambio = solicitar(rc, pid, 150)
+    baja = solicitar(rc, pid, 0, motivo="Baja")
+    resultado = autorizar(rc, cambio, baja)
+    assert (resultado["bajas"], resultado["autorizados"]) == (1, 0)
+    assert producto_actual(rc, pid)[::2] == (0, 0)
+    assert (solicitud(rc, cambio)[0], solicitud(rc, baja)[0]) == ("reemplazado", "autorizado")
+
+
+def test_rechazar_lote(rc):
+    pid = producto(rc, stock=100)
+    cambios = [solicitar(rc, pid, 150), solicitar(rc, pid, 160)]
+    assert procesar(rc, "rechazar", *cambios)["rechazados"] == 2
+    assert [solicitud(rc, c)[0] for c in cambios] == ["rechazado", "rechazado"]
+    assert autorizar(rc, *cambios)["autorizados"] == 0
+    assert producto_actual(rc, pid)[0] == 100
@@ -0,0 +1,132 @@
+# Archivo mensual: los reportes, las exportaciones y las compras del cliente
+# leen lo mismo antes y después de archivar, una fila que quedó en la base y
+# en el archivo (archivador cortado) no se lee ni se archiva dos veces, y la
+# caché de meses de cada conexión tiene tope y vence.
+import json
+import random
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import archivo
+import cache
+import cancelaciones
+import exportar
+import reportes
+import repositorio
+from conftest import usuario_id, venta
+
+DESDE, HASTA = "2023-01-01", "2023-12-31"
+
+
+@pytest.fixture
+def historia(db_path, conn):
+    """Ventas y cambios de stock de 2023 (ya cerrados) y algunas ventas de hoy. Devuelve cuántas ventas viejas hay."""
+    pids = [f[0] for f in conn.execute("SELECT id FROM productos ORDER BY id LIMIT 5")]
+    azar = random.Random(1)
+    viejas = [venta(conn, azar.choice(["cliente", "vendedor"]), {p: azar.randint(1, 3) for p in azar.sample(pids, 2)},
+                    fecha=f"2023-{azar.randint(1, 12):02d}-{azar.randint(1, 28):02d} 10:00:00")
+              for _ in range(120)]
+    cancelaciones.cancelar_ventas(conn, azar.sample(viejas, 30))
+    for mes in (3, 3, 7):
+        conn.execute("""INSERT INTO cambios_stock (producto_id, vendedor_id, stock_anterior, stock_nuevo, estado, fecha_solicitud)
+                        VALUES (?, ?, 1, 2, 'autorizado', ?)""", (pids[0], usuario_id(conn, "vendedor"), f"2023-{mes:02d}-05 10:00:00"))
+    conn.commit()
+    hoy = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for _ in range(5): venta(conn, "cliente", {pids[0]: 1}, fecha=hoy)
+    cancelaciones.barrer_vencidas(conn)
+    return len(viejas)
+
+
+def lectura(db_path):
+    """Todo lo que se lee de 2023: reportes, exportaciones y las compras del cliente."""
+    cache.limpiar()
+    conn = repositorio.conectar(db_path)
+    serie = reportes.serie_ventas(conn, DESDE, HASTA, "mes")
+    desglose = reportes.desglose_ventas(conn, DESDE, HASTA, "producto")
+    ventas = "".join(exportar.generar(db_path, "ventas", "csv", DESDE, HASTA))
+    cambios = "".join(exportar.generar(db_path, "cambios_stock", "jsonl", DESDE, HASTA))
+    cliente = usuario_id(conn, "cliente")
+    with archivo.con_archivo(conn, usuario_id=cliente):
+        compras = sorted(tuple(v) for v in repositorio.todos(conn, "ventas_de_cliente", (cliente,)))
+        items = sorted(tuple(i) for i in repositorio.todos(conn, "items_de_cliente", (cliente,)))
+    conn.cerrar()
+    return serie, desglose, ventas, cambios, compras, items
+
+
+def archivar_todo(db_path):
+    return archivo.archivar(db_path, dias=30, lote=50)
+
+
+def test_leer_es_igual_antes_y_despues_de_archivar(db_path, conn, historia):
+    antes = lectura(db_path)
+    assert antes[0]["totales"]["ventas"] == 90 and antes[3].count("\n") == 3
+    resultado = archivar_todo(db_path)
+    assert (resultado["ventas"], resultado["cambios"]) == (historia, 3)
+    assert conn.execute("SELECT COUNT(*) FROM ventas WHERE fecha < '2024-01-01'").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM ventas").fetchone()[0] == 5
+    assert lectura(db_path) == antes
+    assert archivar_todo(db_path) == {"ventas": 0, "cambios": 0, "meses": []}
+    assert lectura(db_path) == antes
+
+
+def test_fila_en_la_base_y_en_el_archivo_no_se_duplica(db_path, conn, historia):
+    archivar_todo(db_path)
+    # Otra venta vieja de un mes ya archivado, copiada al archivo pero sin borrar de la base
+    pid = conn.execute("SELECT id FROM productos ORDER BY id LIMIT 1").fetchone()[0]
+    vid = venta(conn, "cliente", {pid: 2}, fecha="2023-03-10 10:00:00")
+    cancelaciones.barrer_vencidas(conn)
+    conn.execute("ATTACH DATABASE ? AS arch", (archivo.ruta_mes("2023-03"),))
+    archivo._preparar(conn)
+    archivo._copiar(conn, "ventas", "id", json.dumps([vid]))
+    archivo._copiar(conn, "venta_items", "venta_id", json.dumps([vid]))
+    conn.commit()
+    conn.execute("DETACH DATABASE arch")
+    antes = lectura(db_path)
+    assert antes[0]["totales"]["ventas"] == 91
+    assert antes[2].count(f"VDL-PRUEBA-{vid:06d}") == 1
+    assert archivar_todo(db_path)["ventas"] == 1
+    assert lectura(db_path) == antes
+    marzo = sqlite3.connect(archivo.ruta_mes("2023-03"))
+    assert marzo.execute("SELECT COUNT(*) FROM ventas WHERE id = ?", (vid,)).fetchone()[0] == 1
+    marzo.close()
+
+
+def _ventas_2023(lector):
+    inicio, fin = exportar.rango_fechas(DESDE, HASTA)
+    with archivo.con_archivo(lector, inicio, fin):
+        return lector.execute("SELECT COUNT(*) FROM ventas WHERE fecha_ts >= ? AND fecha_ts < ?", (inicio, fin)).fetchone()[0]
+
+
+def _meses_en_cache(lector):
+    return sorted({f[0] for f in lector.execute("SELECT mes FROM temp.archivo_ventas")})
+
+
+def test_la_cache_de_la_conexion_se_recarga(db_path, conn, historia):
+    archivar_todo(db_path)
+    lector = sqlite3.connect(db_path)
+    assert _ventas_2023(lector) == historia
+    pid = conn.execute("SELECT id FROM productos ORDER BY id LIMIT 1").fetchone()[0]
+    venta(conn, "cliente", {pid: 1}, fecha="2023-07-01 10:00:00")
+    cancelaciones.barrer_vencidas(conn)
+    assert _ventas_2023(lector) == historia + 1      # todavía en la base
+    archivar_todo(db_path)
+    assert _ventas_2023(lector) == historia + 1      # ya en el archivo: el mes se volvió a cargar
+    assert lector.execute("SELECT name FROM sqlite_temp_master WHERE type = 'view'").fetchall() == []
+    lector.close()
+
+
+def test_la_cache_tiene_tope_y_vence(db_path, historia, monkeypatch):
+    archivar_todo(db_path)
+    lector = sqlite3.connect(db_path)
+    monkeypatch.setattr(archivo, "MESES_EN_CACHE", 3)
+    assert _ventas_2023(lector) == historia
+    # Quedan los últimos meses usados, hasta el tope; leerlos de nuevo da lo mismo
+    assert len(_meses_en_cache(lector)) == 3
+    assert _ventas_2023(lector) == historia
+    monkeypatch.setattr(archivo, "CACHE_TTL", -1)
+    assert _ventas_2023(lector) == historia
+    # Todo vencido: no queda ninguna tabla de la caché en temp
+    assert lector.execute("SELECT name FROM sqlite_temp_master WHERE name LIKE 'archivo_%' AND type = 'table'").fetchall() == []
+    lector.close()
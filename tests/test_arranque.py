@@ -0,0 +1,32 @@
+# Importación diferida de dependencias pesadas y crear_app() como punto de entrada.
+import subprocess
+import sys
+
+import app as modulo
+import conexion
+import subsistemas
+from conftest import APP
+
+PESADOS = ("xhtml2pdf", "reportlab", "requests", "PIL")
+
+
+def test_importar_app_no_carga_dependencias_pesadas():
+    codigo = f"import sys, app; print(sorted(m for m in {PESADOS!r} if m in sys.modules))"
+    salida = subprocess.run([sys.executable, "-c", codigo], cwd=APP, capture_output=True, text=True, check=True)
+    assert salida.stdout.strip() == "[]"
+
+
+def test_subsistema_se_importa_una_vez():
+    pdf = subsistemas.pdf()
+    assert pdf is subsistemas.pdf() and "xhtml2pdf.pisa" in subsistemas.cargados()
+    assert subsistemas.pil_image() is not None
+
+
+def test_crear_app_inicializa_una_sola_vez(db_path, monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(modulo, "_inicializada", False)
+    monkeypatch.setitem(modulo.app.config, "PRECALENTAR", False)
+    monkeypatch.setattr(conexion, "migrar_esquema", lambda ruta: llamadas.append(ruta))
+    assert modulo.crear_app() is modulo.app
+    assert modulo.crear_app() is modulo.app
+    assert llamadas == [db_path]
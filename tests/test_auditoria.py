@@ -0,0 +1,66 @@
+# Auditoría encolada y escrita en lotes por un hilo aparte.
+import json
+import queue
+import sqlite3
+
+import pytest
+
+import auditoria
+import tiendas
+
+
+@pytest.fixture(autouse=True)
+def cola_nueva(monkeypatch):
+    monkeypatch.setattr(auditoria, "_cola", queue.Queue(maxsize=auditoria.MAX_EN_COLA))
+    monkeypatch.setattr(auditoria, "_metricas", {"escritos": 0, "descartados": 0, "lotes": 0,
+                                                 "ultimo_lote_ms": None, "ultimo_error": None})
+
+
+def eventos(conn):
+    return [(f["accion"], json.loads(f["detalle"])) for f in conn.execute("SELECT accion, detalle FROM acciones_admin ORDER BY id")]
+
+
+def test_registrar_no_escribe_hasta_vaciar(db_path, conn, monkeypatch):
+    monkeypatch.setattr(auditoria, "TAMANO_LOTE", 2)
+    for i in range(5): auditoria.registrar(1, "prueba", n=i)
+    assert eventos(conn) == []
+    assert auditoria.vaciar() == 5
+    assert eventos(conn) == [("prueba", {"n": i}) for i in range(5)]
+    m = auditoria.metricas()
+    assert (m["en_cola"], m["escritos"], m["lotes"], m["descartados"]) == (0, 5, 3, 0)
+
+
+def test_cada_evento_va_a_la_base_de_su_tienda(db_path, conn):
+    tiendas.configurar({"norte": {}})
+    tiendas.sembrar(["norte"])
+    auditoria.registrar(1, "principal")
+    with tiendas.usar("norte"): auditoria.registrar(1, "norte")
+    assert auditoria.vaciar() == 2
+    norte = sqlite3.connect(tiendas.ruta(clave="norte"))
+    assert norte.execute("SELECT accion FROM acciones_admin").fetchall() == [("norte",)]
+    norte.close()
+    assert [a for a, _ in eventos(conn)] == ["principal"]
+
+
+def test_cola_llena_descarta_y_cuenta(monkeypatch):
+    monkeypatch.setattr(auditoria, "_cola", queue.Queue(maxsize=2))
+    for i in range(5): auditoria.registrar(1, "prueba", n=i)
+    assert auditoria.metricas()["en_cola"] == 2
+    assert auditoria.metricas()["descartados"] == 3
+
+
+def test_error_de_base_no_traba_la_cola(tmp_path, monkeypatch):
+    monkeypatch.setattr(tiendas, "DIRECTORIO", str(tmp_path / "no"))
+    with tiendas.usar("fantasma"): auditoria.registrar(1, "prueba")
+    assert auditoria.vaciar() == 0
+    m = auditoria.metricas()
+    assert m["descartados"] == 1 and m["ultimo_error"] and m["en_cola"] == 0
+
+
+def test_rutas_registran(app, db_path, conn):
+    c = app.test_client()
+    c.post("/login", data={"username": "admin", "password": "admin"})
+    c.post("/configurar_alertas", data={"limite_stock_alerta": "7"})
+    assert c.get("/api/auditoria/metricas").get_json()["en_cola"] == 1
+    auditoria.vaciar()
+    assert eventos(conn) == [("configurar_alertas", {"limite_stock_alerta": 7})]
@@ -0,0 +1,77 @@
+# Cache compartido entre workers: versiones en mmap y valores en SQLite.
+import multiprocessing
+import pickle
+import sqlite3
+
+import pytest
+
+import cache
+import reportes
+import repositorio
+from conftest import producto, venta
+
+
+@pytest.fixture
+def compartido(tmp_path):
+    cache.configurar(f"compartido:{tmp_path}")
+    yield tmp_path
+    cache.configurar("memoria")
+
+
+def _en_otro_worker(directorio, tarea):
+    """Corre `tarea` en un proceso aparte con su propio cache (como otro worker de gunicorn)."""
+    def correr(cola):
+        cache.configurar(f"compartido:{directorio}")
+        cola.put(tarea())
+    ctx = multiprocessing.get_context("fork")
+    cola = ctx.Queue()
+    proceso = ctx.Process(target=correr, args=(cola,))
+    proceso.start()
+    resultado = cola.get(timeout=10)
+    proceso.join(10)
+    return resultado
+
+
+def test_invalidar_en_otro_worker_se_ve_aca(compartido):
+    calculos = []
+    def calcular():
+        calculos.append(1)
+        return len(calculos)
+    assert cache.obtener_o_calcular("catalogo", "inicio", calcular) == 1
+    assert cache.obtener_o_calcular("catalogo", "inicio", calcular) == 1  # copia local
+    version = _en_otro_worker(compartido, lambda: (cache.invalidar("catalogo"), cache.version("catalogo"))[1])
+    assert cache.version("catalogo") == version
+    assert cache.obtener_o_calcular("catalogo", "inicio", calcular) == 2
+
+
+def test_valor_calculado_en_otro_worker_se_reusa(compartido):
+    _en_otro_worker(compartido, lambda: cache.obtener_o_calcular("ventas", ("serie", 1), lambda: {"total": 42}))
+    assert cache.obtener_o_calcular("ventas", ("serie", 1), lambda: pytest.fail("no debía recalcular")) == {"total": 42}
+
+
+def test_lo_que_no_se_serializa_queda_local(compartido):
+    valor = lambda: None
+    assert cache.obtener_o_calcular("catalogo", "f", lambda: valor) is valor
+    assert _en_otro_worker(compartido, lambda: cache.obtener_o_calcular("catalogo", "f", lambda: "recalculado")) == "recalculado"
+
+
+def test_filas_se_pueden_serializar(conn):
+    fila = repositorio.todos(conn, "catalogo")[0]
+    copia = pickle.loads(pickle.dumps(fila))
+    assert copia == fila and copia.nombre == fila.nombre and type(copia) is type(fila)
+
+
+def test_reporte_memorizado_se_invalida_desde_otro_worker(compartido, db_path, conn):
+    pid = producto(conn)
+    venta(conn, "cliente", {pid: 1})
+    conn.commit()
+    assert reportes.serie_ventas(conn, "2025-01-01", "2025-01-31")["totales"]["ventas"] == 1
+
+    def vender_e_invalidar():
+        otra = sqlite3.connect(db_path)
+        venta(otra, "cliente", {pid: 2})
+        otra.commit()
+        otra.close()
+        cache.invalidar("ventas")
+    _en_otro_worker(compartido, vender_e_invalidar)
+    assert reportes.serie_ventas(conn, "2025-01-01", "2025-01-31")["totales"]["ventas"] == 2
@@ -0,0 +1,92 @@
+# Cancelación por conjuntos: el cambio de estado va primero, así una venta
+# cancelada dos veces (o por dos pedidos simultáneos) repone su stock una sola vez.
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import cancelaciones
+from conftest import producto, stock, usuario_id, venta
+
+
+def hace(minutos):
+    return (datetime.now() - timedelta(minutes=minutos)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def test_repone_stock(conn):
+    pid = producto(conn, stock=10)
+    vid = venta(conn, "cliente", {pid: 3}, fecha=hace(0))
+    assert cancelaciones.cancelar_ventas(conn, [vid]) == [vid]
+    conn.commit()
+    assert stock(conn, pid) == 10
+    assert tuple(conn.execute("SELECT estado, cancelable FROM ventas WHERE id = ?", (vid,)).fetchone()) == ("cancelada", 0)
+
+
+def test_cancelar_dos_veces_no_repone_dos_veces(conn):
+    pid = producto(conn, stock=10)
+    vid = venta(conn, "cliente", {pid: 4}, fecha=hace(0))
+    assert cancelaciones.cancelar_ventas(conn, [vid, vid]) == [vid]
+    conn.commit()
+    assert cancelaciones.cancelar_ventas(conn, [vid]) == []
+    conn.commit()
+    assert stock(conn, pid) == 10
+
+
+def test_cancelaciones_simultaneas_reponen_una_vez(db_path, conn):
+    pid = producto(conn, stock=20)
+    ventas = [venta(conn, "cliente", {pid: 2}, fecha=hace(0)) for _ in range(5)]
+    hilos_n = 4
+    barrera = threading.Barrier(hilos_n)
+    resultados = []
+
+    def cancelar():
+        c = sqlite3.connect(db_path, timeout=10)
+        barrera.wait()
+        resultados.append(cancelaciones.cancelar_ventas(c, ventas))
+        c.commit()
+        c.close()
+
+    hilos = [threading.Thread(target=cancelar) for _ in range(hilos_n)]
+    for h in hilos: h.start()
+    for h in hilos: h.join(timeout=30)
+    assert len(resultados) == hilos_n
+    assert sorted(i for r in resultados for i in r) == ventas
+    assert stock(conn, pid) == 20
+
+
+def test_ventana_por_defecto_de_10_minutos(conn):
+    assert cancelaciones.ventana_minutos(conn) == 10
+    pid = producto(conn, stock=10)
+    vieja = venta(conn, "cliente", {pid: 1}, fecha=hace(11))
+    ajena = venta(conn, "vendedor", {pid: 1}, fecha=hace(0))
+    propia = venta(conn, "cliente", {pid: 1}, fecha=hace(9))
+    limite = cancelaciones.limite_cancelacion(conn)
+    assert cancelaciones.cancelar_ventas(conn, [vieja, ajena, propia], usuario_id=usuario_id(conn, "cliente"), limite=limite) == [propia]
+    conn.commit()
+    assert stock(conn, pid) == 8
+
+
+def test_ventana_configurable(conn):
+    conn.execute("UPDATE config_empresa SET minutos_cancelacion = 60 WHERE id = 1")
+    pid = producto(conn, stock=10)
+    vid = venta(conn, "cliente", {pid: 1}, fecha=hace(30))
+    assert cancelaciones.cancelar_ventas(conn, [vid], limite=cancelaciones.limite_cancelacion(conn)) == [vid]
+
+
+def test_barrido_marca_las_vencidas(conn):
+    pid = producto(conn, stock=10)
+    vieja = venta(conn, "cliente", {pid: 1}, fecha=hace(60))
+    nueva = venta(conn, "cliente", {pid: 1}, fecha=hace(1))
+    assert cancelaciones.barrer_vencidas(conn) == 1
+    cancelables = dict(conn.execute("SELECT id, cancelable FROM ventas WHERE id IN (?, ?)", (vieja, nueva)).fetchall())
+    assert cancelables == {vieja: 0, nueva: 1}
+
+
+def test_cancelacion_del_cliente(app, conn):
+    pid = producto(conn, stock=10)
+    vid = venta(conn, "cliente", {pid: 2}, fecha=hace(1))
+    numero = conn.execute("SELECT numero_pedido FROM ventas WHERE id = ?", (vid,)).fetchone()[0]
+    c = app.test_client()
+    c.post("/login", data={"username": "cliente", "password": "cliente"})
+    assert "10 minutos" in c.get(f"/comprobante/{numero}").get_data(as_text=True)
+    c.post(f"/cancelar_compra_rapida/{numero}")
+    assert stock(conn, pid) == 10
@@ -0,0 +1,45 @@
+# Checkout idempotente (clave_pedido): un reintento o un doble submit devuelve
+# el pedido ya creado y no crea otra venta ni descuenta el stock dos veces.
+import threading
+
+from conftest import producto, stock
+
+
+def cliente_con_carrito(app, pid, cantidad=1):
+    c = app.test_client()
+    assert c.post("/login", data={"username": "cliente", "password": "cliente"}).status_code == 302
+    assert c.post("/api/carrito/agregar", json={"producto_id": pid, "cantidad": cantidad}).get_json()["success"]
+    return c
+
+
+def ventas_con_clave(conn, clave):
+    return conn.execute("SELECT COUNT(*) FROM ventas WHERE clave_idempotencia = ?", (clave,)).fetchone()[0]
+
+
+def test_reintento_devuelve_el_mismo_pedido(app, conn):
+    pid = producto(conn, stock=10)
+    c = cliente_con_carrito(app, pid, 2)
+    primero = c.post("/procesar_pago", data={"clave_pedido": "pedido-1"})
+    assert primero.status_code == 302 and "/comprobante/" in primero.headers["Location"]
+    segundo = c.post("/procesar_pago", data={"clave_pedido": "pedido-1"})
+    assert segundo.headers["Location"] == primero.headers["Location"]
+    assert ventas_con_clave(conn, "pedido-1") == 1
+    assert stock(conn, pid) == 8
+
+
+def test_doble_submit_simultaneo_crea_una_sola_venta(app, conn):
+    pid = producto(conn, stock=10)
+    clientes = [cliente_con_carrito(app, pid) for _ in range(2)]
+    barrera = threading.Barrier(len(clientes))
+    destinos = []
+
+    def pagar(c):
+        barrera.wait()
+        destinos.append(c.post("/procesar_pago", data={"clave_pedido": "pedido-2"}).headers["Location"])
+
+    hilos = [threading.Thread(target=pagar, args=(c,)) for c in clientes]
+    for h in hilos: h.start()
+    for h in hilos: h.join(timeout=30)
+    assert len(destinos) == 2 and destinos[0] == destinos[1]
+    assert ventas_con_clave(conn, "pedido-2") == 1
+    assert stock(conn, pid) == 9
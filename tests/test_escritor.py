@@ -0,0 +1,88 @@
+# Escritor único por proceso: group commit con un savepoint por unidad y
+# contrapresión (cola llena -> 503).
+import threading
+
+import pytest
+
+import escritor
+import movimientos
+import reservas
+from conftest import producto
+
+
+def fijar_umbral(conn, umbral):
+    conn.execute("UPDATE productos SET umbral_alerta = ? WHERE id = (SELECT MIN(id) FROM productos)", (umbral,))
+    return umbral
+
+
+def fallar(conn):
+    conn.execute("UPDATE config_empresa SET limite_stock_alerta = 99 WHERE id = 1")
+    raise ValueError("unidad rota")
+
+
+@pytest.fixture
+def trabado(db_path):
+    """Un escritor propio con el hilo ocupado en una unidad hasta que se suelte `soltar`."""
+    def crear(**opciones):
+        e = escritor.Escritor(db_path, **opciones)
+        e.start()
+        ocupado = threading.Event()
+        e.enviar(lambda conn: (ocupado.set(), soltar.wait(10)))
+        ocupado.wait(5)
+        creados.append(e)
+        return e
+    soltar, creados = threading.Event(), []
+    yield crear, soltar
+    soltar.set()
+    for e in creados: e.detener()
+
+
+def test_unidad_que_falla_se_deshace_sola(conn, trabado):
+    crear, soltar = trabado
+    e = crear()
+    antes = e.enviar(fijar_umbral, 3)
+    roto = e.enviar(fallar)
+    despues = e.enviar(fijar_umbral, 4)
+    soltar.set()
+    assert antes.result(5) == 3 and despues.result(5) == 4
+    with pytest.raises(ValueError): roto.result(5)
+    # Las tres corrieron en un solo lote: lo de la unidad rota no quedó, lo de las otras sí
+    assert e.metricas()["lote_max"] == 3 and e.metricas()["errores"] == 1
+    assert conn.execute("SELECT limite_stock_alerta FROM config_empresa").fetchone()[0] == 10
+    assert conn.execute("SELECT umbral_alerta FROM productos ORDER BY id LIMIT 1").fetchone()[0] == 4
+
+
+def test_cola_llena(trabado):
+    crear, soltar = trabado
+    e = crear(max_cola=1)
+    e.enviar(fijar_umbral, 1)
+    with pytest.raises(escritor.ColaLlena): e.enviar(fijar_umbral, 2, espera=0)
+    assert e.metricas()["rechazados"] == 1
+
+
+def test_cola_llena_responde_503(app, db_path, trabado, monkeypatch):
+    crear, soltar = trabado
+    e = crear(max_cola=1)
+    e.enviar(fijar_umbral, 1)
+    monkeypatch.setattr(escritor, "ESPERA_COLA", 0)
+    monkeypatch.setattr(escritor, "obtener", lambda ruta: e)
+    c = app.test_client()
+    c.post("/login", data={"username": "cliente", "password": "cliente"})
+    r = c.post("/api/carrito/agregar", json={"producto_id": 1, "cantidad": 1})
+    assert r.status_code == 503 and r.headers["Retry-After"] == "2"
+    assert not r.get_json()["success"]
+
+
+def test_tareas_de_fondo_escriben_por_el_escritor(app, db_path, conn, monkeypatch):
+    import app as modulo
+    unidades = []
+    real = modulo.escribir
+    monkeypatch.setattr(modulo, "escribir", lambda trabajo, *args: (unidades.append(trabajo), real(trabajo, *args))[1])
+    pid = producto(conn, stock=5)
+    conn.execute("INSERT INTO reservas (sesion, producto_id, cantidad, expira_en) VALUES ('vieja', ?, 1, 0)", (pid,))
+    conn.commit()
+    modulo.barrer_reservas()
+    modulo.barrer_cancelaciones()
+    modulo.snapshot_stock()
+    assert unidades == [reservas.borrar_vencidas, modulo.cancelaciones.marcar_vencidas, movimientos.tomar_snapshots]
+    assert conn.execute("SELECT COUNT(*) FROM reservas").fetchone()[0] == 0
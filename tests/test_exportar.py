@@ -0,0 +1,47 @@
+# Exportaciones CSV / JSONL en bloques.
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+import exportar
+from conftest import producto, venta
+
+
+def exportado(db_path, tipo, formato, desde=None, hasta=None):
+    return list(exportar.generar(db_path, tipo, formato, desde, hasta))
+
+
+def test_ventas_csv_filtra_por_fechas(db_path, conn):
+    pid = producto(conn)
+    venta(conn, "cliente", {pid: 2}, fecha="2025-01-10 09:00:00")
+    dentro = venta(conn, "cliente", {pid: 3}, fecha="2025-01-15 23:59:59")
+    venta(conn, "cliente", {pid: 1}, fecha="2025-01-16 00:00:00")
+    filas = list(csv.reader(io.StringIO("".join(exportado(db_path, "ventas", "csv", "2025-01-11", "2025-01-15")))))
+    assert filas[0] == exportar.CONSULTAS["ventas"]["columnas"]
+    assert [(int(f[0]), int(f[8])) for f in filas[1:]] == [(dentro, 3)]
+
+
+def test_cabecera_antes_del_primer_bloque(db_path, conn, monkeypatch):
+    monkeypatch.setattr(exportar, "FILAS_POR_BLOQUE", 2)
+    bloques = exportado(db_path, "productos", "csv")
+    total = conn.execute("SELECT COUNT(*) FROM productos").fetchone()[0]
+    assert bloques[0].startswith("id,nombre") and bloques[0].count("\n") == 1
+    assert len(bloques) == 1 + (total + 1) // 2
+    assert sum(b.count("\n") for b in bloques[1:]) == total
+
+
+def test_productos_jsonl(db_path, conn):
+    lineas = "".join(exportado(db_path, "productos", "jsonl")).splitlines()
+    primero = json.loads(lineas[0])
+    assert set(primero) == set(exportar.CONSULTAS["productos"]["columnas"])
+    assert len(lineas) == conn.execute("SELECT COUNT(*) FROM productos").fetchone()[0]
+
+
+def test_fechas_invalidas():
+    # Días en hora local, límites en segundos unix (como ventas.fecha_ts)
+    assert exportar.rango_fechas("2025-01-01", "2025-01-31") == (int(datetime(2025, 1, 1).timestamp()),
+                                                                 int(datetime(2025, 2, 1).timestamp()))
+    with pytest.raises(ValueError): exportar.rango_fechas("01/02/2025", None)
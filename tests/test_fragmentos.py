@@ -0,0 +1,85 @@
+# Cache de fragmentos de Jinja: la clave decide cuándo se vuelve a renderizar.
+import re
+import time
+
+import pytest
+from jinja2 import DictLoader, Environment
+
+import analitica
+import cache
+import fragmentos
+import reservas
+from conftest import producto
+
+
+@pytest.fixture(autouse=True)
+def vacio():
+    fragmentos.limpiar()
+    yield
+    fragmentos.limpiar()
+
+
+def entorno(fuente):
+    return Environment(loader=DictLoader({"t.html": fuente}), extensions=[fragmentos.FragmentoCache])
+
+
+def test_renderiza_una_vez_por_clave():
+    contador = iter(range(100))
+    t = entorno('{% cache "x", v %}{{ siguiente() }}{% endcache %}').get_template("t.html")
+    assert [t.render(v=1, siguiente=lambda: next(contador)) for _ in range(3)] == ["0", "0", "0"]
+    assert t.render(v=2, siguiente=lambda: next(contador)) == "1"
+    assert t.render(v=None, siguiente=lambda: next(contador)) == "2"  # None: sin cache
+    assert t.render(v=None, siguiente=lambda: next(contador)) == "3"
+    assert t.render(siguiente=lambda: next(contador)) == "4"          # indefinida: sin cache
+
+
+def test_editar_el_template_cambia_la_clave():
+    assert entorno('{% cache "x", 1 %}viejo{% endcache %}').get_template("t.html").render() == "viejo"
+    assert entorno('{% cache "x", 1 %}nuevo{% endcache %}').get_template("t.html").render() == "nuevo"
+
+
+def test_lru_acotado(monkeypatch):
+    monkeypatch.setattr(fragmentos, "MAX_FRAGMENTOS", 3)
+    t = entorno('{% cache "x", v %}{{ v }}{% endcache %}').get_template("t.html")
+    for v in range(5): t.render(v=v)
+    assert fragmentos.metricas()["entradas"] == 3
+
+
+def stock_en_tarjeta(html, pid):
+    return int(re.search(rf'stock-{pid} [^"]*">\s*📦 (\d+) un\.', html).group(1))
+
+
+def test_tarjeta_refleja_stock_y_reservas(app, conn):
+    pid = producto(conn, stock=10)
+    conn.commit()
+    c = app.test_client()
+    assert stock_en_tarjeta(c.get("/").get_data(as_text=True), pid) == 10
+    renders = fragmentos.metricas()["renders"]
+    assert stock_en_tarjeta(c.get("/").get_data(as_text=True), pid) == 10
+    assert fragmentos.metricas()["renders"] == renders  # todo desde el cache
+
+    # Otro carrito aparta unidades: cambia lo disponible y la tarjeta se rehace
+    reservas.reservar(conn, "otro-carrito", pid, 3)
+    conn.commit()
+    assert stock_en_tarjeta(c.get("/").get_data(as_text=True), pid) == 7
+    # Un cambio de stock sube productos.version (trigger)
+    version = conn.execute("SELECT version FROM productos WHERE id = ?", (pid,)).fetchone()[0]
+    conn.execute("UPDATE productos SET stock = 20 WHERE id = ?", (pid,))
+    conn.commit()
+    assert conn.execute("SELECT version FROM productos WHERE id = ?", (pid,)).fetchone()[0] == version + 1
+    cache.invalidar("catalogo")
+    assert stock_en_tarjeta(c.get("/").get_data(as_text=True), pid) == 17
+
+
+def test_panel_se_rehace_con_cada_copia(app, db_path):
+    analitica.actualizar(db_path)
+    c = app.test_client()
+    c.post("/login", data={"username": "admin", "password": "admin"})
+    c.get("/panel_dueno")
+    renders = fragmentos.metricas()["renders"]
+    c.get("/panel_dueno")
+    assert fragmentos.metricas()["renders"] == renders
+    time.sleep(0.01)  # mtime distinto
+    analitica.actualizar(db_path)
+    c.get("/panel_dueno")
+    assert fragmentos.metricas()["renders"] == renders + 3  # estadísticas, top y autorizados
@@ -0,0 +1,65 @@
+# Cache local de fotos: una descarga por URL, miniaturas y servido inmutable.
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import app as modulo
+import imagenes
+import subsistemas
+from conftest import producto
+
+
+def foto(ancho=800, alto=600):
+    salida = BytesIO()
+    Image.new("RGB", (ancho, alto), (200, 40, 40)).save(salida, "PNG")
+    return salida.getvalue()
+
+
+@pytest.fixture
+def descargas(tmp_path, monkeypatch):
+    """Descargador sin red que cuenta las bajadas; las fotos van a un directorio temporal."""
+    monkeypatch.setattr(imagenes, "DIRECTORIO", str(tmp_path / "cache_imagenes"))
+    bajadas = []
+    imagenes.configurar_descargador(lambda url: bajadas.append(url) or foto())
+    yield bajadas
+    imagenes.configurar_descargador(None)
+
+
+def test_misma_url_se_baja_una_vez(db_path, conn, descargas):
+    uno, otro = [r[0] for r in conn.execute("SELECT id FROM productos ORDER BY id LIMIT 2")]
+    hash_img = imagenes.procesar_producto(db_path, uno, url="https://fotos/manzana.jpg")
+    assert imagenes.procesar_producto(db_path, otro, url="https://fotos/manzana.jpg") == hash_img
+    assert descargas == ["https://fotos/manzana.jpg"]
+    assert {r[0] for r in conn.execute("SELECT imagen_hash FROM productos WHERE id IN (?, ?)", (uno, otro))} == {hash_img}
+
+
+def test_miniaturas(descargas):
+    hash_img = imagenes.guardar(foto())
+    for ancho in imagenes.ANCHOS:
+        path, mimetype = imagenes.archivo(hash_img, ancho, "webp")
+        assert mimetype == "image/webp"
+        with Image.open(path) as img: assert img.width == ancho
+    assert imagenes.guardar(foto()) == hash_img  # mismo contenido, mismo hash
+
+
+def test_sin_miniaturas_sirve_el_original(descargas, monkeypatch):
+    monkeypatch.setattr(subsistemas, "pil_image", lambda: None)
+    hash_img = imagenes.guardar(foto(10, 10))
+    assert imagenes.archivo(hash_img, 160, "webp")[1] == "image/png"
+
+
+def test_ruta_con_cabeceras_inmutables(db_path, descargas):
+    hash_img = imagenes.guardar(foto())
+    cliente = modulo.app.test_client()
+    resp = cliente.get(f"/img/{hash_img}/320.webp")
+    assert resp.status_code == 200 and resp.headers["Cache-Control"] == imagenes.CACHE_HTTP
+    assert cliente.get(f"/img/{hash_img}/320.webp", headers={"If-None-Match": resp.headers["ETag"]}).status_code == 304
+    assert cliente.get(f"/img/{hash_img}/999.webp").status_code == 404
+
+
+def test_error_en_segundo_plano_se_registra(db_path, conn, descargas, caplog):
+    def falla(url): raise OSError("sin red")
+    imagenes.configurar_descargador(falla)
+    assert imagenes.encolar_producto(db_path, producto(conn), url="https://fotos/x.jpg").result() is None
+    assert "Error procesando la imagen" in caplog.text and "sin red" in caplog.text
@@ -0,0 +1,63 @@
+# Login: limitador por token bucket y verificación de contraseñas en un pool acotado.
+import threading
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import app as modulo
+import contrasenas
+import limitador
+
+
+def test_balde_se_agota_y_se_rellena(monkeypatch):
+    reloj = [1000.0]
+    monkeypatch.setattr(limitador.time, "monotonic", lambda: reloj[0])
+    lim = limitador.Limitador(limitador.MemoriaStore(), {"usuario": (3, 1.0)})
+    assert [lim.permitir(usuario="ana") for _ in range(3)] == [0, 0, 0]
+    assert lim.permitir(usuario="ana") == pytest.approx(1.0)
+    assert lim.permitir(usuario="beto") == 0  # otra clave, otro balde
+    reloj[0] += 2
+    assert lim.permitir(usuario="ana") == 0
+
+
+def test_store_sqlite_compartido(tmp_path):
+    ruta = str(tmp_path / "limites.db")
+    uno, otro = (limitador.Limitador(limitador.crear_store(f"sqlite:{ruta}"), {"ip": (2, 0.001)}) for _ in range(2))
+    assert uno.permitir(ip="1.2.3.4") == 0 and otro.permitir(ip="1.2.3.4") == 0
+    assert uno.permitir(ip="1.2.3.4") > 0  # el segundo "worker" gastó la misma ficha
+
+
+def test_login_excedido_responde_429(app, monkeypatch):
+    monkeypatch.setattr(modulo, "limitador_login", limitador.Limitador(limitador.MemoriaStore(), {"ip": (20, 0.001), "usuario": (2, 0.001)}))
+    c = app.test_client()
+    respuestas = [c.post("/login", data={"username": "cliente", "password": "mal"}).status_code for _ in range(3)]
+    assert respuestas[-1] == 429 and 429 not in respuestas[:2]
+
+
+def test_verificar_y_rehash():
+    actual = contrasenas.generar("clave")
+    assert contrasenas.verificar(actual, "clave") and not contrasenas.verificar(actual, "otra")
+    assert contrasenas.verificar(None, "clave") is False
+    assert not contrasenas.necesita_rehash(actual)
+    assert contrasenas.necesita_rehash(generate_password_hash("clave", "pbkdf2:sha256:1000"))
+
+
+def test_pool_lleno_es_saturado(monkeypatch):
+    monkeypatch.setattr(contrasenas, "MAX_EN_COLA", 0)
+    liberar = threading.Event()
+    ocupados = [threading.Thread(target=contrasenas._ejecutar, args=(liberar.wait,)) for _ in range(contrasenas.HILOS)]
+    for h in ocupados: h.start()
+    try:
+        while contrasenas.en_uso() < contrasenas.HILOS: pass
+        with pytest.raises(contrasenas.Saturado): contrasenas._ejecutar(lambda: None)
+    finally:
+        liberar.set()
+        for h in ocupados: h.join()
+    assert contrasenas.en_uso() == 0
+
+
+def test_timeout_es_saturado(monkeypatch):
+    monkeypatch.setattr(contrasenas, "TIMEOUT", 0.05)
+    liberar = threading.Event()
+    with pytest.raises(contrasenas.Saturado): contrasenas._ejecutar(liberar.wait)
+    liberar.set()
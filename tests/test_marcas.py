@@ -0,0 +1,115 @@
+# Marcas de tiempo enteras (segundos unix) al lado de las fechas en texto:
+# se completan solas (trigger y relleno en lotes), los filtros usan sus
+# índices y lo que se muestra sale de ellas en hora local.
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+import archivo
+import cancelaciones
+import conexion
+import exportar
+import repositorio
+from conftest import producto, usuario_id, venta
+
+
+def marca_local(texto):
+    return int(datetime.strptime(texto, "%Y-%m-%d %H:%M:%S").timestamp())
+
+
+def marca_utc(texto):
+    return int(datetime.strptime(texto, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp())
+
+
+def plan(conn, nombre, params):
+    return " ".join(f[3] for f in conn.execute("EXPLAIN QUERY PLAN " + repositorio.CONSULTAS[nombre], params))
+
+
+def test_un_insert_solo_con_texto_deja_la_marca(conn):
+    pid = producto(conn)
+    vid = venta(conn, "cliente", {pid: 1}, fecha="2025-01-15 12:00:00")
+    assert conn.execute("SELECT fecha_ts FROM ventas WHERE id = ?", (vid,)).fetchone()[0] == marca_local("2025-01-15 12:00:00")
+
+
+def test_relleno_en_lotes(conn):
+    pid = producto(conn)
+    ventas = [venta(conn, "cliente", {pid: 1}, fecha=f"2024-06-{d:02d} 09:30:00") for d in range(1, 6)]
+    conn.execute("UPDATE ventas SET fecha = 'sin fecha' WHERE id = ?", (ventas[0],))
+    conn.execute("UPDATE ventas SET fecha_ts = NULL")
+    cambio = conn.execute("INSERT INTO cambios_stock (producto_id, vendedor_id, stock_anterior, stock_nuevo, estado, "
+                          "fecha_solicitud, fecha_autorizacion) VALUES (?, ?, 1, 2, 'autorizado', ?, ?)",
+                          (pid, usuario_id(conn, "vendedor"), "2024-06-01 08:00:00", "2024-06-02 08:00:00")).lastrowid
+    conn.execute("UPDATE cambios_stock SET solicitud_ts = NULL WHERE id = ?", (cambio,))
+    conn.commit()
+    # Un texto que no se puede leer se saltea, no traba el relleno
+    assert conexion.rellenar_marcas(conn, lote=2) == len(ventas) - 1 + 2
+    marcas = dict(conn.execute("SELECT id, fecha_ts FROM ventas WHERE id IN (%s)" % ",".join("?" * len(ventas)), ventas))
+    assert marcas[ventas[0]] is None
+    assert [marcas[v] for v in ventas[1:]] == [marca_local(f"2024-06-{d:02d} 09:30:00") for d in range(2, 6)]
+    # Las fechas de cambios_stock se guardaban con datetime('now'): en UTC
+    fila = conn.execute("SELECT solicitud_ts, autorizacion_ts FROM cambios_stock WHERE id = ?", (cambio,)).fetchone()
+    assert tuple(fila) == (marca_utc("2024-06-01 08:00:00"), marca_utc("2024-06-02 08:00:00"))
+    assert conexion.rellenar_marcas(conn) == 0
+
+
+def test_escrituras_con_marca_y_fechas_en_hora_local(db_path):
+    rc = repositorio.conectar(db_path)
+    cliente, pid = usuario_id(rc, "cliente"), producto(rc)
+    antes = int(time.time())
+    cambio = repositorio.ejecutar(rc, "insertar_cambio_stock", (pid, usuario_id(rc, "vendedor"), 1, 2, 1.0, 1.0, 0, "Reposición", 0)).lastrowid
+    rc.commit()
+    solicitud_ts, texto = rc.execute("SELECT solicitud_ts, fecha_solicitud FROM cambios_stock WHERE id = ?", (cambio,)).fetchone()
+    assert antes <= solicitud_ts <= time.time() and solicitud_ts == marca_utc(texto)
+    pendiente = next(f for f in repositorio.todos(rc, "cambios_pendientes") if f.id == cambio)
+    assert pendiente.fecha_solicitud == datetime.fromtimestamp(solicitud_ts).strftime("%Y-%m-%d %H:%M:%S")
+    vid = venta(rc, "cliente", {pid: 1}, fecha="2025-03-01 18:45:00")
+    compra = next(f for f in repositorio.todos(rc, "ventas_de_cliente", (cliente,)) if f.id == vid)
+    assert compra.fecha == "2025-03-01 18:45:00"
+    rc.cerrar()
+
+
+def test_filtros_por_marca_con_indice(conn):
+    inicio, fin = exportar.rango_fechas("2025-01-01", "2025-01-31")
+    assert "idx_ventas_fecha_ts" in plan(conn, "exportar_ventas", (inicio, fin))
+    assert "idx_cambios_solicitud_ts" in plan(conn, "exportar_cambios_stock", (inicio, fin))
+    assert "idx_ventas_cancelables_ts" in plan(conn, "marcar_no_cancelables", (inicio, 10))
+    assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name IN ('idx_ventas_fecha', 'idx_ventas_cancelables')").fetchall()
+
+
+def test_la_ventana_de_cancelacion_usa_la_marca(conn):
+    pid = producto(conn, stock=10)
+    reciente, vieja = venta(conn, "cliente", {pid: 1}), venta(conn, "cliente", {pid: 1})
+    # El texto dice lo mismo en las dos; manda la marca
+    conn.execute("UPDATE ventas SET fecha_ts = ? WHERE id = ?", (int(time.time()), reciente))
+    conn.execute("UPDATE ventas SET fecha_ts = ? WHERE id = ?", (int(time.time()) - 11 * 60, vieja))
+    conn.commit()
+    limite = cancelaciones.limite_cancelacion(conn)
+    assert cancelaciones.cancelar_ventas(conn, [reciente, vieja], limite=limite) == [reciente]
+    conn.commit()
+    cancelaciones.barrer_vencidas(conn)
+    assert conn.execute("SELECT cancelable FROM ventas WHERE id = ?", (vieja,)).fetchone()[0] == 0
+
+
+def test_meses_archivados_sin_marcas_se_migran(db_path, conn):
+    pid = producto(conn)
+    vid = venta(conn, "cliente", {pid: 2}, fecha="2023-05-10 10:00:00")
+    conn.execute("UPDATE ventas SET cancelable = 0 WHERE id = ?", (vid,))
+    conn.commit()
+    assert archivo.archivar(db_path, dias=30)["ventas"] == 1
+    # Un mes archivado antes de la migración: sin la marca
+    mayo = sqlite3.connect(archivo.ruta_mes("2023-05"))
+    mayo.execute("UPDATE ventas SET fecha_ts = NULL")
+    mayo.commit()
+    mayo.close()
+    inicio, fin = exportar.rango_fechas("2023-05-01", "2023-05-31")
+
+    def contar():
+        lector = sqlite3.connect(db_path)
+        try:
+            with archivo.con_archivo(lector, inicio, fin):
+                return lector.execute("SELECT COUNT(*) FROM ventas WHERE fecha_ts >= ? AND fecha_ts < ?", (inicio, fin)).fetchone()[0]
+        finally:
+            lector.close()
+    assert contar() == 0
+    assert archivo.migrar(db_path) == 1
+    assert contar() == 1
@@ -0,0 +1,84 @@
+# Libro de movimientos: cada cambio de productos.stock (venta, cancelación,
+# aprobación, alta) queda anotado, el libro cuadra con el stock y el stock a
+# una fecha es el mismo con snapshots o recorriendo el libro.
+import sqlite3
+import time
+
+import pytest
+
+import cancelaciones
+import movimientos
+import repositorio
+from conftest import producto, stock, usuario_id, venta
+
+
+def marca():
+    """Segundo actual; espera a que pase, así lo que se escriba después queda estrictamente más tarde."""
+    ahora = int(time.time())
+    while int(time.time()) == ahora: time.sleep(0.02)
+    return ahora
+
+
+def test_el_libro_cuadra_con_el_stock(db_path, conn):
+    import app
+    pid = producto(conn, stock=10)
+    vid = venta(conn, "cliente", {pid: 3})
+    venta(conn, "cliente", {pid: 2})
+    cancelaciones.cancelar_ventas(conn, [vid])
+    conn.execute("INSERT INTO productos (nombre, precio, stock, activo) VALUES ('Prueba', 10, 7, 1)")
+    conn.commit()
+    p = conn.execute("SELECT stock, precio, version FROM productos WHERE id = ?", (pid,)).fetchone()
+    rc = repositorio.conectar(db_path)
+    cambio_id = repositorio.ejecutar(rc, "insertar_cambio_stock", (pid, usuario_id(conn, "vendedor"), p["stock"], 20,
+                                                                 p["precio"], p["precio"], 0, "Reposición", p["version"])).lastrowid
+    assert app.aplicar_cambios_lote(rc, [cambio_id], "autorizar", usuario_id(conn, "admin"))["autorizados"] == 1
+    rc.commit()
+    rc.cerrar()
+    assert movimientos.verificar(conn, completa=True) == []
+    tipos = [f[0] for f in conn.execute("SELECT tipo FROM movimientos_stock WHERE producto_id = ? ORDER BY id DESC LIMIT 5", (pid,))]
+    assert tipos == ["cambio"] * 5
+    assert conn.execute("SELECT SUM(delta) FROM movimientos_stock WHERE producto_id = ?", (pid,)).fetchone()[0] == stock(conn, pid) == 20
+
+
+def test_el_libro_es_solo_de_agregado(conn):
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("UPDATE movimientos_stock SET delta = delta + 1")
+
+
+def test_verificar_detecta_diferencias(conn):
+    pid = producto(conn)
+    conn.execute("DROP TRIGGER trg_movimiento_stock_update")
+    conn.execute("UPDATE productos SET stock = stock + 5 WHERE id = ?", (pid,))
+    assert [d["producto_id"] for d in movimientos.verificar(conn)] == [pid]
+
+
+@pytest.mark.parametrize("snapshots", [False, True])
+def test_stock_a_una_fecha(conn, snapshots):
+    pid = producto(conn, stock=10)
+    antes = marca()
+    vid = venta(conn, "cliente", {pid: 4})
+    if snapshots: movimientos.tomar_snapshots(conn); conn.commit()
+    despues_venta = marca()
+    cancelaciones.cancelar_ventas(conn, [vid])
+    venta(conn, "cliente", {pid: 1})
+    conn.commit()
+    if snapshots: movimientos.tomar_snapshots(conn); conn.commit()
+    assert movimientos.stock_en(conn, pid, antes) == 10
+    assert movimientos.stock_en(conn, pid, despues_venta) == 6
+    assert movimientos.stock_en(conn, pid, int(time.time())) == stock(conn, pid) == 9
+    assert dict((p, s) for p, _, s in movimientos.stock_en_todos(conn, despues_venta))[pid] == 6
+    assert movimientos.stock_en(conn, pid, "2000-01-01") is None
+    assert movimientos.verificar(conn, completa=True) == []
+
+
+def test_api_historico(app, conn):
+    pid = producto(conn, stock=10)
+    conn.commit()
+    c = app.test_client()
+    c.post("/login", data={"username": "admin", "password": "admin"})
+    # Sin ?fecha= toma el momento actual, con precisión de segundos
+    assert c.get(f"/api/stock/historico?producto_id={pid}").get_json()["stock"] == 10
+    r = c.get("/api/stock/historico?producto_id=abc")
+    assert r.status_code == 400 and r.get_json()["error"] == "producto_id inválido"
+    assert c.get("/api/stock/historico?fecha=ayer").status_code == 400
+    assert c.get("/api/stock/verificar").get_json()["consistente"]
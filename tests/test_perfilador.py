@@ -0,0 +1,74 @@
+# Perfilado por muestreo: pilas colapsadas por request, a pedido o al azar.
+import re
+import time
+
+import pytest
+
+import perfilador
+import tiendas
+
+
+@pytest.fixture
+def directorio(tmp_path, monkeypatch):
+    """Los perfiles de la tienda principal, en tmp_path/perfiles."""
+    monkeypatch.setattr(tiendas, "DIR_APP", str(tmp_path))
+    return tmp_path / "perfiles"
+
+
+def trabajo_lento():
+    fin = time.perf_counter() + 0.05
+    while time.perf_counter() < fin: pass
+
+
+def test_perfil_guarda_pilas_colapsadas(directorio):
+    perfil = perfilador.Perfil("/panel dueño", "dueno").iniciar()
+    trabajo_lento()
+    nombre = perfil.terminar()
+    lineas = (directorio / nombre).read_text(encoding="utf-8").splitlines()
+    assert lineas and all(l.rsplit(" ", 1)[1].isdigit() for l in lineas)
+    assert any("trabajo_lento (test_perfilador.py:" in l for l in lineas)
+    [info] = perfilador.listar()
+    assert (info["nombre"], info["ruta"], info["origen"]) == (nombre, "panel_dueño", "dueno")
+    assert info["ms"] >= 50
+
+
+def test_muestreo_respeta_los_cupos(directorio):
+    assert perfilador.muestrear("/", 0) is None
+    perfiles = [perfilador.muestrear("/", 1) for _ in range(perfilador.MAX_SIMULTANEOS + 1)]
+    assert perfiles[-1] is None and all(p is not None for p in perfiles[:-1])
+    for p in perfiles[:-1]: p.iniciar().terminar()
+    # Al terminar se liberan los cupos
+    otro = perfilador.muestrear("/", 1)
+    assert otro is not None
+    otro.iniciar().terminar()
+
+
+def test_poda_los_mas_viejos(directorio, monkeypatch):
+    monkeypatch.setattr(perfilador, "MAX_PERFILES", 3)
+    for _ in range(5): perfilador.Perfil("/", "dueno").iniciar().terminar()
+    assert len(perfilador.listar()) == 3
+
+
+def test_nombres_validos():
+    assert perfilador.nombre_valido("20250101-120000_index_3ms_dueno_1-0.txt")
+    assert not perfilador.nombre_valido("../app.py")
+    assert not perfilador.nombre_valido("a/b.txt")
+
+
+def test_rutas(app, directorio):
+    c = app.test_client()
+    c.get("/?perfilar=1")  # sin sesión de dueño no perfila
+    assert perfilador.listar() == []
+    c.post("/login", data={"username": "admin", "password": "admin"})
+    c.get("/panel_dueno?perfilar=1")
+    assert [p["origen"] for p in perfilador.listar()] == ["dueno"]
+
+    token = re.search(r"X-Perfilar: ([\w.-]+)", c.get("/perfiles").get_data(as_text=True)).group(1)
+    anonimo = app.test_client()
+    anonimo.get("/", headers={"X-Perfilar": token})
+    anonimo.get("/", headers={"X-Perfilar": "falso"})
+    assert sorted(p["origen"] for p in perfilador.listar()) == ["dueno", "header"]
+
+    nombre = perfilador.listar()[0]["nombre"]
+    assert c.get(f"/perfiles/{nombre}").status_code == 200
+    assert c.get("/perfiles/..%2Fapp.py").status_code == 404
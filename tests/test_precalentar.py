@@ -0,0 +1,41 @@
+# Fase de arranque: bytecode de templates en disco, autochequeo y caches primados.
+import os
+
+from flask import Flask
+
+import app as modulo
+import cache
+import fragmentos
+import precalentar
+from conftest import usuario_id
+
+
+def test_todos_los_templates_renderizan(db_path):
+    errores = [(nombre, error) for nombre, ok, _, error in precalentar.autoverificar(modulo.app) if not ok]
+    assert errores == []
+
+
+def test_bytecode_en_disco(tmp_path):
+    app = Flask("prueba", root_path=os.path.dirname(modulo.__file__))
+    app.jinja_env.add_extension(fragmentos.FragmentoCache)  # los templates usan {% cache %}
+    precalentar.configurar_bytecode(app, str(tmp_path))
+    cantidad, _ = precalentar.compilar_templates(app)
+    assert cantidad > 0 and len(os.listdir(tmp_path)) == cantidad
+
+
+def test_usuarios_primados(db_path, conn):
+    modulo.primar_usuarios()
+    vendedor = usuario_id(conn, "vendedor")
+    conn.execute("UPDATE usuarios SET username = 'otro' WHERE id = ?", (vendedor,))
+    conn.commit()
+    assert modulo.load_user(vendedor).username == "vendedor"  # servido desde el cache
+    cache.invalidar("usuarios")
+    assert modulo.load_user(vendedor).username == "otro"
+
+
+def test_metricas_de_arranque(db_path, monkeypatch):
+    monkeypatch.setenv("FLASK_ENV", "development")
+    monkeypatch.setattr(modulo, "_inicializada", False)
+    modulo.crear_app()
+    datos = modulo.app.test_client().get("/api/debug/arranque").get_json()
+    assert datos["arranque_ms"] > 0 and datos["errores_templates"] == []
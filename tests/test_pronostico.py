@@ -0,0 +1,81 @@
+# Pronóstico de reposición: la cuenta con NumPy y la de Python puro dan lo mismo,
+# y las ventas nuevas entran en la matriz en memoria sin rehacerla.
+import random
+import time
+
+import pytest
+
+import pronostico
+import subsistemas
+from conftest import usuario_id
+
+
+@pytest.fixture(autouse=True)
+def sin_estado():
+    pronostico._estados.clear()
+    yield
+    pronostico._estados.clear()
+
+
+def productos_del_vendedor(conn):
+    return [f[0] for f in conn.execute("SELECT id FROM productos WHERE vendedor_id = ? AND activo = 1 ORDER BY id",
+                                       (usuario_id(conn, "vendedor"),))]
+
+
+def vender(conn, pid, cantidad, dias_atras=0):
+    fecha = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time() - dias_atras * 86400))
+    venta_id = conn.execute("INSERT INTO ventas (usuario_id, total, fecha, estado) VALUES (?, 0, ?, 'completada')",
+                            (usuario_id(conn, "cliente"), fecha)).lastrowid
+    conn.execute("INSERT INTO venta_items (venta_id, producto_id, cantidad, precio_unitario) VALUES (?, ?, ?, 1)",
+                 (venta_id, pid, cantidad))
+
+
+def test_numpy_y_python_puro_coinciden(conn, monkeypatch):
+    if subsistemas.numpy() is None: pytest.skip("NumPy no está instalado")
+    pids = productos_del_vendedor(conn)
+    azar = random.Random(3)
+    for dias_atras in range(40):
+        for _ in range(azar.randint(0, 6)): vender(conn, azar.choice(pids), azar.randint(1, 9), dias_atras)
+    conn.commit()
+    vendedor = usuario_id(conn, "vendedor")
+    con_numpy = pronostico.pronosticar(conn, vendedor)
+    pronostico._estados.clear()
+    monkeypatch.setattr(subsistemas, "numpy", lambda: None)
+    assert pronostico.pronosticar(conn, vendedor) == con_numpy
+    assert len(con_numpy) == len(pids)
+
+
+def test_ventas_nuevas_se_suman(conn, monkeypatch):
+    monkeypatch.setattr(subsistemas, "numpy", lambda: None)
+    pid = productos_del_vendedor(conn)[0]
+    conn.execute("UPDATE productos SET stock = 10 WHERE id = ?", (pid,))
+    vendedor = usuario_id(conn, "vendedor")
+    assert pronostico.pronosticar(conn, vendedor)[pid] == {"promedio_corto": 0, "promedio_largo": 0, "velocidad": 0,
+                                                           "dias_cobertura": None, "sugerido": 0}
+    vender(conn, pid, 28)
+    conn.commit()
+    fila = pronostico.pronosticar(conn, vendedor)[pid]
+    assert (fila["promedio_corto"], fila["promedio_largo"]) == (4, 1)
+    assert fila["velocidad"] == 3.1                   # 0.7 * 4 + 0.3 * 1
+    assert fila["dias_cobertura"] == 3.2              # 10 / 3.1
+    assert fila["sugerido"] == 34                     # ceil(3.1 * 14 - 10)
+
+
+def test_matrices_acotadas_por_lru(conn, monkeypatch):
+    monkeypatch.setattr(pronostico, "MAX_VENDEDORES", 2)
+    vendedor = usuario_id(conn, "vendedor")
+    for otro in (-1, vendedor, -2):
+        pronostico.pronosticar(conn, otro)
+    assert list(pronostico._estados) == [("principal", vendedor), ("principal", -2)]
+    pronostico.pronosticar(conn, vendedor)  # usarlo lo pasa al final
+    pronostico.pronosticar(conn, -3)
+    assert list(pronostico._estados) == [("principal", vendedor), ("principal", -3)]
+
+
+def test_panel_y_api(app, conn):
+    c = app.test_client()
+    c.post("/login", data={"username": "vendedor", "password": "vendedor"})
+    datos = c.get("/api/pronostico").get_json()
+    assert datos["dias_objetivo"] == pronostico.DIAS_OBJETIVO
+    assert sorted(int(p) for p in datos["productos"]) == productos_del_vendedor(conn)
+    assert c.get("/vendedor").status_code == 200
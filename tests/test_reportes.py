@@ -0,0 +1,52 @@
+# Reportes de ventas por rango: agregación en SQL y memo por versión de "ventas".
+import pytest
+
+import cache
+import reportes
+from conftest import venta
+
+
+@pytest.fixture
+def ventas(conn):
+    frutas, verduras = [conn.execute("SELECT id FROM productos WHERE categoria = ? ORDER BY id LIMIT 1", (c,)).fetchone()[0]
+                        for c in ("Frutas", "Verduras")]
+    venta(conn, "cliente", {frutas: 4}, fecha="2025-01-10 09:00:00")
+    venta(conn, "cliente", {frutas: 1, verduras: 3}, fecha="2025-01-10 18:00:00")
+    venta(conn, "cliente", {verduras: 1}, fecha="2025-02-03 12:00:00")
+    cancelada = venta(conn, "cliente", {frutas: 5}, fecha="2025-01-11 12:00:00")
+    conn.execute("UPDATE ventas SET estado = 'cancelada' WHERE id = ?", (cancelada,))
+    conn.commit()
+    return conn
+
+
+def test_serie_por_dia(ventas):
+    datos = reportes.serie_ventas(ventas, "2025-01-01", "2025-02-28")
+    assert [(p["periodo"], p["ventas"], p["ingresos"], p["unidades"], p["ticket_promedio"], p["ingresos_acumulados"])
+            for p in datos["periodos"]] == [
+        ("2025-01-10", 2, 800.0, 8, 400.0, 800.0),
+        ("2025-02-03", 1, 100.0, 1, 100.0, 900.0),
+    ]
+    assert datos["totales"] == {"ventas": 3, "ingresos": 900.0, "unidades": 9}
+
+
+def test_serie_por_mes_y_rango(ventas):
+    assert [p["periodo"] for p in reportes.serie_ventas(ventas, agrupar="mes")["periodos"]] == ["2025-01", "2025-02"]
+    assert reportes.serie_ventas(ventas, "2025-02-01", "2025-02-03")["totales"]["ventas"] == 1
+    with pytest.raises(ValueError): reportes.serie_ventas(ventas, agrupar="anio")
+
+
+def test_desglose_por_categoria(ventas):
+    filas = reportes.desglose_ventas(ventas, "2025-01-01", "2025-01-31")["filas"]
+    assert [(f["clave"], f["unidades"], f["ingresos"], f["porcentaje"], f["ranking"]) for f in filas] == [
+        ("Frutas", 5, 500.0, 62.5, 1),
+        ("Verduras", 3, 300.0, 37.5, 2),
+    ]
+
+
+def test_memo_hasta_que_cambian_las_ventas(ventas):
+    antes = reportes.serie_ventas(ventas)["totales"]["ventas"]
+    pid = ventas.execute("SELECT id FROM productos ORDER BY id LIMIT 1").fetchone()[0]
+    venta(ventas, "cliente", {pid: 1}, fecha="2025-03-01 10:00:00")
+    assert reportes.serie_ventas(ventas)["totales"]["ventas"] == antes
+    cache.invalidar("ventas")
+    assert reportes.serie_ventas(ventas)["totales"]["ventas"] == antes + 1
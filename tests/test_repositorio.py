@@ -0,0 +1,58 @@
+# Consultas con nombre, filas livianas y conexiones reutilizadas.
+import ast
+import inspect
+import re
+
+import exportar
+import repositorio
+from conftest import producto, venta
+
+
+def test_filas_por_nombre_y_posicion(conn):
+    pid = producto(conn, stock=7)
+    fila = next(f for f in repositorio.todos(conn, "catalogo") if f.id == pid)
+    assert fila["stock"] == fila.stock == fila[fila.keys().index("stock")] == 7
+    assert dict(fila._asdict())["id"] == pid
+    assert repositorio.uno(conn, "items_de_venta", (-1,)) is None
+    assert repositorio.valor(conn, "umbral_global") == 10
+
+
+def test_conexion_vuelve_al_pool(db_path):
+    primera = repositorio.conectar(db_path)
+    repositorio.ejecutar(primera, "cambiar_umbral_global", (99,))
+    primera.close()
+    segunda = repositorio.conectar(db_path)
+    try:
+        assert segunda is primera
+        # close() descarta lo no confirmado antes de devolverla
+        assert repositorio.valor(segunda, "umbral_global") == 10
+    finally:
+        segunda.cerrar()
+
+
+def test_bloques_y_estadisticas(db_path, conn):
+    pid = producto(conn)
+    for _ in range(5): venta(conn, "cliente", {pid: 1})
+    antes = repositorio.estadisticas().get("exportar_ventas", {}).get("llamadas", 0)
+    tamanos = [len(b) for b in repositorio.bloques(conn, "exportar_ventas", exportar.rango_fechas("2025-01-01", "2025-01-31"), 2)]
+    assert tamanos == [2, 2, 1]
+    assert repositorio.estadisticas()["exportar_ventas"]["llamadas"] == antes + 1
+
+
+def test_cancelar_con_json_each_no_depende_de_la_cantidad(conn):
+    pid = producto(conn, stock=10)
+    ids = [venta(conn, "cliente", {pid: 1}) for _ in range(3)]
+    canceladas = repositorio.todos(conn, "cancelar_ventas", {"ids": str(ids + [999999]), "usuario_id": None, "limite": None})
+    assert sorted(f.id for f in canceladas) == ids
+
+
+def test_modulos_sin_sql_propio():
+    import alertas, cancelaciones, exportar, movimientos, pronostico, reportes, reservas
+    for modulo in (alertas, cancelaciones, exportar, movimientos, pronostico, reportes, reservas):
+        assert not re.search(r"\b(SELECT|UPDATE|INSERT|DELETE)\b", inspect.getsource(modulo)), modulo.__name__
+    # Un dict literal descarta en silencio las claves repetidas
+    arbol = ast.parse(inspect.getsource(repositorio))
+    dic = next(n.value for n in ast.walk(arbol) if isinstance(n, ast.Assign)
+               and getattr(n.targets[0], "id", None) == "CONSULTAS")
+    claves = [k.value for k in dic.keys]
+    assert len(claves) == len(set(claves))
@@ -0,0 +1,88 @@
+# Reservas de stock: reservar es una sola sentencia, así carritos simultáneos
+# nunca apartan más que el stock, y convertir nunca deja stock negativo.
+import re
+import sqlite3
+import threading
+
+import pytest
+
+import reservas
+from conftest import producto, stock
+
+
+def reservado(conn, pid):
+    return conn.execute("SELECT COALESCE(SUM(cantidad), 0) FROM reservas WHERE producto_id = ?", (pid,)).fetchone()[0]
+
+
+def test_reservar_respeta_lo_apartado_por_otros(conn):
+    pid = producto(conn, stock=5)
+    assert reservas.reservar(conn, "a", pid, 3)
+    assert not reservas.reservar(conn, "b", pid, 3)
+    assert reservas.reservar(conn, "b", pid, 2)
+    assert reservas.disponible(conn, pid, "c") == 0
+    assert reservas.disponible(conn, pid, "a") == 3  # lo propio no cuenta
+    assert reservas.reservar(conn, "a", pid, 1)  # fija la cantidad, no suma
+    assert reservado(conn, pid) == 3
+
+
+def test_carritos_simultaneos_no_sobre_reservan(db_path, conn):
+    pid = producto(conn, stock=10)
+    hilos_n = 8
+    barrera = threading.Barrier(hilos_n)
+    aceptadas = []
+
+    def carrito(n):
+        c = sqlite3.connect(db_path, timeout=10)
+        barrera.wait()
+        if reservas.reservar(c, f"sesion-{n}", pid, 3): aceptadas.append(n)
+        c.commit()
+        c.close()
+
+    hilos = [threading.Thread(target=carrito, args=(n,)) for n in range(hilos_n)]
+    for h in hilos: h.start()
+    for h in hilos: h.join(timeout=30)
+    assert len(aceptadas) == 3
+    assert reservado(conn, pid) == 9 <= stock(conn, pid)
+
+
+def test_convertir_descuenta_y_libera(conn):
+    pid = producto(conn, stock=5)
+    assert reservas.reservar(conn, "a", pid, 2)
+    reservas.convertir(conn, "a", {str(pid): {"cantidad": 2}})
+    conn.commit()
+    assert stock(conn, pid) == 3
+    assert reservado(conn, pid) == 0
+
+
+def test_convertir_sin_stock_no_deja_negativo(conn):
+    pid = producto(conn, stock=4)
+    assert reservas.reservar(conn, "a", pid, 3)
+    conn.execute("UPDATE reservas SET expira_en = 0 WHERE sesion = 'a'")  # venció
+    assert reservas.reservar(conn, "b", pid, 3)
+    conn.commit()
+    with pytest.raises(reservas.SinStock) as error:
+        reservas.convertir(conn, "a", {pid: {"cantidad": 3}})
+    conn.rollback()
+    assert error.value.disponible == 1
+    assert stock(conn, pid) == 4
+
+
+def test_barrido_borra_solo_las_vencidas(conn):
+    pid = producto(conn, stock=5)
+    reservas.reservar(conn, "a", pid, 1)
+    reservas.reservar(conn, "b", pid, 1)
+    conn.execute("UPDATE reservas SET expira_en = 0 WHERE sesion = 'a'")
+    conn.commit()
+    assert reservas.barrer_vencidas(conn) == 1
+    assert [f[0] for f in conn.execute("SELECT sesion FROM reservas")] == ["b"]
+
+
+def test_tarjeta_del_catalogo_muestra_lo_disponible(app, conn):
+    pid = producto(conn, stock=5)
+    otro = app.test_client()
+    assert otro.post("/api/carrito/agregar", json={"producto_id": pid, "cantidad": 3}).get_json()["success"]
+    assert reservas.reservado_por_producto(conn) == {pid: 3}
+    html = app.test_client().get("/").get_data(as_text=True)
+    assert re.search(rf'stock-{pid} [^>]*>\s*📦 2 un\.', html)
+    otro.post("/api/carrito/agregar", json={"producto_id": pid, "cantidad": 2})
+    assert "Sin Stock" in app.test_client().get("/").get_data(as_text=True)
@@ -0,0 +1,60 @@
+# Panel del vendedor: una consulta, cache por vendedor con la huella de sus
+# productos y solicitudes (lo de otros vendedores no lo invalida).
+import cache
+import repositorio
+import tablero
+from conftest import producto, usuario_id, venta
+
+
+def otro_vendedor(conn):
+    """Un segundo vendedor con un producto propio. Devuelve el id del producto."""
+    vid = conn.execute("INSERT INTO usuarios (username, password, rol_id) SELECT 'otro', 'x', rol_id FROM usuarios "
+                       "WHERE username = 'vendedor'").lastrowid
+    pid = conn.execute("INSERT INTO productos (nombre, precio, stock, categoria, vendedor_id, activo) "
+                       "VALUES ('Ajeno', 10, 50, 'General', ?, 1)", (vid,)).lastrowid
+    conn.commit()
+    return pid
+
+
+def consultas():
+    return repositorio.estadisticas().get("tablero_vendedor", {}).get("llamadas", 0)
+
+
+def test_listas_del_panel(conn):
+    vendedor = usuario_id(conn, "vendedor")
+    pid = producto(conn, stock=1)
+    conn.execute("INSERT INTO cambios_stock (producto_id, vendedor_id, stock_anterior, stock_nuevo, estado) "
+                 "VALUES (?, ?, 1, 30, 'pendiente')", (pid, vendedor))
+    conn.commit()
+    d = tablero.datos(conn, vendedor)
+    assert pid in [p["id"] for p in d["productos"]]
+    assert pid in [a["producto_id"] for a in d["productos_bajo"]]
+    assert [(c["producto_id"], c["stock_nuevo"]) for c in d["cambios_pendientes"]] == [(pid, 30)]
+    pag = tablero.pagina(conn, vendedor, numero=2, por_pagina=1)
+    assert pag["pagina"] == 2 and len(pag["productos"]) == 1 and pag["total_productos"] == len(d["productos"])
+
+
+def test_cambios_de_otro_vendedor_no_invalidan(conn):
+    vendedor = usuario_id(conn, "vendedor")
+    ajeno = otro_vendedor(conn)
+    tablero.datos(conn, vendedor)
+    antes = consultas()
+    venta(conn, "cliente", {ajeno: 3})
+    cache.invalidar("catalogo")
+    tablero.datos(conn, vendedor)
+    assert consultas() == antes
+
+
+def test_cambios_propios_se_ven(conn):
+    vendedor = usuario_id(conn, "vendedor")
+    pid = producto(conn, stock=40)
+    assert next(p for p in tablero.datos(conn, vendedor)["productos"] if p["id"] == pid)["stock"] == 40
+    venta(conn, "cliente", {pid: 5})
+    assert next(p for p in tablero.datos(conn, vendedor)["productos"] if p["id"] == pid)["stock"] == 35
+    cambio = conn.execute("INSERT INTO cambios_stock (producto_id, vendedor_id, stock_anterior, stock_nuevo, estado) "
+                          "VALUES (?, ?, 35, 60, 'pendiente')", (pid, vendedor)).lastrowid
+    conn.commit()
+    assert [c["id"] for c in tablero.datos(conn, vendedor)["cambios_pendientes"]] == [cambio]
+    conn.execute("UPDATE cambios_stock SET estado = 'rechazado' WHERE id = ?", (cambio,))
+    conn.commit()
+    assert tablero.datos(conn, vendedor)["cambios_pendientes"] == []
@@ -0,0 +1,21 @@
+# Tareas periódicas en hilos de fondo.
+import threading
+
+import tareas
+
+
+def test_tarea_corre_y_registra_errores():
+    corridas = threading.Semaphore(0)
+
+    def funcion():
+        corridas.release()
+        raise RuntimeError("falló")
+
+    tarea = tareas.iniciar("prueba", 0.01, funcion)
+    try:
+        assert corridas.acquire(timeout=5) and corridas.acquire(timeout=5)
+    finally:
+        tarea.detener()
+        tarea.join(timeout=5)
+    assert not tarea.is_alive()
+    assert tareas.estado()["prueba"]["ultimo_error"] == "falló"
@@ -0,0 +1,69 @@
+# Varias tiendas en la misma app: cada pedido se resuelve a una tienda por el
+# host o por el prefijo /t/<clave>/, y lee y escribe solo su propia base.
+import os
+import sqlite3
+
+import pytest
+
+import conexion
+import tiendas
+
+
+@pytest.fixture
+def norte(db_path):
+    tiendas.configurar({"norte": {"hosts": ["norte.verduleria.com"]}})
+    tiendas.sembrar(["norte"])
+    return tiendas.ruta(clave="norte")
+
+
+def umbral(db_path):
+    conn = sqlite3.connect(db_path)
+    try: return conn.execute("SELECT limite_stock_alerta FROM config_empresa").fetchone()[0]
+    finally: conn.close()
+
+
+def entrar(cliente, prefijo=""):
+    return cliente.post(f"{prefijo}/login", data={"username": "admin", "password": "admin"})
+
+
+def test_rutas_absolutas_para_la_principal(tmp_path, monkeypatch):
+    monkeypatch.setattr(conexion, "DB_PATH", "inventario.db")
+    monkeypatch.chdir(tmp_path)
+    assert tiendas.ruta() == os.path.join(tiendas.DIR_APP, "inventario.db") and os.path.isabs(tiendas.ruta())
+    assert tiendas.ruta("analitica.db") == os.path.join(tiendas.DIR_APP, "analitica.db")
+    assert tiendas.ruta(clave="norte") == os.path.join(tiendas.DIRECTORIO, "norte", "inventario.db")
+
+
+def test_resolver_por_host_y_prefijo(norte):
+    assert tiendas.resolver("norte.verduleria.com:8000", "/") == ("norte", "")
+    assert tiendas.resolver("localhost", "/t/norte/login") == ("norte", "/t/norte")
+    assert tiendas.resolver("localhost", "/t/nada/login") == (None, "/t/nada")
+    assert tiendas.resolver("localhost", "/tienda") == (tiendas.PRINCIPAL, "")
+
+
+def test_tienda_inexistente_responde_404(app):
+    assert app.test_client().get("/t/nada/login").status_code == 404
+
+
+def test_cada_tienda_escribe_en_su_base(app, db_path, norte):
+    c = app.test_client()
+    entrar(c, "/t/norte")
+    r = c.post("/t/norte/configurar_alertas", data={"limite_stock_alerta": "7"})
+    # url_for arma los links con el prefijo de la tienda
+    assert r.status_code == 302 and r.headers["Location"].endswith("/t/norte/panel_dueno")
+    assert (umbral(norte), umbral(db_path)) == (7, 10)
+    # Por host es la misma tienda
+    c = app.test_client()
+    entrar(c, "http://norte.verduleria.com")
+    c.post("http://norte.verduleria.com/configurar_alertas", data={"limite_stock_alerta": "8"})
+    assert (umbral(norte), umbral(db_path)) == (8, 10)
+
+
+def test_la_sesion_es_de_una_sola_tienda(app, norte):
+    c = app.test_client()
+    entrar(c)
+    assert c.get("/panel_dueno").status_code == 200
+    assert c.get("/t/norte/panel_dueno").status_code == 302
+    # La cookie de la principal, con el nombre de la de norte, tampoco sirve: la firma es por tienda
+    c.set_cookie("session_norte", c.get_cookie("session").value)
+    assert c.get("/t/norte/panel_dueno").status_code == 302